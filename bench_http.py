@@ -0,0 +1,100 @@
+"""HTTP连接复用基准测试
+
+在本地启动一个模拟DeepSeek接口的HTTP服务，分别使用不复用连接的requests.post
+和共享连接池的http_client发送相同的请求，比较每个请求的延迟。
+
+示例：
+    python bench_http.py --requests 200 --concurrency 4
+"""
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import http_client
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """模拟的chat-completions接口，支持HTTP/1.1长连接"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # 避免长连接上响应头和响应体分开发送时触发延迟确认
+    delay = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.delay > 0:
+            time.sleep(self.delay)
+
+        body = json.dumps({
+            "choices": [{"message": {"role": "assistant", "content": "总结内容"}}]
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_requests(send, url, count, concurrency):
+    """发送指定数量的请求，返回每个请求的延迟列表（秒）"""
+    payload = json.dumps({"model": "deepseek-chat", "messages": [{"role": "user", "content": "测试"}]})
+    headers = {"Content-Type": "application/json"}
+
+    def one(_):
+        start = time.perf_counter()
+        response = send(url, headers=headers, data=payload, timeout=10)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(one, range(count)))
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    avg = sum(latencies) / len(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<12} 平均 {avg * 1000:7.2f} ms  p50 {p50 * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms")
+    return avg
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较共享连接池与逐次新建连接的请求延迟")
+    parser.add_argument("--requests", type=int, default=200, help="每种方式发送的请求数")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发请求数")
+    parser.add_argument("--delay", type=float, default=0.0, help="模拟服务的处理延迟（秒）")
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+    http_client.configure(pool_maxsize=args.concurrency)
+
+    # 预热，建立连接池中的连接
+    run_requests(http_client.post, url, args.concurrency, args.concurrency)
+
+    print(f"请求数: {args.requests}，并发数: {args.concurrency}")
+    baseline = report("requests.post", run_requests(requests.post, url, args.requests, args.concurrency))
+    pooled = report("http_client", run_requests(http_client.post, url, args.requests, args.concurrency))
+    print(f"每个请求节省: {(baseline - pooled) * 1000:.2f} ms ({(1 - pooled / baseline) * 100:.1f}%)")
+    print("注意: 本地服务没有TLS握手，访问HTTPS接口时节省的时间会更多")
+
+    http_client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""监控循环压测脚本
+
+使用回放后端在没有微信客户端的环境中运行监控循环，统计轮询次数、
+UI操作次数以及消息捕获率。
+
+示例：
+    python bench_monitor.py --chats 200 --rate 3000 --duration 120 --interval 0
+"""
+import time
+import argparse
+
+from chat_backend import ReplayBackend
+from chat_monitor import WeChatMonitor
+from monitor_service import MonitorLoop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用回放后端压测监控循环")
+    parser.add_argument("--chats", type=int, default=100, help="群聊数量")
+    parser.add_argument("--rate", type=float, default=1000, help="所有群聊合计每分钟消息数")
+    parser.add_argument("--duration", type=int, default=60, help="压测时长（秒）")
+    parser.add_argument("--interval", type=float, default=0, help="监控线程的检测间隔（秒）")
+    parser.add_argument("--ui-latency", type=float, default=0.0, help="每次UI操作的模拟延迟（秒）")
+    parser.add_argument("--switch-latency", type=float, default=0.0, help="切换群聊后界面显示新群聊需要的时间（秒）")
+    parser.add_argument("--window", type=int, default=50, help="聊天窗口中加载的消息条数")
+    parser.add_argument("--skew", type=float, default=0.0, help="群聊活跃度倾斜程度")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--replay", help="使用录制文件代替合成消息流（JSON Lines）")
+    parser.add_argument("--min-interval", type=float, default=2, help="单个群聊的最短检测间隔（秒）")
+    parser.add_argument("--max-interval", type=float, default=120, help="单个群聊的最长检测间隔（秒）")
+    parser.add_argument("--target", type=float, default=10, help="每次检测希望读到的消息数")
+    parser.add_argument("--budget", type=float, default=0, help="每分钟最多检测的次数，为0时按检测间隔计算")
+    parser.add_argument("--search-only", type=int, default=0, help="前N个群聊无法直接打开，只能通过搜索切换")
+    parser.add_argument("--listen", type=int, default=0, help="把前N个群聊（合成消息流中编号越小越活跃）打开为独立聊天窗口并行读取")
+    parser.add_argument("--listen-interval", type=float, default=1.0, help="读取独立聊天窗口的间隔（秒）")
+    parser.add_argument("--no-precheck", action="store_true", help="不读取会话列表，每次都切换到群聊检查")
+    args = parser.parse_args()
+
+    backend_options = {"ui_latency": args.ui_latency, "window_size": args.window,
+                       "switch_latency": args.switch_latency}
+    if args.replay:
+        backend = ReplayBackend.from_file(args.replay, **backend_options)
+    else:
+        backend = ReplayBackend.synthetic(args.chats, args.rate, args.duration,
+                                          seed=args.seed, skew=args.skew, **backend_options)
+
+    chats = sorted(backend.GetSessionList())
+    backend.search_only = set(chats[:args.search_only])
+    monitor = WeChatMonitor(backend=backend)
+
+    captured = {"count": 0}
+
+    def on_message(chat_name, sender, content, timestamp, seq):
+        captured["count"] += 1
+
+    schedule = {
+        "min_interval": args.min_interval,
+        "max_interval": args.max_interval,
+        "target_messages": args.target,
+        "budget_per_minute": args.budget
+    }
+    loop = MonitorLoop(monitor, chats, args.duration, args.interval,
+                       on_message=on_message, on_status=lambda message: None, schedule=schedule,
+                       precheck=not args.no_precheck,
+                       listen_chats=chats[:args.listen], listen_interval=args.listen_interval)
+    loop.debug_mode = False
+
+    start_time = time.time()
+    loop.run()
+    elapsed = time.time() - start_time
+
+    delivered = backend.delivered_count()
+    print(f"群聊数量: {len(chats)}")
+    print(f"运行时间: {elapsed:.1f} 秒")
+    print(f"UI操作次数: {backend.ui_ops} ({backend.ui_ops / elapsed:.1f} 次/秒)")
+    scheduler_stats = loop.scheduler.stats().values()
+    print(f"检测次数: {sum(stats['polls'] for stats in scheduler_stats)}，"
+          f"预检跳过: {sum(stats['skips'] for stats in scheduler_stats)}，读取会话列表: {loop.snapshots}")
+    for method_name, stats in monitor.get_switch_stats().items():
+        if stats["attempts"]:
+            print(f"切换方法 {method_name}: 尝试 {stats['attempts']} 次，成功 {stats['successes']} 次，"
+                  f"平均耗时 {stats['avg_time'] * 1000:.0f} 毫秒")
+    if args.listen:
+        print(f"独立聊天窗口: {args.listen} 个，读取 {loop.listen_reads} 次")
+    print(f"已到达消息: {delivered}")
+    print(f"已捕获消息: {captured['count']}")
+    if delivered:
+        print(f"捕获率: {captured['count'] / delivered * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
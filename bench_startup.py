@@ -0,0 +1,157 @@
+"""启动时间测试脚本
+
+在新的Python进程中启动wx_monitor的主窗口，测量从进程启动到窗口首次绘制（首次显示）
+以及到群聊列表和消息数据库都加载完成（就绪）的时间。使用 --importtime 时额外以
+-X importtime 启动一次，并列出导入耗时最多的模块。
+
+子进程在当前目录中运行，和直接启动wx_monitor.py一样读取monitor_config.json和消息数据库。
+
+示例：
+    python bench_startup.py --runs 5
+    python bench_startup.py --chats 200 --importtime
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+
+def run_child(args):
+    """子进程：启动主窗口并记录各个阶段的时间"""
+    marks = {}
+
+    def mark(name):
+        marks[name] = time.time() - args.launched
+
+    mark("interpreter")
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QObject, QEvent, QTimer
+
+    import wx_monitor
+    mark("import")
+
+    backend = None
+    if args.chats:
+        from chat_backend import ReplayBackend
+        backend = ReplayBackend.synthetic(args.chats, 1, 60)
+
+    app = QApplication(sys.argv[:1])
+    window = wx_monitor.WeChatMonitorApp(backend=backend)
+    mark("construct")
+
+    def finish():
+        # 首次绘制和就绪都记录后再退出，就绪早于首次显示时也能测到首次显示的时间
+        if "first_window" in marks and "ready" in marks:
+            QTimer.singleShot(0, app.quit)
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            # 主窗口本身被中心部件完全覆盖时不会收到绘制事件，记录窗口中任意部件的第一次绘制
+            if (event.type() == QEvent.Paint and "first_window" not in marks
+                    and obj.isWidgetType() and obj.window() is window):
+                mark("first_window")
+                finish()
+            return False
+
+    first_paint = FirstPaint()
+    app.installEventFilter(first_paint)
+
+    def on_ready():
+        mark("ready")
+        finish()
+
+    window.ready_signal.connect(on_ready)
+    QTimer.singleShot(int(args.timeout * 1000), app.quit)
+    window.show()
+    app.exec_()
+    window.close()
+
+    print(json.dumps(marks))
+
+
+def parse_importtime(stderr, top):
+    """解析 -X importtime 的输出，返回累计耗时最多的模块"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # 格式为 "import time: 自身耗时 | 累计耗时 | 模块名"，耗时单位为微秒
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # 模块名前的缩进表示嵌套层级，只统计顶层模块和它们直接导入的模块
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level > 1:
+            continue
+        modules.append((int(cumulative_us), int(self_us), name.rstrip()[1:]))
+    modules.sort(reverse=True)
+    return modules[:top]
+
+
+# 各个阶段的名称，时间均从父进程启动子进程时开始计算
+STAGES = {
+    "interpreter": "解释器启动",
+    "import": "导入模块",
+    "construct": "创建窗口",
+    "first_window": "首次显示",
+    "ready": "就绪"
+}
+
+
+def launch(args, importtime=False):
+    """启动一次子进程，返回各阶段的时间和子进程的标准错误输出"""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += [os.path.abspath(__file__), "--child", "--chats", str(args.chats),
+                "--timeout", str(args.timeout), "--launched", repr(time.time())]
+    process = subprocess.run(command, capture_output=True, text=True, encoding="utf-8")
+    lines = [line for line in process.stdout.splitlines() if line.startswith("{")]
+    if process.returncode != 0 or not lines:
+        print(f"启动失败:\n{process.stderr[-2000:]}")
+        sys.exit(1)
+    return json.loads(lines[-1]), process.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量wx_monitor的启动时间")
+    parser.add_argument("--runs", type=int, default=3, help="启动次数")
+    parser.add_argument("--chats", type=int, default=0, help="使用回放后端模拟指定数量的群聊，为0时连接真实微信")
+    parser.add_argument("--timeout", type=float, default=30, help="等待就绪的最长时间（秒）")
+    parser.add_argument("--importtime", action="store_true", help="额外以 -X importtime 启动一次，列出导入耗时最多的模块")
+    parser.add_argument("--top", type=int, default=15, help="列出的模块数量")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--launched", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    results = []
+    for i in range(args.runs):
+        marks, _ = launch(args)
+        results.append(marks)
+        print(f"第 {i + 1} 次: " + "，".join(f"{STAGES[name]} {value * 1000:.0f} 毫秒" for name, value in marks.items()))
+
+    print()
+    for name, label in STAGES.items():
+        values = [marks[name] for marks in results if name in marks]
+        if values:
+            print(f"{label}: 中位数 {statistics.median(values) * 1000:.0f} 毫秒，最小 {min(values) * 1000:.0f} 毫秒")
+    not_ready = sum("ready" not in marks for marks in results)
+    if not_ready:
+        print(f"有 {not_ready} 次在 {args.timeout} 秒内没有就绪")
+
+    if args.importtime:
+        # 输出导入耗时会拖慢启动，单独启动一次，不计入上面的结果
+        _, stderr = launch(args, importtime=True)
+        imports = parse_importtime(stderr, args.top)
+        print(f"\n导入耗时最多的 {len(imports)} 个模块:")
+        for cumulative_us, self_us, name in imports:
+            print(f"{cumulative_us / 1000:8.1f} 毫秒（自身 {self_us / 1000:.1f}）  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+import time
+import json
+import bisect
+import random
+import threading
+
+
+def create_wxauto_backend():
+    """创建基于wxauto的真实微信后端
+
+    wxauto只能在已登录微信的Windows桌面上使用，因此在这里延迟导入，
+    以便在其他平台上也能使用回放后端运行和测试监控流程。
+
+    Returns:
+        wxauto.WeChat: 微信实例
+    """
+    from wxauto import WeChat
+    return WeChat()
+
+
+class ChatBackend:
+    """消息来源后端接口
+
+    WeChatMonitor只依赖wxauto.WeChat的以下子集，任何实现了这些属性和方法的对象
+    都可以作为后端使用（wxauto.WeChat本身即满足该接口）：
+
+    - GetSessionList(): 返回会话名称列表
+    - ChatWith(who): 切换到指定会话，成功返回True
+    - SwitchToChat(): 切换到聊天列表页面
+    - CurrentChat: 当前会话名称
+    - ChatBox: 聊天框控件，需支持SetFocus()和SendKeys(keys)
+    - B_Search: 搜索框控件，需支持SetFocus()和SendKeys(keys)
+    - SessionItemList: 会话列表控件项，每项需支持Click()，Name为会话名称（可选，用于确认缓存的位置）
+    - GetAllMessage(): 返回当前会话窗口中已加载的消息列表
+    - SendMsg(msg): 向当前会话发送消息
+    - GetSession(): 可选，返回会话列表项，每项包含name、content（最后一条消息预览）、
+      time（最后一条消息时间）和new_count（未读消息数），用于在切换会话前判断是否有新消息
+    - AddListenChat(who)、RemoveListenChat(who)、listen: 可选，把会话打开为独立的聊天窗口，
+      listen为 {会话名称: 窗口}，窗口需支持GetAllMessage()，读取时不需要切换主窗口的会话
+    """
+
+    CurrentChat = None
+    ChatBox = None
+    B_Search = None
+    SessionItemList = []
+
+    def GetSessionList(self):
+        raise NotImplementedError
+
+    def ChatWith(self, who):
+        raise NotImplementedError
+
+    def SwitchToChat(self):
+        raise NotImplementedError
+
+    def GetAllMessage(self):
+        raise NotImplementedError
+
+    def SendMsg(self, msg):
+        raise NotImplementedError
+
+
+class ReplayMessage:
+    """回放后端返回的消息项，字符串形式与"发送者: 内容"格式一致"""
+
+    __slots__ = ("sender", "content", "id")
+
+    def __init__(self, sender, content, msg_id=None):
+        self.sender = sender
+        self.content = content
+        self.id = msg_id
+
+    def __str__(self):
+        return f"{self.sender}: {self.content}"
+
+    def __repr__(self):
+        return f"ReplayMessage({self.sender!r}, {self.content!r}, {self.id!r})"
+
+
+class ReplaySession:
+    """回放后端的会话列表项，属性与wxauto的SessionElement一致"""
+
+    __slots__ = ("name", "content", "time", "new_count")
+
+    def __init__(self, name, content, time_text, new_count):
+        self.name = name
+        self.content = content
+        self.time = time_text
+        self.new_count = new_count
+
+
+class _ReplayControl:
+    """模拟的UI控件，每次操作都计入后端的UI操作次数"""
+
+    def __init__(self, backend, on_click=None, name=None):
+        self.backend = backend
+        self.on_click = on_click
+        self.Name = name
+
+    def SetFocus(self):
+        self.backend._ui_op()
+
+    def SendKeys(self, keys):
+        self.backend._ui_op()
+
+    def Click(self):
+        self.backend._ui_op()
+        if self.on_click:
+            self.on_click()
+
+
+class _ReplaySearchBox(_ReplayControl):
+    """模拟的搜索框，记录输入的文本用于过滤会话列表"""
+
+    def __init__(self, backend):
+        super().__init__(backend)
+        self.text = ""
+
+    def SendKeys(self, keys):
+        self.backend._ui_op()
+        i = 0
+        while i < len(keys):
+            if keys.startswith("{CONTROL}a", i):
+                i += len("{CONTROL}a")
+                continue
+            if keys.startswith("{BACKSPACE}", i):
+                self.text = ""
+                i += len("{BACKSPACE}")
+                continue
+            # 转义的特殊字符，如 {+}
+            if keys[i] == "{" and i + 2 < len(keys) and keys[i + 2] == "}":
+                self.text += keys[i + 1]
+                i += 3
+                continue
+            self.text += keys[i]
+            i += 1
+
+
+class _ReplayChatWindow:
+    """回放后端的独立聊天窗口，只显示一个会话的消息"""
+
+    def __init__(self, backend, chat_name):
+        self.backend = backend
+        self.who = chat_name
+
+    def GetAllMessage(self):
+        self.backend._ui_op()
+        count = self.backend._visible_count(self.who)
+        start = max(0, count - self.backend.window_size)
+        return self.backend._messages[self.who][start:count]
+
+
+class ReplayBackend(ChatBackend):
+    """可回放的确定性消息来源后端
+
+    按照预先录制或合成的消息流，以可配置的速率和UI延迟提供消息，
+    用于在没有微信客户端的环境（如Linux）中运行和压测监控流程。
+
+    消息流格式为 {群聊名称: [(到达时间偏移秒数, 发送者, 内容), ...]}，
+    偏移量相对于后端创建时刻计算。
+    """
+
+    def __init__(self, streams, ui_latency=0.0, window_size=50, speed=1.0,
+                 with_ids=False, clock=None, search_only=(), switch_latency=0.0):
+        """初始化回放后端
+
+        Args:
+            streams: 消息流，{群聊名称: [(偏移秒数, 发送者, 内容), ...]}
+            ui_latency: 每次UI操作的模拟延迟（秒）
+            window_size: 聊天窗口中最多加载的消息条数，模拟微信界面只显示最近消息
+            speed: 回放速度倍数，大于1表示加速回放
+            with_ids: 是否为消息提供唯一ID（模拟wxauto的消息ID）
+            clock: 时钟函数，默认为time.monotonic
+            search_only: ChatWith无法打开的会话名称，模拟只能通过搜索或会话列表切换的群聊
+            switch_latency: 切换会话后界面显示新会话需要的时间（秒），在此之前CurrentChat和
+                GetAllMessage仍然对应原来的会话
+        """
+        self.ui_latency = ui_latency
+        self.window_size = window_size
+        self.speed = speed
+        self.with_ids = with_ids
+        self._clock = clock or time.monotonic
+        self.search_only = set(search_only)
+        self.switch_latency = switch_latency
+        self._start = self._clock()
+
+        # 按到达时间排序，便于用二分查找定位当前可见的消息
+        self._offsets = {}
+        self._messages = {}
+        for chat_name, stream in streams.items():
+            ordered = sorted(stream, key=lambda item: item[0])
+            self._offsets[chat_name] = [item[0] for item in ordered]
+            self._messages[chat_name] = [
+                ReplayMessage(sender, content, f"{chat_name}#{i}" if with_ids else None)
+                for i, (_, sender, content) in enumerate(ordered)
+            ]
+
+        self._current_chat = None
+        self._pending_chat = None  # 正在切换的会话及其显示时间
+        self._read_count = {}  # 每个会话最后一次打开时已到达的消息数，用于计算未读数
+        self.ui_ops = 0  # UI操作次数，用于评估监控流程的开销
+        self._ui_ops_lock = threading.Lock()  # 独立聊天窗口在多个线程中读取
+        self.listen = {}  # 独立聊天窗口
+
+        self.ChatBox = _ReplayControl(self)
+        self.B_Search = _ReplaySearchBox(self)
+
+    @classmethod
+    def synthetic(cls, chat_count, messages_per_minute, duration, seed=0,
+                  sender_count=8, skew=0.0, **kwargs):
+        """生成合成消息流的回放后端
+
+        Args:
+            chat_count: 群聊数量
+            messages_per_minute: 所有群聊合计每分钟的消息数
+            duration: 消息流持续时间（秒）
+            seed: 随机种子，相同种子生成相同的消息流
+            sender_count: 每个群聊的发送者数量
+            skew: 群聊活跃度的倾斜程度，0表示均匀分布，越大热门群聊越集中
+            **kwargs: 传递给构造函数的其他参数
+
+        Returns:
+            ReplayBackend: 回放后端实例
+        """
+        rng = random.Random(seed)
+        weights = [1.0 / (i + 1) ** skew for i in range(chat_count)]
+        total_weight = sum(weights)
+
+        streams = {}
+        for i, weight in enumerate(weights):
+            chat_name = f"测试群{i + 1:03d}"
+            # 每个群聊的消息按泊松过程到达
+            rate = messages_per_minute / 60.0 * weight / total_weight
+            stream = []
+            offset = 0.0
+            seq = 0
+            while rate > 0:
+                offset += rng.expovariate(rate)
+                if offset > duration:
+                    break
+                sender = f"用户{rng.randrange(sender_count) + 1}"
+                seq += 1
+                stream.append((offset, sender, f"第{seq}条消息 {rng.getrandbits(32):08x}"))
+            streams[chat_name] = stream
+
+        return cls(streams, **kwargs)
+
+    @classmethod
+    def from_file(cls, file_path, **kwargs):
+        """从录制文件加载回放后端
+
+        文件为JSON Lines格式，每行包含chat、sender、content字段，
+        以及offset（相对秒数）或timestamp（绝对时间戳）字段之一。
+
+        Args:
+            file_path: 录制文件路径
+            **kwargs: 传递给构造函数的其他参数
+
+        Returns:
+            ReplayBackend: 回放后端实例
+        """
+        records = []
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+
+        # 绝对时间戳转换为相对第一条消息的偏移
+        timestamps = [r["timestamp"] for r in records if "offset" not in r and "timestamp" in r]
+        base = min(timestamps) if timestamps else 0
+
+        streams = {}
+        for record in records:
+            offset = record["offset"] if "offset" in record else record.get("timestamp", base) - base
+            streams.setdefault(record["chat"], []).append(
+                (offset, record["sender"], record["content"])
+            )
+
+        return cls(streams, **kwargs)
+
+    def _ui_op(self):
+        """记录一次UI操作，并模拟UI延迟"""
+        with self._ui_ops_lock:
+            self.ui_ops += 1
+        if self.ui_latency > 0:
+            time.sleep(self.ui_latency)
+
+    def _elapsed(self):
+        return (self._clock() - self._start) * self.speed
+
+    def _visible_count(self, chat_name):
+        """返回指定群聊当前已到达的消息数量"""
+        return bisect.bisect_right(self._offsets.get(chat_name, []), self._elapsed())
+
+    def delivered_count(self):
+        """返回截至目前所有群聊已到达的消息总数，用于核对监控的捕获率"""
+        return sum(self._visible_count(chat_name) for chat_name in self._messages)
+
+    @property
+    def CurrentChat(self):
+        self._apply_pending()
+        return self._current_chat
+
+    @property
+    def SessionItemList(self):
+        """会话列表项，搜索框有输入时只包含匹配的会话"""
+        sessions = self.GetSessionList()
+        if self.B_Search.text:
+            sessions = [s for s in sessions if self.B_Search.text in s]
+        return [_ReplayControl(self, on_click=lambda s=s: self._select(s), name=s) for s in sessions]
+
+    def _select(self, chat_name):
+        self.B_Search.text = ""
+        if self.switch_latency > 0:
+            self._pending_chat = (chat_name, self._clock() + self.switch_latency)
+        else:
+            self._open(chat_name)
+
+    def _apply_pending(self):
+        """模拟的切换延迟已过时显示新会话"""
+        if self._pending_chat is not None and self._clock() >= self._pending_chat[1]:
+            chat_name = self._pending_chat[0]
+            self._pending_chat = None
+            self._open(chat_name)
+
+    def _open(self, chat_name):
+        # 离开的会话和打开的会话都视为已读
+        if self._current_chat in self._messages:
+            self._read_count[self._current_chat] = self._visible_count(self._current_chat)
+        self._current_chat = chat_name
+        self._read_count[chat_name] = self._visible_count(chat_name)
+
+    def _sorted_sessions(self):
+        # 与微信一致，最近有消息的会话排在前面
+        elapsed = self._elapsed()
+
+        def last_activity(chat_name):
+            offsets = self._offsets[chat_name]
+            count = bisect.bisect_right(offsets, elapsed)
+            return offsets[count - 1] if count else -1.0
+
+        return sorted(self._messages, key=last_activity, reverse=True)
+
+    def GetSessionList(self):
+        self._ui_op()
+        return self._sorted_sessions()
+
+    def GetSession(self):
+        self._ui_op()
+        self._apply_pending()
+        sessions = []
+        for chat_name in self._sorted_sessions():
+            count = self._visible_count(chat_name)
+            if count:
+                content = str(self._messages[chat_name][count - 1])
+                time_text = f"{self._offsets[chat_name][count - 1]:.0f}"
+            else:
+                content = time_text = ""
+            # 当前打开的会话收到消息时不显示未读数
+            new_count = 0 if chat_name == self._current_chat else count - self._read_count.get(chat_name, 0)
+            sessions.append(ReplaySession(chat_name, content, time_text, new_count))
+        return sessions
+
+    def ChatWith(self, who):
+        self._ui_op()
+        if who in self._messages and who not in self.search_only:
+            self._select(who)
+            return True
+        return False
+
+    def SwitchToChat(self):
+        self._ui_op()
+
+    def AddListenChat(self, who, **kwargs):
+        self._ui_op()
+        if who not in self._messages:
+            raise Exception(f"未找到会话: {who}")
+        self.listen[who] = _ReplayChatWindow(self, who)
+
+    def RemoveListenChat(self, who):
+        self._ui_op()
+        self.listen.pop(who, None)
+
+    def GetAllMessage(self):
+        self._ui_op()
+        self._apply_pending()
+        if self._current_chat not in self._messages:
+            return []
+        count = self._visible_count(self._current_chat)
+        start = max(0, count - self.window_size)
+        return self._messages[self._current_chat][start:count]
+
+    def SendMsg(self, msg):
+        self._ui_op()
+        self._apply_pending()
+        if self._current_chat not in self._messages:
+            return False
+        # 自己发送的消息立即可见
+        chat_name = self._current_chat
+        count = self._visible_count(chat_name)
+        msg_id = f"{chat_name}#{len(self._messages[chat_name])}" if self.with_ids else None
+        self._offsets[chat_name].insert(count, self._elapsed())
+        self._messages[chat_name].insert(count, ReplayMessage("Self", msg, msg_id))
+        return True
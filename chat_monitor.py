@@ -1,29 +1,249 @@
 import time
 import datetime
 import re
-from wxauto import WeChat
+import threading
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from chat_backend import create_wxauto_backend
+
+
+_ui_thread_state = threading.local()
+
+
+def _init_ui_thread():
+    """初始化读取独立聊天窗口的线程池线程
+    
+    wxauto基于uiautomation，除主线程外每个线程使用前都要单独初始化COM，
+    初始化对象保存到线程结束。没有安装uiautomation时（如使用回放后端）不需要初始化。
+    """
+    try:
+        import uiautomation
+    except ImportError:
+        return
+    _ui_thread_state.initializer = uiautomation.UIAutomationInitializerInThread()
+
+
+@contextlib.contextmanager
+def ui_thread_scope():
+    """在后台线程中使用wxauto期间初始化COM，退出时释放
+    
+    用于QThread等自行管理的后台线程：线程函数的全部内容放在该上下文中执行。
+    没有安装uiautomation时（如使用回放后端）不做任何事。
+    """
+    try:
+        import uiautomation
+    except ImportError:
+        yield
+        return
+    with uiautomation.UIAutomationInitializerInThread():
+        yield
+
+
+def message_fingerprint(*parts):
+    """生成消息的64位整数指纹
+    
+    使用Python内置的非加密哈希，比MD5十六进制字符串更快也更省内存。
+    内置哈希在进程内稳定，足以满足运行期间的去重需求。
+    
+    Args:
+        *parts: 参与指纹计算的消息标识，如消息ID或连续几条消息的内容
+    """
+    return hash(parts) & 0xFFFFFFFFFFFFFFFF
+
+
+def wait_until(condition, timeout=3.0, interval=0.05):
+    """反复检查条件，直到条件成立或超时
+    
+    用于等待界面完成切换等操作，界面响应快时立即返回，不必固定休眠最长可能的时间。
+    检查条件时抛出的异常视为条件不成立（界面切换过程中控件可能暂时不可用）。
+    
+    Args:
+        condition: 无参数的函数，返回值为真时表示条件成立
+        timeout: 最长等待时间（秒）
+        interval: 两次检查之间的间隔（秒）
+        
+    Returns:
+        条件成立时返回condition的返回值，超时返回None
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            result = condition()
+        except Exception:
+            result = None
+        if result:
+            return result
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(interval)
+
+
+class FingerprintCache:
+    """按插入顺序淘汰的有界消息指纹缓存（LRU）
+    
+    每条新消息的指纹都会加入缓存，但只有读取游标丢失（窗口溢出）或游标位置不确定时
+    才会查询缓存过滤读取过的消息，正常轮询直接按游标读取。因此命中和未命中次数只统计
+    这些轮询，大多数时候为0是正常的。
+    """
+    
+    def __init__(self, maxsize=200):
+        """初始化指纹缓存
+        
+        Args:
+            maxsize: 最多保留的指纹数量，超出时淘汰最久未使用的指纹
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __contains__(self, fingerprint):
+        if fingerprint in self._entries:
+            # 命中的指纹移到末尾，表示最近使用过
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def add(self, fingerprint):
+        """添加指纹，超出容量时淘汰最旧的指纹"""
+        self._entries[fingerprint] = None
+        self._entries.move_to_end(fingerprint)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def stats(self):
+        """返回缓存的统计信息"""
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
 
 class WeChatMonitor:
-    def __init__(self):
-        """初始化微信监控器"""
-        # 检查微信是否已启动
-        self.wx = WeChat()
+    def __init__(self, backend=None, cache_size=200, health_check_interval=30):
+        """初始化微信监控器
+        
+        监控器可以长期使用：界面操作和监控线程共用同一个实例，连接失效时自动重新连接，
+        读取游标和去重缓存在多次监控之间保留。
+        
+        Args:
+            backend: 消息来源后端，需实现ChatBackend接口，默认使用wxauto连接微信客户端
+            cache_size: 每个群聊最多缓存的消息指纹数量
+            health_check_interval: 检查连接是否有效的最短间隔（秒）
+        """
+        # 指定了后端时重新连接仍然使用该后端，否则重新创建wxauto实例
+        self.backend_factory = (lambda: backend) if backend is not None else create_wxauto_backend
+        self.health_check_interval = health_check_interval
+        self.last_health_check = 0
+        self.reconnect_count = 0
+        # UI自动化操作不能交错执行，切换群聊和读取消息等操作都需要持有该锁
+        self.lock = threading.RLock()
+        
+        self.wx = None
+        self.connect()
+        
+        # 初始化缓存
+        self.message_cache_by_chat = {}  # 每个群聊的消息指纹缓存，避免重复
+        self.cache_size = cache_size
+        self.cursor_by_chat = {}  # 每个群聊的读取游标，只解析游标之后的消息
+        self.cursor_tail_size = 3  # 游标记录的消息条数，用于在窗口中定位上次读取的位置
+        self.cursor_max_tail_size = 10  # 窗口末尾的消息都相同时游标最多记录的消息条数
+        self.dedup_ngram_size = 3  # 去重指纹包含的连续消息条数（当前消息及其前面的消息）
+        self.last_poll_overflowed = False  # 最近一次读取是否发生了窗口溢出
+        
+        # 等待界面响应的参数，界面完成切换后立即继续，不固定休眠
+        self.ui_timeout = 3.0  # 等待切换群聊、搜索结果等的最长时间（秒）
+        self.ui_poll_interval = 0.05  # 检查界面状态的间隔（秒）
+        self.scroll_settle = 0.1  # 按End键后等待消息列表滚动的时间（秒），滚动位置无法直接检查
+        self.chat_titles = {}  # 标题与群聊名称不一致的群聊（如显示备注名）切换后实际显示的标题
+        self.known_chats = set()  # 监控或切换过的群聊，它们的名称和标题不会被当作其他群聊的标题
+        
+        # 切换群聊的方法，按默认尝试顺序排列
+        self.switch_methods = {
+            "direct": self._switch_direct,
+            "search": self._switch_by_search,
+            "click_session": self._switch_by_click_session
+        }
+        self.switch_method_by_chat = {}  # 每个群聊上次切换成功的方法，下次优先使用
+        self.session_index_by_chat = {}  # 每个群聊上次在会话列表中的位置
+        self.switch_stats = {
+            name: {"attempts": 0, "successes": 0, "total_time": 0.0}
+            for name in self.switch_methods
+        }
+        
+        # 独立聊天窗口，读取时不需要切换主窗口的会话
+        self.listen_windows = {}  # {群聊名称: 独立聊天窗口}
+        self.listen_executor = None  # 并行读取独立聊天窗口的线程池
+        self.listen_workers = 0
+    
+    def connect(self):
+        """连接微信客户端，并通过会话列表检查是否已登录"""
+        wx = self.backend_factory()
         
         # 使用微信实例的属性来检查是否登录
         try:
             # 尝试获取会话列表，如果失败则可能未登录
-            if not self.wx.GetSessionList():
+            if not wx.GetSessionList():
                 raise Exception("未检测到会话列表，请确保微信已登录")
         except Exception as e:
             raise Exception(f"微信未登录或未正确启动: {str(e)}")
         
-        # 初始化缓存
-        self.message_cache_by_chat = {}  # 用于缓存消息，避免重复
+        self.wx = wx
+        self.last_health_check = time.time()
+    
+    def is_healthy(self):
+        """检查当前连接是否仍然有效"""
+        try:
+            healthy = bool(self.wx.GetSessionList())
+        except Exception:
+            healthy = False
+        if healthy:
+            self.last_health_check = time.time()
+        return healthy
+    
+    def reconnect(self):
+        """重新连接微信客户端，读取游标和去重缓存保持不变"""
+        with self.lock:
+            print("微信连接已失效，正在重新连接...")
+            self.connect()
+            self.reconnect_count += 1
+            print(f"已重新连接微信（第 {self.reconnect_count} 次）")
+    
+    def ensure_connected(self):
+        """距离上次检查超过间隔时检查连接，连接失效时重新连接"""
+        with self.lock:
+            if time.time() - self.last_health_check < self.health_check_interval:
+                return
+            if not self.is_healthy():
+                self.reconnect()
+    
+    def _with_reconnect(self, operation, *args):
+        """执行一个UI操作，失败且连接已失效时重新连接并重试一次"""
+        with self.lock:
+            self.ensure_connected()
+            try:
+                return operation(*args)
+            except Exception:
+                if self.is_healthy():
+                    raise
+                self.reconnect()
+                return operation(*args)
     
     def get_chat_list(self):
         """获取可用的群聊列表"""
         # 获取所有会话
-        sessions = self.wx.GetSessionList()
+        sessions = self._with_reconnect(lambda: self.wx.GetSessionList())
         
         # 过滤出群聊（通常群聊名称至少包含几个字符）
         # 这里简单地过滤掉可能的系统会话或空名称
@@ -31,32 +251,98 @@ class WeChatMonitor:
         
         return chat_groups
     
+    def get_session_snapshot(self):
+        """读取会话列表中每个会话的未读数和最后一条消息预览
+        
+        只需一次UI操作，不用切换会话就能判断哪些群聊有变化。会话列表只包含界面中
+        已加载的会话，不在其中的群聊无法判断。
+        
+        Returns:
+            dict: {会话名称: (未读数, 最后一条消息预览, 最后一条消息时间)}，后端不支持时返回None
+        """
+        if not hasattr(self.wx, "GetSession"):
+            return None
+        try:
+            sessions = self._with_reconnect(lambda: self.wx.GetSession())
+        except Exception as e:
+            print(f"读取会话列表失败: {str(e)}")
+            return None
+        
+        snapshot = {}
+        for session in sessions or []:
+            name = getattr(session, "name", None)
+            if name:
+                snapshot[name] = (getattr(session, "new_count", 0), getattr(session, "content", ""),
+                                  getattr(session, "time", ""))
+        return snapshot
+    
     def switch_to_chat(self, chat_name):
-        """切换到指定的群聊，使用更安全的方法处理特殊字符"""
+        """切换到指定的群聊，连接失效时自动重新连接"""
+        return self._with_reconnect(self._switch_to_chat, chat_name)
+    
+    def _switch_to_chat(self, chat_name):
+        """切换到指定的群聊，使用更安全的方法处理特殊字符
+        
+        优先使用该群聊上次切换成功的方法，失败时清除记录并按默认顺序尝试其他方法。
+        """
+        self.known_chats.add(chat_name)
+        
         # 尝试使用不同的方法切换到群聊
-        methods = [
-            self._switch_direct,
-            self._switch_by_search,
-            self._switch_by_click_session
-        ]
+        method_names = list(self.switch_methods)
+        cached = self.switch_method_by_chat.get(chat_name)
+        if cached:
+            method_names.remove(cached)
+            method_names.insert(0, cached)
         
         # 记录所有错误，以便在所有方法都失败时提供详细信息
         errors = []
         
-        for method_index, method in enumerate(methods):
+        for method_name in method_names:
+            stats = self.switch_stats[method_name]
+            stats["attempts"] += 1
+            start_time = time.time()
             try:
-                if method(chat_name):
-                    # 成功切换后，确保滚动到最新消息
-                    self._scroll_to_latest_messages()
-                    return True
+                switched = self.switch_methods[method_name](chat_name)
             except Exception as e:
-                error_msg = f"方法{method_index+1}失败: {str(e)}"
+                switched = False
+                error_msg = f"方法{method_name}失败: {str(e)}"
                 print(error_msg)
                 errors.append(error_msg)
+            stats["total_time"] += time.time() - start_time
+            
+            if switched:
+                stats["successes"] += 1
+                self.switch_method_by_chat[chat_name] = method_name
+                # 成功切换后，确保滚动到最新消息
+                self._scroll_to_latest_messages()
+                return True
+            
+            if method_name == cached:
+                # 记录的方法已经失效，下次重新按默认顺序尝试
+                del self.switch_method_by_chat[chat_name]
+                cached = None
         
         # 所有方法都失败
         raise Exception(f"切换到群聊 {chat_name} 失败: 尝试了所有可用方法。错误: {'; '.join(errors)}")
     
+    def get_switch_stats(self):
+        """获取每种切换方法的统计信息
+        
+        Returns:
+            dict: {方法名称: {attempts, successes, failures, total_time, avg_time}}，
+                avg_time为每次尝试的平均耗时（秒）
+        """
+        return {
+            name: {
+                "attempts": stats["attempts"],
+                "successes": stats["successes"],
+                "failures": stats["attempts"] - stats["successes"],
+                "total_time": stats["total_time"],
+                "avg_time": stats["total_time"] / stats["attempts"] if stats["attempts"] else 0.0
+            }
+            for name, stats in self.switch_stats.items()
+        }
+    
     def _scroll_to_latest_messages(self):
         """滚动到最新消息"""
         try:
@@ -66,19 +352,66 @@ class WeChatMonitor:
                 chat_box.SetFocus()
                 # 先按Home键到顶部，然后按End键到底部，确保位置正确
                 chat_box.SendKeys("{END}")
-                time.sleep(0.5)
+                time.sleep(self.scroll_settle)
                 print("已滚动到最新消息")
             else:
                 print("找不到聊天框，无法滚动到最新消息")
         except Exception as e:
             print(f"滚动到最新消息时出错: {str(e)}")
     
+    @staticmethod
+    def _title_matches(title, chat_name):
+        """标题是否为指定群聊的名称，群聊标题后面可能带有成员数，如 群聊名称 (123)"""
+        if title == chat_name:
+            return True
+        suffix = title[len(chat_name):].strip()
+        return title.startswith(chat_name) and re.fullmatch(r"\(\d+\)", suffix) is not None
+    
+    def _is_current_chat(self, chat_name):
+        """当前聊天窗口是否为指定群聊，或者是该群聊之前切换后显示过的标题"""
+        current_chat = self._current_chat_name()
+        if not current_chat:
+            return False
+        return current_chat == self.chat_titles.get(chat_name) or self._title_matches(current_chat, chat_name)
+    
+    def _is_other_chat_title(self, title, chat_name):
+        """标题是否属于其他监控或切换过的群聊"""
+        return any(other != chat_name and (self._title_matches(title, other) or title == self.chat_titles.get(other))
+                   for other in self.known_chats)
+    
+    def _wait_for(self, condition):
+        """按监控器的超时和检查间隔等待界面状态"""
+        return wait_until(condition, self.ui_timeout, self.ui_poll_interval)
+    
+    def _wait_for_chat(self, chat_name, confirmed=True):
+        """等待聊天窗口的标题变为指定群聊
+        
+        群聊显示为备注名、标题被截断等情况下标题可能一直不一致。切换操作确认打开的就是该群聊时，
+        超时后记住实际显示的标题，下次切换到该群聊时不再等待超时。切换较慢时标题可能还是原来的
+        群聊，所以其他群聊的名称或标题不会被记住，按切换失败处理，由调用方尝试下一种切换方法。
+        
+        Args:
+            chat_name: 群聊名称
+            confirmed: 切换操作是否确认打开的是该群聊，点击名称不一致的搜索结果时为False
+        
+        Returns:
+            bool: 标题与群聊一致或记住了新的标题时返回True，否则返回False
+        """
+        if self._wait_for(lambda: self._is_current_chat(chat_name)):
+            return True
+        current_chat = self._current_chat_name()
+        if confirmed and current_chat and not self._is_other_chat_title(current_chat, chat_name):
+            print(f"切换到群聊 {chat_name} 后聊天窗口标题为 {current_chat}，以后按该标题确认切换")
+            self.chat_titles[chat_name] = current_chat
+            return True
+        print(f"切换到群聊 {chat_name} 后聊天窗口标题为 {current_chat}，与群聊名称不一致")
+        return False
+    
     def _switch_direct(self, chat_name):
         """方法1: 直接使用ChatWith尝试切换"""
         try:
             if self.wx.ChatWith(chat_name):
-                time.sleep(0.5)
-                return True
+                return self._wait_for_chat(chat_name)
             return False
         except Exception as e:
             raise Exception(f"直接切换失败: {str(e)}")
@@ -88,47 +421,63 @@ class WeChatMonitor:
         try:
             # 首先切换到聊天列表
             self.wx.SwitchToChat()
-            time.sleep(0.5)
             
             # 获取并清空搜索框
-            search_box = self.wx.B_Search
+            search_box = self._wait_for(lambda: self.wx.B_Search)
             if not search_box:
                 raise Exception("未找到搜索框")
             
             search_box.SetFocus()
             # 使用安全的方式清空搜索框
             search_box.SendKeys('{CONTROL}a{BACKSPACE}')
-            time.sleep(0.2)
             
             # 安全地输入群聊名称
-            # 逐字符输入，避免一次性输入导致的特殊字符问题
-            for char in chat_name:
-                if char in ['+', '^', '%', '(', ')', '{', '}', '[', ']', '~']:
-                    # 对特殊字符进行转义
-                    search_box.SendKeys('{' + char + '}')
-                else:
-                    search_box.SendKeys(char)
-                time.sleep(0.05)  # 短暂延迟，模拟真实输入
+            # 对特殊字符进行转义，避免被当作按键命令，转义后一次输入整个名称
+            keys = ''.join('{' + char + '}' if char in ['+', '^', '%', '(', ')', '{', '}', '[', ']', '~'] else char
+                           for char in chat_name)
+            search_box.SendKeys(keys)
             
-            time.sleep(1)  # 等待搜索结果
+            # 等待搜索结果，第一个结果为目标群聊时点击（控件没有名称时只等待出现结果）
+            def first_result():
+                session_list = self.wx.SessionItemList
+                if not session_list:
+                    return None
+                name = getattr(session_list[0], "Name", None)
+                if name is not None and chat_name not in name:
+                    return None
+                return session_list[0]
             
-            # 尝试点击第一个搜索结果
-            session_list = self.wx.SessionItemList
-            if session_list and len(session_list) > 0:
-                session_list[0].Click()
-                time.sleep(0.5)
-                return True
+            # 搜索结果的名称一直不包含群聊名称（如显示为备注名）时，与原来一样点击第一个结果，
+            # 但不能确认打开的是该群聊（控件没有名称时也一样），标题不一致时按切换失败处理
+            result = self._wait_for(first_result)
+            confirmed = bool(result) and getattr(result, "Name", None) is not None
+            if not result:
+                session_list = self.wx.SessionItemList
+                result = session_list[0] if session_list else None
+            if result:
+                result.Click()
+                return self._wait_for_chat(chat_name, confirmed)
             
             return False
         except Exception as e:
             raise Exception(f"搜索切换失败: {str(e)}")
     
     def _switch_by_click_session(self, chat_name):
-        """方法3: 遍历会话列表并点击匹配项"""
+        """方法3: 遍历会话列表并点击匹配项
+        
+        先检查该群聊上次所在位置的会话项，名称一致时直接点击，不需要再读取会话列表；
+        会话列表按最近消息排序，位置经常变化，不一致时重新查找。
+        """
         try:
-            # 首先切换到聊天列表
+            # 首先切换到聊天列表，等待会话列表加载
             self.wx.SwitchToChat()
-            time.sleep(0.5)
+            session_items = self._wait_for(lambda: self.wx.SessionItemList) or []
+            
+            cached_index = self.session_index_by_chat.get(chat_name)
+            if cached_index is not None and len(session_items) > cached_index \
+                    and getattr(session_items[cached_index], "Name", None) == chat_name:
+                session_items[cached_index].Click()
+                return self._wait_for_chat(chat_name)
             
             # 获取会话列表
             session_list = self.wx.GetSessionList()
@@ -142,27 +491,121 @@ class WeChatMonitor:
             
             if target_index >= 0:
                 # 尝试点击会话项
-                session_items = self.wx.SessionItemList
                 if len(session_items) > target_index:
                     session_items[target_index].Click()
-                    time.sleep(0.5)
-                    return True
+                    self.session_index_by_chat[chat_name] = target_index
+                    return self._wait_for_chat(chat_name)
             
             return False
         except Exception as e:
             raise Exception(f"会话列表点击失败: {str(e)}")
     
-    def get_new_messages(self, max_messages=20):
-        """只获取最新消息，而不尝试提取历史消息
+    def _current_chat_name(self):
+        """获取当前聊天窗口名称（兼容属性和方法两种形式的CurrentChat）"""
+        current_chat = self.wx.CurrentChat
+        if callable(current_chat):
+            current_chat = current_chat()
+        return current_chat
+    
+    def _message_identity(self, msg_item):
+        """获取消息的标识，优先使用wxauto提供的消息ID"""
+        msg_id = getattr(msg_item, 'id', None)
+        if msg_id is not None:
+            return msg_id
+        return str(msg_item)
+    
+    def _find_cursor(self, messages_raw, cursor):
+        """在消息窗口中定位游标，返回游标之后第一条消息的位置
+        
+        从窗口末尾向前查找游标记录的最后几条消息，因此代价只与新消息数量成正比。
+        游标记录的消息必须全部仍在窗口中才算找到：在窗口中间只比较一两条时，
+        "收到"、"1"这类常见的短消息很容易误匹配，把之后滚出窗口的新消息当作已读。
+        唯一的例外是窗口开头：两次轮询之间的新消息接近窗口容量时，游标记录的消息只剩
+        最后几条留在窗口顶部，这时窗口开头与游标末尾一致就说明没有消息遗漏。
+        游标记录的消息全部滚出窗口时按窗口溢出处理，由指纹缓存过滤已经读取过的消息。
+        
+        新消息只追加在窗口末尾，旧消息只会从窗口顶部滚出，所以游标不会出现在上次记录的
+        位置(position)之后；窗口已满且顶部的消息变了时，说明旧消息已经滚出，游标一定在
+        原来的位置之前。不可能是游标的匹配是新消息中重复出现的相同内容（如连续几条"+1"），
+        跳过这些匹配；跳过过匹配且无法确认找到的就是游标时，按找到的位置读取并用指纹缓存
+        过滤重复的消息。
+        
+        Args:
+            messages_raw: 当前窗口中的消息列表
+            cursor: 该群聊上次读取时记录的游标
+            
+        Returns:
+            tuple: (游标之后第一条消息的位置, 是否需要用指纹缓存去重)，找不到游标时位置为None
+        """
+        tail = cursor["tail"]
+        tail_len = len(tail)
+        position = cursor["position"]
+        identities = {}  # 缓存已计算的消息标识
+        skipped = False  # 是否跳过了不可能是游标的匹配
+        
+        def identity_at(index):
+            if index not in identities:
+                identities[index] = self._message_identity(messages_raw[index])
+            return identities[index]
+        
+        scrolled = len(messages_raw) <= cursor["length"] and identity_at(0) != cursor["head"]
+        limit = position - 1 if scrolled else position  # 游标可能出现的最后位置
+        
+        for end in range(len(messages_raw) - 1, tail_len - 2, -1):
+            if all(identity_at(end - tail_len + 1 + j) == tail[j] for j in range(tail_len - 1, -1, -1)):
+                if end > limit:
+                    skipped = True
+                    continue
+                return end + 1, skipped and (scrolled or end != position)
+        
+        # 窗口开头与游标末尾的几条消息一致，游标的前半部分已经滚出窗口
+        for length in range(min(tail_len - 1, len(messages_raw)), 0, -1):
+            if all(identity_at(j) == tail[tail_len - length + j] for j in range(length)):
+                return length, skipped
+        
+        return None, True
+    
+    def get_cursor(self, chat_name):
+        """获取指定群聊的读取游标
+        
+        Returns:
+            dict: 包含最后读取消息标识(tail)、位置(position)、窗口第一条消息标识(head)、窗口消息数(length)
+                和窗口溢出次数(overflows)，未读取过时返回None
+        """
+        return self.cursor_by_chat.get(chat_name)
+    
+    def get_cache_stats(self):
+        """获取每个群聊的指纹缓存统计信息
+        
+        只有游标丢失或位置不确定的轮询才会查询缓存，hits和misses只反映这些轮询。
+        
+        Returns:
+            dict: {群聊名称: {size, maxsize, hits, misses, evictions}}
+        """
+        return {chat_name: cache.stats() for chat_name, cache in self.message_cache_by_chat.items()}
+    
+    def get_new_messages(self, max_messages=20, chat_name=None):
+        """只获取上次读取位置之后的新消息
+        
+        每个群聊维护一个读取游标，记录最后读取的几条消息及其位置，
+        每次轮询只解析游标之后的消息。如果游标已经滚出消息窗口，
+        说明两次轮询之间的新消息超过了窗口容量，会记录并报告窗口溢出。
+        
+        监控器被多个线程共用时，调用方应在切换群聊和读取消息期间持有self.lock，
+        避免其他操作在两者之间切换到别的群聊。
         
         Args:
-            max_messages: 最大获取消息数量
+            max_messages: 首次读取某个群聊时最多获取的消息数量
+            chat_name: 群聊名称，默认使用当前聊天窗口名称
             
         Returns:
             list: 包含新消息的列表，每条消息为一个字典，包含发送者、内容和时间戳
         """
+        self.last_poll_overflowed = False
+        
         # 获取当前聊天窗口名称
-        chat_name = self.wx.CurrentChat
+        if not chat_name:
+            chat_name = self._current_chat_name()
         if not chat_name:
             print("无法获取当前聊天窗口名称")
             return []
@@ -179,18 +622,53 @@ class WeChatMonitor:
             if not messages_raw:
                 print("未获取到任何消息")
                 return []
-                
-            # 只获取最新的几条消息
-            latest_messages = messages_raw[-max_messages:] if len(messages_raw) > max_messages else messages_raw
-            print(f"获取到 {len(latest_messages)} 条最新消息")
         except Exception as e:
             print(f"获取消息失败: {str(e)}")
             return []
         
+        new_messages, self.last_poll_overflowed = self._extract_new_messages(chat_name, messages_raw, max_messages)
+        return new_messages
+    
+    def _extract_new_messages(self, chat_name, messages_raw, max_messages):
+        """从聊天窗口的消息列表中取出游标之后的新消息，并更新游标和去重缓存
+        
+        Args:
+            chat_name: 群聊名称
+            messages_raw: 聊天窗口中已加载的消息列表
+            max_messages: 首次读取该群聊时最多获取的消息数量
+            
+        Returns:
+            tuple: (新消息列表, 是否发生了窗口溢出)
+        """
+        overflowed = False
+        dedup = False  # 是否需要用指纹缓存过滤读取过的消息
+        
         # 初始化聊天的缓存
         if chat_name not in self.message_cache_by_chat:
-            self.message_cache_by_chat[chat_name] = set()
-            
+            self.message_cache_by_chat[chat_name] = FingerprintCache(self.cache_size)
+        
+        # 根据游标确定需要解析的消息范围
+        cursor = self.cursor_by_chat.get(chat_name)
+        if cursor is None:
+            # 首次读取，只获取最新的几条消息
+            start = max(0, len(messages_raw) - max_messages)
+            overflows = 0
+        else:
+            start, dedup = self._find_cursor(messages_raw, cursor)
+            overflows = cursor["overflows"]
+            if start is None:
+                # 游标已滚出窗口，两次轮询之间可能有消息丢失
+                start = 0
+                overflows += 1
+                overflowed = True
+                print(f"警告: {chat_name} 的新消息超过了窗口容量({len(messages_raw)}条)，可能有消息遗漏")
+        
+        print(f"获取到 {len(messages_raw) - start} 条新消息")
+        
+        # 只计算新消息及其前面少量上下文消息的标识，保证代价与新消息数量成正比
+        context_start = max(0, min(start - self.dedup_ngram_size + 1, len(messages_raw) - self.cursor_tail_size))
+        identities = [self._message_identity(msg_item) for msg_item in messages_raw[context_start:]]
+        
         # 初始化返回的消息列表
         new_messages = []
         
@@ -198,7 +676,8 @@ class WeChatMonitor:
         current_time = time.time()
         
         # 处理消息
-        for msg_item in latest_messages:
+        for index in range(start, len(messages_raw)):
+            msg_item = messages_raw[index]
             try:
                 # 提取发送者和内容
                 sender, content = self._parse_message(msg_item)
@@ -207,12 +686,17 @@ class WeChatMonitor:
                 if not sender or not content:
                     continue
                 
-                # 生成消息指纹
-                import hashlib
-                msg_fingerprint = hashlib.md5(f"{sender}:{content}".encode()).hexdigest()
+                # 生成消息指纹：有消息ID时直接使用ID，否则使用该消息与前面几条消息组成的序列，
+                # 这样同一个人重复发送的相同内容（如"1"、"收到"）不会被当作重复消息
+                offset = index - context_start
+                if getattr(msg_item, 'id', None) is not None:
+                    msg_fingerprint = message_fingerprint(identities[offset])
+                else:
+                    ngram_start = max(0, offset - self.dedup_ngram_size + 1)
+                    msg_fingerprint = message_fingerprint(*identities[ngram_start:offset + 1])
                 
-                # 检查是否是新消息
-                if msg_fingerprint in self.message_cache_by_chat[chat_name]:
+                # 游标之后的消息都是新消息，只有在游标丢失或位置不确定时才需要依赖缓存去重
+                if dedup and msg_fingerprint in self.message_cache_by_chat[chat_name]:
                     continue
                 
                 # 记录新消息
@@ -230,25 +714,118 @@ class WeChatMonitor:
                 print(f"处理消息时出错: {str(e)}")
                 continue
         
-        # 限制缓存大小，只保留最近的消息指纹
-        MAX_CACHE_SIZE = 200
-        if len(self.message_cache_by_chat[chat_name]) > MAX_CACHE_SIZE:
-            print(f"清理 {chat_name} 的消息缓存")
-            # 转换为列表后随机保留一部分
-            cache_list = list(self.message_cache_by_chat[chat_name])
-            # 保留后半部分（较新的消息）
-            self.message_cache_by_chat[chat_name] = set(cache_list[-int(MAX_CACHE_SIZE/2):])
+        # 更新游标，记录窗口末尾的几条消息；末尾的消息都相同时（如连续几条"+1"）继续向前记录，
+        # 直到包含一条不同的消息作为锚点，否则窗口滚动后无法判断这些消息移动了几条
+        tail = identities[-self.cursor_tail_size:]
+        index = len(messages_raw) - len(tail) - 1
+        while index >= 0 and len(tail) < self.cursor_max_tail_size and all(identity == tail[-1] for identity in tail):
+            tail.insert(0, identities[index - context_start] if index >= context_start
+                        else self._message_identity(messages_raw[index]))
+            index -= 1
+        self.cursor_by_chat[chat_name] = {
+            "tail": tail,
+            "position": len(messages_raw) - 1,
+            "head": identities[0] if context_start == 0 else self._message_identity(messages_raw[0]),
+            "length": len(messages_raw),
+            "overflows": overflows
+        }
         
         # 返回新消息
-        return new_messages
+        return new_messages, overflowed
+    
+    def open_listen_window(self, chat_name):
+        """把群聊打开为独立的聊天窗口（wxauto的监听窗口）
+        
+        独立窗口中的消息可以随时读取，不需要切换主窗口的会话，多个窗口可以并行读取。
+        打开窗口需要通过主窗口找到该群聊，期间持有self.lock。
+        
+        Returns:
+            bool: 是否成功打开，后端不支持独立窗口时返回False
+        """
+        if chat_name in self.listen_windows:
+            return True
+        if not hasattr(self.wx, "AddListenChat"):
+            return False
+        with self.lock:
+            try:
+                self.wx.AddListenChat(who=chat_name)
+                window = getattr(self.wx, "listen", {}).get(chat_name)
+            except Exception as e:
+                print(f"打开群聊 {chat_name} 的独立窗口失败: {str(e)}")
+                return False
+        if window is None:
+            print(f"打开群聊 {chat_name} 的独立窗口失败: 未找到窗口")
+            return False
+        self.listen_windows[chat_name] = window
+        return True
+    
+    def close_listen_window(self, chat_name):
+        """关闭群聊的独立聊天窗口，读取游标保留，之后可以继续通过主窗口读取"""
+        if self.listen_windows.pop(chat_name, None) is None:
+            return
+        with self.lock:
+            try:
+                self.wx.RemoveListenChat(chat_name)
+            except Exception as e:
+                print(f"关闭群聊 {chat_name} 的独立窗口失败: {str(e)}")
+        if not self.listen_windows and self.listen_executor is not None:
+            self.listen_executor.shutdown(wait=False)
+            self.listen_executor = None
+    
+    def read_listen_windows(self, max_messages=20):
+        """并行读取所有独立聊天窗口的新消息
+        
+        每个窗口在线程池中同时读取，读取到的消息再依次按游标取出新消息。
+        
+        读取时不持有self.lock：每个独立窗口是单独的顶层窗口，GetAllMessage只读取该窗口
+        自己的控件，不发送按键、不改变焦点，也不操作主窗口，因此可以和持有锁的主窗口操作
+        （切换群聊、后台刷新群聊列表）同时进行。打开和关闭窗口要通过主窗口进行，需要持有锁；
+        它们和读取都在监控线程中调用，不会同时发生。
+        
+        Args:
+            max_messages: 首次读取某个群聊时最多获取的消息数量
+            
+        Returns:
+            dict: {群聊名称: {"messages": 新消息列表, "overflowed": 是否窗口溢出, "error": 错误信息或None}}
+        """
+        if not self.listen_windows:
+            return {}
+        # 每个窗口一个线程，窗口增加时重新创建线程池
+        if self.listen_executor is None or self.listen_workers < len(self.listen_windows):
+            if self.listen_executor is not None:
+                self.listen_executor.shutdown(wait=False)
+            self.listen_workers = len(self.listen_windows)
+            self.listen_executor = ThreadPoolExecutor(max_workers=self.listen_workers,
+                                                      thread_name_prefix="ListenWindow",
+                                                      initializer=_init_ui_thread)
+        
+        futures = {
+            chat_name: self.listen_executor.submit(window.GetAllMessage)
+            for chat_name, window in list(self.listen_windows.items())
+        }
+        
+        results = {}
+        for chat_name, future in futures.items():
+            try:
+                messages_raw = future.result()
+            except Exception as e:
+                results[chat_name] = {"messages": [], "overflowed": False, "error": str(e)}
+                continue
+            if not messages_raw:
+                results[chat_name] = {"messages": [], "overflowed": False, "error": None}
+                continue
+            messages, overflowed = self._extract_new_messages(chat_name, messages_raw, max_messages)
+            results[chat_name] = {"messages": messages, "overflowed": overflowed, "error": None}
+        return results
     
     def send_message(self, chat_name, message):
         """向指定群聊发送消息"""
-        # 切换到指定群聊
-        self.switch_to_chat(chat_name)
-        
-        # 发送消息
-        self.wx.SendMsg(message)
+        with self.lock:
+            # 切换到指定群聊
+            self.switch_to_chat(chat_name)
+            
+            # 发送消息
+            self.wx.SendMsg(message)
         
         return True 
 
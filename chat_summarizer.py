@@ -1,25 +1,409 @@
+import re
 import json
-import time
-import requests
+from collections import deque
+import random
+import asyncio
+import threading
+import http_client
+
+# 中日韩文字及全角标点
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+# 消息行开头的时间 "HH:MM:SS"
+_TIME_PREFIX_PATTERN = re.compile(r'^(\d{1,2}):(\d{2}):(\d{2})\s')
+# 系统消息的发送者
+_SYSTEM_SENDERS = {"系统消息", "SYS", "Sys", "系统"}
+# 系统通知的内容，如撤回、入群、改群名、拍一拍
+_SYSTEM_CONTENT_PATTERN = re.compile(r'^.{0,40}?(撤回了一条消息|加入了群聊|退出了群聊|移出了群聊|修改群名为|拍了拍)')
+# 只有表情的消息
+_STICKER_PATTERN = re.compile(r'^(\[(动画表情|表情|表情包|Sticker|Emoji)\])+$')
+# 压缩阶段的显示名称
+_COMPACTION_STAGE_NAMES = {"media": "媒体占位符", "merge": "合并连续消息", "alias": "发送者代号"}
+# 总结失败时返回的文本以此开头
+_FAILED_PREFIX = "总结生成失败: "
+# 只有媒体占位符的消息
+_MEDIA_PATTERN = re.compile(r'^\[(图片|视频|语音|文件|链接|位置|名片|聊天记录|小程序|音乐|动画表情|表情)\]$')
+
+
+def is_failed_summary(summary):
+    """总结文本是否为总结失败时返回的错误信息"""
+    return summary.startswith(_FAILED_PREFIX)
+
+
+def estimate_tokens(text):
+    """粗略估算文本的token数量
+    
+    中文字符大约每个0.6个token，其他字符大约每个0.3个token。
+    
+    Args:
+        text: 要估算的文本
+        
+    Returns:
+        int: 估算的token数量
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return int(cjk_count * 0.6 + (len(text) - cjk_count) * 0.3) + 1
+
+
+def trim_transcript(messages_text, duplicate_window=20):
+    """删除聊天记录中的低价值消息
+    
+    删除系统通知、只有表情的消息，以及与最近若干条消息内容重复的消息（如刷屏的"收到"、"+1"）。
+    
+    Args:
+        messages_text: 消息文本，每行一条 "HH:MM:SS 发送者: 内容"
+        duplicate_window: 检查重复内容的最近消息条数
+        
+    Returns:
+        tuple: (修剪后的消息文本, 各类被删除消息的数量字典)
+    """
+    removed = {"system": 0, "sticker": 0, "duplicate": 0}
+    kept = []
+    recent = deque(maxlen=duplicate_window)
+    
+    for line in messages_text.split("\n"):
+        if not line.strip():
+            continue
+        
+        body = _TIME_PREFIX_PATTERN.sub("", line, count=1)
+        sender, separator, content = body.partition(": ")
+        if not separator:
+            sender, content = "", body
+        sender = sender.strip()
+        content = content.strip()
+        
+        if sender in _SYSTEM_SENDERS or _SYSTEM_CONTENT_PATTERN.match(content):
+            removed["system"] += 1
+        elif _STICKER_PATTERN.match(content):
+            removed["sticker"] += 1
+        elif content in recent:
+            removed["duplicate"] += 1
+        else:
+            recent.append(content)
+            kept.append(line)
+    
+    return "\n".join(kept), removed
+
+
+def _parse_line(line):
+    """把消息行拆分为 (时间, 发送者, 内容)，不是消息格式的行返回 (None, None, 原文)"""
+    match = _TIME_PREFIX_PATTERN.match(line)
+    time_str = line[:match.end() - 1] if match else None
+    body = line[match.end():] if match else line
+    sender, separator, content = body.partition(": ")
+    if not separator:
+        return None, None, line
+    return time_str, sender.strip(), content.strip()
+
+
+def _render_lines(entries, legend=""):
+    lines = [legend] if legend else []
+    for time_str, sender, content in entries:
+        if sender is None:
+            lines.append(content)
+        elif time_str:
+            lines.append(f"{time_str} {sender}: {content}")
+        else:
+            lines.append(f"{sender}: {content}")
+    return "\n".join(lines)
+
+
+def compact_transcript(messages_text, media="collapse", merge_runs=True, alias_senders=True, merge_gap=300):
+    """压缩聊天记录，减少发送给API的token数量
+    
+    依次执行以下阶段，每个阶段都可以单独关闭：
+    1. 媒体占位符：删除只有 "[图片]"、"[视频]" 等占位符的消息，或把同一发送者连续的相同占位符合并为一条
+    2. 合并连续消息：同一发送者在merge_gap秒内的连续消息合并为一行，只保留第一条的时间
+    3. 发送者代号：多次出现的较长昵称替换为 "U1"、"U2" 等代号，并在开头附上代号说明
+    
+    Args:
+        messages_text: 消息文本，每行一条 "HH:MM:SS 发送者: 内容"
+        media: 媒体占位符的处理方式，"collapse" 合并，"drop" 删除，"keep" 保留
+        merge_runs: 是否合并同一发送者的连续消息
+        alias_senders: 是否把发送者昵称替换为代号
+        merge_gap: 合并连续消息的最大时间间隔（秒）
+        
+    Returns:
+        tuple: (压缩后的消息文本, 代号说明（没有代号时为空字符串）, 各阶段的token统计列表)
+            统计列表的每一项为 {"stage": 阶段名称, "before": 压缩前token数, "after": 压缩后token数}
+    """
+    entries = [_parse_line(line) for line in messages_text.split("\n") if line.strip()]
+    stats = []
+    tokens = estimate_tokens(_render_lines(entries))
+    
+    def record(stage, legend=""):
+        nonlocal tokens
+        after = estimate_tokens(_render_lines(entries, legend))
+        stats.append({"stage": stage, "before": tokens, "after": after})
+        tokens = after
+    
+    if media in ("collapse", "drop"):
+        compacted = []
+        repeat = 1
+        for entry in entries:
+            if entry[1] is not None and _MEDIA_PATTERN.match(entry[2]):
+                if media == "drop":
+                    continue
+                previous = compacted[-1] if compacted else None
+                if previous is not None and previous[1] == entry[1] and previous[2].split("×")[0] == entry[2]:
+                    repeat += 1
+                    compacted[-1] = (previous[0], previous[1], f"{entry[2]}×{repeat}")
+                    continue
+            repeat = 1
+            compacted.append(entry)
+        entries = compacted
+        record("media")
+    
+    if merge_runs:
+        merged = []
+        last_seconds = None
+        for entry in entries:
+            seconds = _line_seconds(f"{entry[0]} ") if entry[0] else None  # 时间后需要有空白才能匹配
+            previous = merged[-1] if merged else None
+            if (previous is not None and entry[1] is not None and previous[1] == entry[1]
+                    and seconds is not None and last_seconds is not None
+                    and (seconds - last_seconds) % 86400 <= merge_gap):
+                merged[-1] = (previous[0], previous[1], f"{previous[2]} / {entry[2]}")
+            else:
+                merged.append(entry)
+            last_seconds = seconds
+        entries = merged
+        record("merge")
+    
+    legend = ""
+    if alias_senders:
+        counts = {}
+        for _, sender, _ in entries:
+            if sender is not None and sender not in _SYSTEM_SENDERS:
+                counts[sender] = counts.get(sender, 0) + 1
+        
+        # 按首次出现的顺序分配代号，只替换节省的token多于代号说明开销的昵称
+        aliases = {}
+        for sender, count in counts.items():
+            alias = f"U{len(aliases) + 1}"
+            saved = count * (estimate_tokens(sender) - estimate_tokens(alias))
+            if saved > estimate_tokens(f"{alias}={sender}；"):
+                aliases[sender] = alias
+        
+        if aliases:
+            aliased = [(time_str, aliases.get(sender, sender), content) for time_str, sender, content in entries]
+            aliased_legend = "[成员代号，总结时请使用原昵称] " + "；".join(
+                f"{alias}={sender}" for sender, alias in aliases.items())
+            # 加上代号说明后反而更长时不使用代号
+            if estimate_tokens(_render_lines(aliased, aliased_legend)) < tokens:
+                entries = aliased
+                legend = aliased_legend
+        record("alias", legend)
+    
+    return _render_lines(entries), legend, stats
+
+
+def format_compaction_savings(stats):
+    """把compact_transcript返回的统计列表格式化为各阶段节省的token数"""
+    savings = []
+    for item in stats:
+        saved = item["before"] - item["after"]
+        savings.append(f"{_COMPACTION_STAGE_NAMES[item['stage']]} {saved} token"
+                       f" ({saved / max(item['before'], 1) * 100:.0f}%)")
+    return "，".join(savings)
+
+
+def _with_legend(messages_text, legend):
+    """在消息文本前附上发送者代号说明"""
+    return f"{legend}\n{messages_text}" if legend else messages_text
+
+
+def _line_seconds(line):
+    """解析消息行开头的时间，返回当天的秒数，无法解析时返回None"""
+    match = _TIME_PREFIX_PATTERN.match(line)
+    if not match:
+        return None
+    hours, minutes, seconds = (int(x) for x in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def split_transcript(messages_text, chunk_tokens, overlap_tokens=0):
+    """按token预算把聊天记录切分为多个分块
+    
+    分块尽量在对话的自然边界处切分：当分块接近预算时，在分块末尾的一段范围内
+    选择与下一条消息时间间隔最大的位置切开。相邻分块之间可以保留少量重叠的消息，
+    以便每个分块都有足够的上下文。
+    
+    Args:
+        messages_text: 消息文本，每行一条消息
+        chunk_tokens: 每个分块的token预算
+        overlap_tokens: 相邻分块重叠部分的token预算
+        
+    Returns:
+        list: 分块文本列表
+    """
+    lines = [line for line in messages_text.split("\n") if line.strip()]
+    costs = [estimate_tokens(line) + 1 for line in lines]
+    seconds = [_line_seconds(line) for line in lines]
+    
+    chunks = []
+    start = 0
+    while start < len(lines):
+        # 在预算内尽量多地加入消息，至少包含一条消息
+        end = start
+        used = 0
+        while end < len(lines) and (end == start or used + costs[end] <= chunk_tokens):
+            used += costs[end]
+            end += 1
+        
+        # 还有剩余消息时，在分块后四分之一范围内寻找时间间隔最大的切分点
+        if end < len(lines):
+            search_from = max(start + 1, end - max(1, (end - start) // 4))
+            best_end = end
+            best_gap = -1
+            for cut in range(search_from, end + 1):
+                if seconds[cut - 1] is None or seconds[cut] is None:
+                    continue
+                gap = (seconds[cut] - seconds[cut - 1]) % 86400
+                if gap >= best_gap:
+                    best_gap = gap
+                    best_end = cut
+            end = best_end
+        
+        chunks.append("\n".join(lines[start:end]))
+        if end >= len(lines):
+            break
+        
+        # 下一个分块从重叠部分开始，但必须向前推进
+        next_start = end
+        overlap = 0
+        while next_start - 1 > start and overlap + costs[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += costs[next_start]
+        start = next_start
+    
+    return chunks
+
+
+class SummarizerAPIError(Exception):
+    """API返回错误状态码时抛出的异常
+    
+    Attributes:
+        status_code: HTTP状态码
+        retry_after: 服务器要求的重试等待时间（秒），没有指定时为None
+        retryable: 是否值得重试，请求本身有误（如密钥无效）时重试没有意义
+    """
+    
+    def __init__(self, message, status_code, retry_after=None, retryable=True):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+def _parse_retry_after(value):
+    """解析Retry-After响应头，只支持秒数格式，无法解析时返回None"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
 
 class DeepSeekSummarizer:
-    def __init__(self, api_key):
+    def __init__(self, api_key, chunk_tokens=6000, chunk_overlap=200, chunk_parallelism=4, cache=None,
+                 rate_limiter=None, compaction=None):
         """初始化DeepSeek API总结器
         
         Args:
             api_key: DeepSeek API密钥
+            chunk_tokens: 分块总结时每个分块的token预算，聊天记录超过该预算时自动分块总结
+            chunk_overlap: 相邻分块重叠部分的token预算
+            chunk_parallelism: 同时总结的分块数量
+            cache: 总结缓存（SummaryCache），相同的请求直接返回缓存结果，为None时不使用缓存
+            rate_limiter: 速率限制器（RateLimiter），可以在多个总结器之间共享，为None时不限制
+            compaction: 聊天记录压缩选项，作为关键字参数传给compact_transcript，为None时不压缩
         """
         self.api_key = api_key
         self.api_url = "https://api.deepseek.com/v1/chat/completions"  # 假设这是DeepSeek的API地址
+        self.model = "deepseek-chat"
+        self.temperature = 0.3  # 较低的温度以获得更确定性的输出
+        self.max_tokens = 1000
         self.max_retries = 3  # 最大重试次数
-        self.retry_delay = 2  # 重试延迟（秒）
+        self.retry_delay = 2  # 首次重试的基础延迟（秒），之后每次翻倍
+        self.max_retry_delay = 30  # 单次重试的最长等待时间（秒）
+        
+        # 分块总结配置
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.chunk_parallelism = max(1, chunk_parallelism)
+        self.chunk_summary_tokens = 800  # 每个分块总结的最大输出token数
+        self.context_tokens = 64000  # 模型的上下文长度，输入加输出超过该长度的请求不会发送
         
-    def summarize(self, messages_text, custom_prompt=None):
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.compaction = compaction
+        self.compaction_stats = {}  # 各压缩阶段累计的 {"before": token数, "after": token数}
+        
+        # 滚动总结的状态：{群聊名称: {"summary": 当前总结, "mark": 已总结的消息数, "prompt": 提示模板}}
+        self.rolling_state = {}
+        
+    def summarize(self, messages_text, custom_prompt=None, on_stream=None):
         """使用DeepSeek API对聊天记录进行总结
         
+        聊天记录超过分块预算时，先删除系统消息、表情和重复消息，仍然超过预算时自动切换为分块总结。
+        同步调用，内部运行asummarize。
+        
         Args:
             messages_text: 消息文本，每行一条消息
             custom_prompt: 自定义AI提示模板，如果为None则使用默认提示
+            on_stream: 流式输出回调，每生成一段内容就以当前已生成的全部文本调用一次，
+                为None时不使用流式输出；返回的总结与非流式模式相同
+            
+        Returns:
+            str: 总结的文本
+        """
+        return asyncio.run(self.asummarize(messages_text, custom_prompt, on_stream))
+    
+    def summarize_chunked(self, messages_text, custom_prompt=None, on_stream=None):
+        """分块总结聊天记录（map-reduce）
+        
+        先把聊天记录按token预算在对话边界处切分，并发总结各个分块，
+        再把各分块的总结合并为最终总结。
+        
+        Args:
+            messages_text: 消息文本，每行一条消息
+            custom_prompt: 自定义AI提示模板，如果为None则使用默认提示
+            on_stream: 流式输出回调，只用于最终的合并阶段
+            
+        Returns:
+            str: 总结的文本
+        """
+        return asyncio.run(self.asummarize_chunked(messages_text, custom_prompt, on_stream))
+    
+    def summarize_rolling(self, chat_name, message_lines, custom_prompt=None, on_stream=None):
+        """增量滚动总结聊天记录
+        
+        为每个群聊保存当前的滚动总结和已总结的消息位置（高水位）。
+        第一次总结时对全部消息进行总结，之后只把高水位之后的新消息合并进已有的总结，
+        避免每次都重新总结全部历史消息。
+        
+        Args:
+            chat_name: 群聊名称
+            message_lines: 按时间顺序排列的消息行列表，只会在末尾追加
+            custom_prompt: 自定义AI提示模板，如果为None则使用默认提示
+            on_stream: 流式输出回调，为None时不使用流式输出
+            
+        Returns:
+            str: 总结的文本
+        """
+        return asyncio.run(self.asummarize_rolling(chat_name, message_lines, custom_prompt, on_stream))
+    
+    async def asummarize(self, messages_text, custom_prompt=None, on_stream=None):
+        """summarize的异步版本
+        
+        重试等待使用asyncio.sleep，不占用线程，多个总结可以在同一个事件循环中并发进行。
+        取消任务时会中止正在进行的请求和重试等待，并抛出asyncio.CancelledError。
+        
+        Args:
+            messages_text: 消息文本，每行一条消息
+            custom_prompt: 自定义AI提示模板，如果为None则使用默认提示
+            on_stream: 流式输出回调，为None时不使用流式输出
             
         Returns:
             str: 总结的文本
@@ -28,6 +412,262 @@ class DeepSeekSummarizer:
         if not messages_text or messages_text.strip() == "":
             return "没有可用的聊天记录进行总结。"
         
+        try:
+            return await self._asummarize(messages_text, custom_prompt, on_stream)
+        except Exception as e:
+            # 所有重试都失败，返回错误信息
+            return f"{_FAILED_PREFIX}{str(e)}"
+    
+    async def asummarize_chunked(self, messages_text, custom_prompt=None, on_stream=None):
+        """summarize_chunked的异步版本"""
+        try:
+            messages_text, legend = self._compact(messages_text)
+            return await self._asummarize_chunked(messages_text, custom_prompt, on_stream, legend)
+        except Exception as e:
+            return f"{_FAILED_PREFIX}{str(e)}"
+    
+    async def asummarize_rolling(self, chat_name, message_lines, custom_prompt=None, on_stream=None):
+        """summarize_rolling的异步版本"""
+        if not message_lines:
+            return "没有可用的聊天记录进行总结。"
+        
+        state = self.rolling_state.get(chat_name)
+        # 消息记录被重置或提示模板改变时，重新进行完整总结
+        if state is None or state["mark"] > len(message_lines) or state["prompt"] != custom_prompt:
+            state = None
+        
+        try:
+            if state is None:
+                summary = await self._asummarize("\n".join(message_lines), custom_prompt, on_stream)
+            elif state["mark"] == len(message_lines):
+                # 没有新消息，直接返回已有的总结
+                return state["summary"]
+            else:
+                print(f"{chat_name} 增量总结 {len(message_lines) - state['mark']} 条新消息")
+                new_text = self._fit_budget("\n".join(message_lines[state["mark"]:]))
+                new_text, legend = self._compact(new_text)
+                # 新消息本身过长时，先总结新消息再合并
+                if self.chunk_tokens and estimate_tokens(new_text) > self.chunk_tokens:
+                    new_text = await self._asummarize_chunked(new_text, custom_prompt, legend=legend)
+                else:
+                    new_text = _with_legend(new_text, legend)
+                prompt = self._build_rolling_prompt(state["summary"], new_text, custom_prompt)
+                summary = await self._acall_api_with_retry(prompt, on_stream=on_stream)
+        except Exception as e:
+            return f"{_FAILED_PREFIX}{str(e)}"
+        
+        self.rolling_state[chat_name] = {
+            "summary": summary,
+            "mark": len(message_lines),
+            "prompt": custom_prompt
+        }
+        return summary
+    
+    def reset_rolling(self, chat_name=None):
+        """清除滚动总结的状态，chat_name为None时清除所有群聊"""
+        if chat_name is None:
+            self.rolling_state.clear()
+        else:
+            self.rolling_state.pop(chat_name, None)
+    
+    def start_new_transcript(self):
+        """开始新的监控会话时调用，保留已有的滚动总结
+        
+        新会话的消息列表从头开始，把所有群聊的高水位归零，下一次滚动总结时
+        新会话的全部消息都作为新消息合并进已有的总结。
+        """
+        for state in self.rolling_state.values():
+            state["mark"] = 0
+    
+    def _compact(self, messages_text):
+        """按配置压缩聊天记录，并输出和累计各阶段节省的token数
+        
+        Returns:
+            tuple: (压缩后的消息文本, 代号说明)
+        """
+        if self.compaction is None:
+            return messages_text, ""
+        
+        compacted_text, legend, stats = compact_transcript(messages_text, **self.compaction)
+        for item in stats:
+            total = self.compaction_stats.setdefault(item["stage"], {"before": 0, "after": 0})
+            total["before"] += item["before"]
+            total["after"] += item["after"]
+        if stats:
+            print("压缩聊天记录: " + format_compaction_savings(stats))
+        return compacted_text, legend
+    
+    def compaction_report(self):
+        """返回累计的各压缩阶段节省的token数，没有压缩过时返回空字符串"""
+        stats = [{"stage": stage, **total} for stage, total in self.compaction_stats.items()]
+        return format_compaction_savings(stats)
+    
+    def _fit_budget(self, messages_text):
+        """压缩后的聊天记录仍超过分块预算时，先删除低价值消息，尽量避免分块总结
+        
+        在压缩之前对原始聊天记录进行：压缩会把连续的表情合并为"[表情]×N"、把同一发送者的
+        连续消息合并为一行，合并后就无法再识别出表情和重复消息。
+        
+        Returns:
+            str: 处理后的消息文本（未压缩）
+        """
+        if not self.chunk_tokens:
+            return messages_text
+        
+        tokens = estimate_tokens(messages_text)
+        if tokens <= self.chunk_tokens:
+            return messages_text
+        if self.compaction is not None:
+            # 按压缩后的大小判断，压缩后不超过预算时不删除消息
+            compacted_text, legend, _ = compact_transcript(messages_text, **self.compaction)
+            tokens = estimate_tokens(_with_legend(compacted_text, legend))
+            if tokens <= self.chunk_tokens:
+                return messages_text
+        
+        trimmed_text, removed = trim_transcript(messages_text)
+        trimmed_tokens = estimate_tokens(trimmed_text)
+        print(f"聊天记录约 {tokens} token，超过预算 {self.chunk_tokens}，"
+              f"删除系统消息 {removed['system']} 条、表情 {removed['sticker']} 条、"
+              f"重复消息 {removed['duplicate']} 条后压缩前约 {trimmed_tokens} token")
+        # 全部消息都是低价值消息时保留原文，交给分块总结
+        return trimmed_text if trimmed_text else messages_text
+    
+    async def _asummarize(self, messages_text, custom_prompt=None, on_stream=None):
+        """总结聊天记录，失败时抛出异常
+        
+        压缩后超过分块预算时先删除低价值消息，再按配置压缩聊天记录，仍然超过预算时切换为分块总结。
+        """
+        messages_text = self._fit_budget(messages_text)
+        messages_text, legend = self._compact(messages_text)
+        if self.chunk_tokens and estimate_tokens(messages_text) > self.chunk_tokens:
+            return await self._asummarize_chunked(messages_text, custom_prompt, on_stream, legend)
+        
+        prompt = self._build_prompt(_with_legend(messages_text, legend), custom_prompt)
+        return await self._acall_api_with_retry(prompt, on_stream=on_stream)
+    
+    async def _asummarize_chunked(self, messages_text, custom_prompt=None, on_stream=None, legend=""):
+        """分块总结聊天记录，失败时抛出异常，代号说明会附加到每个分块"""
+        chunks = split_transcript(messages_text, self.chunk_tokens, self.chunk_overlap)
+        chunks = [_with_legend(chunk, legend) for chunk in chunks]
+        print(f"聊天记录较长，分为 {len(chunks)} 块进行总结")
+        
+        if len(chunks) == 1:
+            return await self._acall_api_with_retry(self._build_prompt(chunks[0], custom_prompt), on_stream=on_stream)
+        
+        partials = await self._amap_chunks(chunks, custom_prompt)
+        if not any(partials):
+            raise Exception(f"所有 {len(chunks)} 个分块的总结均未成功。")
+        
+        try:
+            return await self._areduce_partials(partials, custom_prompt, on_stream)
+        except Exception as e:
+            raise Exception(f"合并分块总结时出错: {str(e)}")
+    
+    async def _agather_limited(self, coroutines):
+        """并发运行多个协程，同时运行的数量不超过chunk_parallelism"""
+        semaphore = asyncio.Semaphore(self.chunk_parallelism)
+        
+        async def run(coroutine):
+            async with semaphore:
+                return await coroutine
+        
+        return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+    
+    async def _amap_chunks(self, chunks, custom_prompt=None):
+        """并发总结各个分块，失败的分块返回None"""
+        total = len(chunks)
+        
+        async def summarize_chunk(index):
+            prompt = self._build_chunk_prompt(chunks[index], index + 1, total, custom_prompt)
+            try:
+                return await self._acall_api_with_retry(prompt, self.chunk_summary_tokens)
+            except Exception as e:
+                print(f"第 {index + 1}/{total} 块总结失败: {str(e)}")
+                return None
+        
+        return await self._agather_limited(summarize_chunk(index) for index in range(total))
+    
+    async def _areduce_partials(self, partials, custom_prompt=None, on_stream=None):
+        """把分块总结合并为最终总结，合并内容超过预算时分组逐级合并"""
+        sections = []
+        for index, partial in enumerate(partials):
+            if partial is None:
+                sections.append(f"【第{index + 1}部分】（该部分总结失败）")
+            else:
+                sections.append(f"【第{index + 1}部分】\n{partial}")
+        
+        # 合并内容仍然过长时，先把相邻的分块总结分组合并
+        while len(sections) > 1 and estimate_tokens("\n\n".join(sections)) > self.chunk_tokens:
+            groups = []
+            group = []
+            for section in sections:
+                if group and estimate_tokens("\n\n".join(group + [section])) > self.chunk_tokens:
+                    groups.append(group)
+                    group = []
+                group.append(section)
+            groups.append(group)
+            if len(groups) == len(sections):
+                break
+            
+            reduced = await self._agather_limited(
+                self._acall_api_with_retry(self._build_reduce_prompt("\n\n".join(group), custom_prompt),
+                                           self.chunk_summary_tokens)
+                for group in groups
+            )
+            sections = [f"【第{index + 1}部分】\n{text}" for index, text in enumerate(reduced)]
+        
+        return await self._acall_api_with_retry(self._build_reduce_prompt("\n\n".join(sections), custom_prompt),
+                                                on_stream=on_stream)
+    
+    def _build_chunk_prompt(self, chunk_text, index, total, custom_prompt=None):
+        """构建分块总结（map阶段）的提示"""
+        focus = f"\n总结时请关注以下要求中涉及的内容：\n{custom_prompt}\n" if custom_prompt else ""
+        return f"""
+以下是一段微信群聊记录的第{index}/{total}部分。请按时间顺序提取这一部分的要点，
+保留项目名称、地址链接、任务步骤、时间节点等具体信息，不要遗漏细节，也不要编造内容。
+{focus}
+聊天记录：
+{chunk_text}
+
+请给出800字以内的要点摘要。
+"""
+    
+    def _build_reduce_prompt(self, partials_text, custom_prompt=None):
+        """构建合并分块总结（reduce阶段）的提示"""
+        instruction = custom_prompt or "请对这些内容进行总结，说明主要讨论的话题和项目、各项目的具体内容和细节，以及值得关注的信息。"
+        return f"""
+{instruction}
+
+以下是同一个微信群聊按时间顺序分段提取的要点，请结合前后各部分进行上下文关联，
+合并重复的信息，然后给出完整的总结。
+
+分段要点：
+{partials_text}
+
+请给出3000字以内的总结。
+"""
+    
+    def _build_rolling_prompt(self, previous_summary, new_text, custom_prompt=None):
+        """构建增量合并（滚动总结）的提示"""
+        instruction = custom_prompt or "请对群聊内容进行总结，说明主要讨论的话题和项目、各项目的具体内容和细节，以及值得关注的信息。"
+        return f"""
+{instruction}
+
+下面是该群聊此前聊天记录的总结，以及之后新增的聊天内容。请把新增内容合并到已有总结中，
+输出更新后的完整总结：保留已有总结中仍然有效的全部要点和细节，补充新的话题、项目和任务，
+如果新内容更正或补充了之前的信息，要进行上下文关联并更新相应部分。
+
+已有总结：
+{previous_summary}
+
+新增聊天内容：
+{new_text}
+
+请给出3000字以内的完整总结。
+"""
+    
+    def _build_prompt(self, messages_text, custom_prompt=None):
+        """构建单次总结的提示"""
         # 使用默认提示或自定义提示
         if custom_prompt:
             prompt = f"""
@@ -52,35 +692,103 @@ class DeepSeekSummarizer:
 
 请给出3000字以内的总结。
 """
+        return prompt
+    
+    def _retry_delay_for(self, attempt, error):
+        """计算第attempt次失败后的重试等待时间
+        
+        服务器通过Retry-After指定了等待时间时按其等待，否则使用带随机抖动的指数退避。
+        每个请求单独计算，不会影响其他请求。
+        """
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_delay)
+        delay = min(self.retry_delay * (2 ** attempt), self.max_retry_delay)
+        # 在退避时间的一半到全部之间随机取值，避免大量请求同时重试
+        return delay / 2 + random.uniform(0, delay / 2)
+    
+    async def _acall_api_with_retry(self, prompt, max_tokens=None, on_stream=None):
+        """调用API，失败时按退避策略重试
+        
+        启用缓存时，先按请求内容查找缓存，命中则不再调用API；只有成功的结果才会写入缓存。
+        阻塞的HTTP请求在线程池中执行，重试等待使用asyncio.sleep，不占用线程。
+        
+        Args:
+            prompt: 发送给API的提示文本
+            max_tokens: 最大输出token数，为None时使用默认值
+            on_stream: 流式输出回调，重试时会从头重新回调
+            
+        Returns:
+            str: API返回的文本
+            
+        Raises:
+            Exception: 如果所有重试都失败
+            asyncio.CancelledError: 如果任务被取消
+        """
+        # 超过上下文长度的请求必然失败，不发送请求
+        request_tokens = estimate_tokens(prompt) + (max_tokens or self.max_tokens)
+        if self.context_tokens and request_tokens > self.context_tokens:
+            raise Exception(f"提示内容过长（约 {request_tokens} token），超过模型上下文长度 {self.context_tokens}")
+        
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.model, prompt, self.temperature, max_tokens or self.max_tokens)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print("命中总结缓存，跳过API调用")
+                if on_stream is not None:
+                    on_stream(cached)
+                return cached
+        
+        loop = asyncio.get_running_loop()
         
         # 使用DeepSeek API，带重试机制
         for attempt in range(self.max_retries):
+            # 速率限制按输入和最大输出token数之和预约
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(request_tokens)
+            
+            # 任务取消时通知执行中的请求尽快中止
+            cancel_event = threading.Event()
             try:
-                return self._call_api(prompt)
+                result = await loop.run_in_executor(None, self._call_api, prompt, max_tokens, on_stream, cancel_event)
+                if cache_key is not None:
+                    self.cache.put(cache_key, result)
+                return result
+            except asyncio.CancelledError:
+                cancel_event.set()
+                raise
             except Exception as e:
                 error_message = str(e)
                 print(f"API调用失败 (尝试 {attempt+1}/{self.max_retries}): {error_message}")
                 
-                if attempt < self.max_retries - 1:
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after is not None and self.rate_limiter is not None:
+                    # 服务器要求等待时，让共享限制器的所有调用方一起暂停
+                    self.rate_limiter.pause(retry_after)
+                
+                if attempt < self.max_retries - 1 and getattr(e, "retryable", True):
                     # 如果不是最后一次尝试，则等待后重试
-                    print(f"等待 {self.retry_delay} 秒后重试...")
-                    time.sleep(self.retry_delay)
-                    # 增加重试间隔，避免频繁请求
-                    self.retry_delay *= 1.5
+                    delay = self._retry_delay_for(attempt, e)
+                    print(f"等待 {delay:.1f} 秒后重试...")
+                    await asyncio.sleep(delay)
                 else:
-                    # 所有重试都失败，返回错误信息
-                    return f"总结生成失败: {error_message}\n\n尝试了 {self.max_retries} 次调用API但均未成功。"
+                    raise Exception(f"{error_message}\n\n尝试了 {attempt + 1} 次调用API但均未成功。")
     
-    def _call_api(self, prompt):
+    def _call_api(self, prompt, max_tokens=None, on_stream=None, cancel_event=None):
         """执行实际的API调用
         
         Args:
             prompt: 发送给API的提示文本
+            max_tokens: 最大输出token数，为None时使用默认值
+            on_stream: 流式输出回调，不为None时使用流式（SSE）模式请求
+            cancel_event: 取消事件（threading.Event），被设置后中止读取流式响应
             
         Returns:
             str: API返回的总结文本
             
         Raises:
+            SummarizerAPIError: 如果API返回错误状态码
             Exception: 如果API调用失败
         """
         headers = {
@@ -89,26 +797,30 @@ class DeepSeekSummarizer:
         }
         
         payload = {
-            "model": "deepseek-chat",  # 使用适当的模型
+            "model": self.model,  # 使用适当的模型
             "messages": [
                 {
                     "role": "user",
                     "content": prompt
                 }
             ],
-            "temperature": 0.3,  # 较低的温度以获得更确定性的输出
-            "max_tokens": 1000
+            "temperature": self.temperature,  # 较低的温度以获得更确定性的输出
+            "max_tokens": max_tokens or self.max_tokens
         }
+        if on_stream is not None:
+            payload["stream"] = True
         
-        response = requests.post(
+        response = http_client.post(
             self.api_url,
             headers=headers,
             data=json.dumps(payload),
-            timeout=30  # 添加超时设置
+            stream=on_stream is not None  # 超时使用http_client中配置的默认值（http_timeout）
         )
         
         # 检查请求是否成功
-        if response.status_code == 200:
+        if response.status_code == 200 and on_stream is not None:
+            return self._read_stream(response, on_stream, cancel_event)
+        elif response.status_code == 200:
             try:
                 data = response.json()
                 if "choices" in data and len(data["choices"]) > 0:
@@ -118,14 +830,60 @@ class DeepSeekSummarizer:
             except json.JSONDecodeError:
                 raise Exception("无法解析API返回的JSON数据")
         elif response.status_code == 401:
-            raise Exception("API密钥无效或未授权")
+            raise SummarizerAPIError("API密钥无效或未授权", 401, retryable=False)
         elif response.status_code == 429:
-            raise Exception("API请求频率过高，请稍后再试")
-        elif response.status_code >= 2000:
-            raise Exception(f"DeepSeek服务器错误: {response.status_code}")
+            raise SummarizerAPIError("API请求频率过高，请稍后再试", 429,
+                                     retry_after=_parse_retry_after(response.headers.get("Retry-After")))
+        elif response.status_code >= 500:
+            raise SummarizerAPIError(f"DeepSeek服务器错误: {response.status_code}", response.status_code,
+                                     retry_after=_parse_retry_after(response.headers.get("Retry-After")))
         else:
-            raise Exception(f"API请求失败: HTTP {response.status_code}, {response.text}")
+            raise SummarizerAPIError(f"API请求失败: HTTP {response.status_code}, {response.text}",
+                                     response.status_code, retryable=False)
             
+    def _read_stream(self, response, on_stream, cancel_event=None):
+        """读取流式（SSE）响应
+        
+        每收到一段内容就以当前已生成的全部文本调用回调，读取完成后返回与非流式模式相同的文本。
+        
+        Args:
+            response: 流式响应对象
+            on_stream: 流式输出回调
+            cancel_event: 取消事件，被设置后关闭连接并停止读取
+            
+        Returns:
+            str: 生成的完整文本
+        """
+        # SSE响应通常不声明字符集，需要显式按UTF-8解码
+        response.encoding = "utf-8"
+        parts = []
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise Exception("总结已取消")
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    raise Exception("无法解析API返回的流式数据")
+                
+                choices = chunk.get("choices") or []
+                if choices:
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        on_stream("".join(parts))
+        finally:
+            response.close()
+        
+        if not parts:
+            raise Exception("API返回的数据格式不正确")
+        return "".join(parts).strip()
+    
     def is_api_key_valid(self):
         """测试API密钥是否有效
         
@@ -140,7 +898,7 @@ class DeepSeekSummarizer:
             }
             
             payload = {
-                "model": "deepseek-chat",
+                "model": self.model,
                 "messages": [
                     {
                         "role": "user",
@@ -150,11 +908,13 @@ class DeepSeekSummarizer:
                 "max_tokens": 5
             }
             
-            response = requests.post(
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire_blocking(estimate_tokens("测试") + 5)
+            
+            response = http_client.post(
                 self.api_url,
                 headers=headers,
-                data=json.dumps(payload),
-                timeout=10  # 添加超时设置
+                data=json.dumps(payload)  # 超时使用http_client中配置的默认值（http_timeout）
             )
             
             return response.status_code == 200
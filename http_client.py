@@ -0,0 +1,86 @@
+import threading
+
+# 连接池配置
+_options = {
+    "pool_connections": 4,  # 缓存连接池的主机数量
+    "pool_maxsize": 16,  # 每个主机最多保持的连接数，应不小于并发请求数
+    "timeout": 30  # 默认超时时间（秒），可以是 (连接超时, 读取超时) 元组
+}
+
+_session = None
+_lock = threading.Lock()
+
+
+def configure(pool_connections=None, pool_maxsize=None, timeout=None):
+    """配置共享HTTP会话的连接池和默认超时
+
+    修改配置后会关闭现有会话，下次请求时按新配置重新创建。
+
+    Args:
+        pool_connections: 缓存连接池的主机数量
+        pool_maxsize: 每个主机最多保持的连接数
+        timeout: 默认超时时间（秒）
+    """
+    global _session
+    with _lock:
+        if pool_connections is not None:
+            _options["pool_connections"] = pool_connections
+        if pool_maxsize is not None:
+            _options["pool_maxsize"] = pool_maxsize
+        if timeout is not None:
+            _options["timeout"] = timeout
+
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session():
+    """获取共享的HTTP会话
+
+    会话保持长连接并复用连接池，避免每次请求都重新进行TCP和TLS握手。
+    requests.Session可以在多个线程之间共享用于发送请求。
+
+    Returns:
+        requests.Session: 共享的HTTP会话
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                # requests导入较慢，第一次发送请求时才导入，不影响程序启动
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=_options["pool_connections"],
+                                      pool_maxsize=_options["pool_maxsize"])
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def post(url, timeout=None, **kwargs):
+    """使用共享会话发送POST请求
+
+    Args:
+        url: 请求地址
+        timeout: 超时时间（秒），为None时使用默认超时
+        **kwargs: 传递给requests的其他参数
+
+    Returns:
+        requests.Response: 响应对象
+    """
+    if timeout is None:
+        timeout = _options["timeout"]
+    return get_session().post(url, timeout=timeout, **kwargs)
+
+
+def close():
+    """关闭共享会话及其连接池"""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import zlib
+import struct
+
+# 每条记录的头部：内容长度和CRC32校验值，均为4字节大端无符号整数
+_HEADER = struct.Struct(">II")
+
+
+class MessageJournal:
+    """捕获消息的预写日志
+
+    每条记录以 "长度 + CRC32 + JSON内容" 的格式追加到文件末尾。写入只进入缓冲区，
+    按间隔批量刷新并fsync到磁盘，捕获消息的开销很小；程序崩溃时最多丢失一个刷新间隔内的消息。
+    启动时通过replay读取日志，末尾写了一半的记录会被丢弃。
+
+    日志只应在一个线程中写入。
+    """
+
+    def __init__(self, path="messages.journal", flush_interval=1.0, truncate=False):
+        """打开日志文件
+
+        Args:
+            path: 日志文件路径
+            flush_interval: 刷新到磁盘的最长间隔（秒）
+            truncate: 是否清空已有的日志
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._file = open(path, "wb" if truncate else "ab")
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def append(self, record):
+        """追加一条记录，间隔到期时刷新到磁盘
+
+        Args:
+            record: 可以序列化为JSON的字典
+        """
+        payload = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        self._file.write(_HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._file.write(payload)
+        self._dirty = True
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        """距离上次刷新超过间隔时刷新到磁盘"""
+        if self._dirty and time.monotonic() - self._last_sync >= self.flush_interval:
+            self.sync()
+
+    def sync(self):
+        """把缓冲区中的记录写入磁盘并fsync"""
+        if not self._dirty:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        """刷新剩余的记录并关闭文件"""
+        if self._file.closed:
+            return
+        self.sync()
+        self._file.close()
+
+    @staticmethod
+    def replay(path):
+        """读取日志中的全部完整记录
+
+        遇到写了一半或校验失败的记录时停止读取，并把文件截断到最后一条完整记录，
+        之后可以继续在末尾追加。
+
+        Args:
+            path: 日志文件路径
+
+        Returns:
+            list: 记录列表，日志不存在时返回空列表
+        """
+        if not os.path.exists(path):
+            return []
+
+        records = []
+        valid_end = 0
+        with open(path, "rb") as f:
+            data = f.read()
+
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            length, checksum = _HEADER.unpack_from(data, offset)
+            start = offset + _HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            try:
+                records.append(json.loads(payload.decode("utf-8")))
+            except ValueError:
+                break
+            offset = start + length
+            valid_end = offset
+
+        if valid_end < len(data):
+            print(f"消息日志末尾有 {len(data) - valid_end} 字节不完整的记录，已丢弃")
+            with open(path, "r+b") as f:
+                f.truncate(valid_end)
+        return records
+
+    @staticmethod
+    def clear(path):
+        """清空日志，日志中的消息已经全部保存到数据库后调用"""
+        if os.path.exists(path):
+            with open(path, "wb") as f:
+                os.fsync(f.fileno())
@@ -0,0 +1,335 @@
+import json
+import time
+import queue
+import sqlite3
+import threading
+
+from text_search import tokenize_for_index, build_match_query
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    ended REAL,
+    chats TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL,
+    chat_name TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    seq INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session_chat ON messages (session_id, chat_name, timestamp);
+-- 按会话翻页读取消息时使用，与iter_messages的排序 (timestamp, id) 一致，不需要临时排序
+CREATE INDEX IF NOT EXISTS idx_messages_session_time ON messages (session_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_messages_chat_time ON messages (chat_name, timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_time ON messages (timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages (sender, timestamp);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_session_seq ON messages (session_id, seq);
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER,
+    chat_name TEXT NOT NULL,
+    title TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_summaries_chat_time ON summaries (chat_name, timestamp);
+-- 全文索引只保存分词结果（contentless），原文从messages/summaries表按rowid读取
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='', tokenize='unicode61');
+CREATE VIRTUAL TABLE IF NOT EXISTS summaries_fts USING fts5(text, content='', tokenize='unicode61');
+"""
+
+
+class MessageStore:
+    """基于SQLite（WAL模式）的消息存储
+
+    所有捕获的消息只追加写入数据库，由后台写入线程批量提交，捕获消息时不需要等待磁盘。
+    每次监控是一个会话，程序重启后可以恢复上一次会话的消息，总结和导出可以按时间范围查询。
+    消息和总结在写入时同步更新FTS5全文索引，中文按二元组切分。
+    """
+
+    def __init__(self, path="messages.db", batch_size=200, flush_interval=0.5):
+        """打开消息存储并启动写入线程
+
+        Args:
+            path: 数据库文件路径
+            batch_size: 每次事务最多写入的消息数
+            flush_interval: 写入线程等待更多消息的最长时间（秒）
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue()
+        self._read_lock = threading.Lock()
+        self._read_conn = self._connect()
+        self._migrate()
+        self._read_conn.executescript(_SCHEMA)
+        self._backfill_search_index()
+
+        self._writer = threading.Thread(target=self._write_loop, name="MessageStoreWriter", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL模式下NORMAL同步级别只在检查点时fsync，断电最多丢失最近提交的事务，不会损坏数据库
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _migrate(self):
+        """为旧版本的数据库添加新的列"""
+        columns = [row["name"] for row in self._read_conn.execute("PRAGMA table_info(messages)")]
+        if columns and "seq" not in columns:
+            self._read_conn.execute("ALTER TABLE messages ADD COLUMN seq INTEGER")
+            self._read_conn.commit()
+
+    def _backfill_search_index(self, batch_size=5000):
+        """为还没有写入全文索引的消息（如旧版本保存的消息）建立索引"""
+        conn = self._read_conn
+        while True:
+            last_id = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM messages_fts").fetchone()[0]
+            rows = conn.execute("SELECT id, sender, content FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+                                (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            with conn:
+                conn.executemany("INSERT INTO messages_fts (rowid, text) VALUES (?, ?)",
+                                 [(row["id"], tokenize_for_index(f"{row['sender']} {row['content']}")) for row in rows])
+
+    def _write_loop(self):
+        """写入线程主函数，把队列中的消息按批写入数据库"""
+        conn = self._connect()
+        closing = False
+        while not closing:
+            item = self._queue.get()
+            batch = []
+            done = 1
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    closing = True
+                else:
+                    batch.append(item)
+                if closing or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    done += 1
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    with conn:
+                        for item in batch:
+                            cursor = conn.execute(
+                                "INSERT OR IGNORE INTO messages (session_id, chat_name, sender, content, timestamp, seq) "
+                                "VALUES (?, ?, ?, ?, ?, ?)", item)
+                            # 重复的消息不会插入，也不需要索引
+                            if cursor.rowcount:
+                                conn.execute("INSERT INTO messages_fts (rowid, text) VALUES (?, ?)",
+                                             (cursor.lastrowid, tokenize_for_index(f"{item[2]} {item[3]}")))
+                except sqlite3.Error as e:
+                    print(f"写入消息数据库失败: {str(e)}")
+            for _ in range(done):
+                self._queue.task_done()
+        conn.close()
+
+    def start_session(self, chats):
+        """开始新的监控会话
+
+        Args:
+            chats: 监控的群聊名称列表
+
+        Returns:
+            int: 会话ID
+        """
+        with self._read_lock, self._read_conn:
+            cursor = self._read_conn.execute(
+                "INSERT INTO sessions (started, chats) VALUES (?, ?)",
+                (time.time(), json.dumps(list(chats), ensure_ascii=False)))
+            return cursor.lastrowid
+
+    def end_session(self, session_id):
+        """标记会话结束"""
+        with self._read_lock, self._read_conn:
+            self._read_conn.execute("UPDATE sessions SET ended = ? WHERE id = ?", (time.time(), session_id))
+
+    def latest_session(self):
+        """返回最近一次会话，没有会话时返回None
+
+        Returns:
+            dict: {"id": 会话ID, "started": 开始时间, "ended": 结束时间（未正常结束时为None）, "chats": 群聊列表}
+        """
+        with self._read_lock:
+            row = self._read_conn.execute("SELECT * FROM sessions ORDER BY id DESC LIMIT 1").fetchone()
+        if row is None:
+            return None
+        return {"id": row["id"], "started": row["started"], "ended": row["ended"], "chats": json.loads(row["chats"])}
+
+    def add_message(self, session_id, chat_name, sender, content, timestamp, seq=None):
+        """追加一条消息，由写入线程批量写入数据库
+
+        seq是消息在会话中的序号，同一会话中序号相同的消息只保存一次，重放消息日志时不会重复写入。
+        """
+        self._queue.put((session_id, chat_name, sender, content, timestamp, seq))
+
+    def flush(self):
+        """等待队列中的消息全部写入数据库"""
+        self._queue.join()
+
+    def iter_messages(self, session_id=None, chat_name=None, start=None, end=None, sender=None, batch_size=1000):
+        """按条件逐批查询消息，按时间顺序返回，不会一次性把所有消息读入内存
+
+        Args:
+            session_id: 会话ID，为None时不限制
+            chat_name: 群聊名称，为None时不限制
+            start: 起始时间戳（包含），为None时不限制
+            end: 结束时间戳（不包含），为None时不限制
+            sender: 发送者，为None时不限制
+            batch_size: 每次从数据库读取的条数
+
+        Yields:
+            dict: {"chat_name", "sender", "content", "timestamp"}
+        """
+        conditions = []
+        params = []
+        for column, operator, value in (("session_id", "=", session_id), ("chat_name", "=", chat_name),
+                                        ("timestamp", ">=", start), ("timestamp", "<", end),
+                                        ("sender", "=", sender)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # 按 (时间, ID) 翻页，每页单独查询，不长时间占用读连接
+        last = (float("-inf"), 0)
+        while True:
+            page_where = f"{where} {'AND' if where else 'WHERE'} (timestamp, id) > (?, ?)"
+            with self._read_lock:
+                rows = self._read_conn.execute(
+                    f"SELECT id, chat_name, sender, content, timestamp FROM messages {page_where} "
+                    f"ORDER BY timestamp, id LIMIT ?", params + [last[0], last[1], batch_size]).fetchall()
+            for row in rows:
+                yield {"chat_name": row["chat_name"], "sender": row["sender"],
+                       "content": row["content"], "timestamp": row["timestamp"]}
+            if len(rows) < batch_size:
+                return
+            last = (rows[-1]["timestamp"], rows[-1]["id"])
+
+    def get_messages(self, session_id=None, chat_name=None, start=None, end=None, sender=None):
+        """按条件查询消息，参数与iter_messages相同
+
+        Returns:
+            list: 消息列表，每条为 {"sender", "content", "timestamp"}
+        """
+        return [{"sender": msg["sender"], "content": msg["content"], "timestamp": msg["timestamp"]}
+                for msg in self.iter_messages(session_id, chat_name, start, end, sender)]
+
+    def count_messages(self, session_id):
+        """统计会话中每个群聊的消息数
+
+        Returns:
+            dict: {群聊名称: 消息数}
+        """
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT chat_name, COUNT(*) AS count FROM messages WHERE session_id = ? GROUP BY chat_name",
+                (session_id,)).fetchall()
+        return {row["chat_name"]: row["count"] for row in rows}
+
+    def load_chat_counts(self, session_id):
+        """统计会话中每个群聊的消息数，包括会话中没有消息的群聊
+
+        恢复会话时只读取消息数，消息在总结和导出时再从数据库读取。
+
+        Returns:
+            dict: {群聊名称: 消息数}
+        """
+        with self._read_lock:
+            row = self._read_conn.execute("SELECT chats FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        chat_counts = {chat: 0 for chat in json.loads(row["chats"])} if row else {}
+        chat_counts.update(self.count_messages(session_id))
+        return chat_counts
+
+    def add_summary(self, session_id, chat_name, title, summary, timestamp):
+        """保存一条总结并加入全文索引"""
+        with self._read_lock, self._read_conn:
+            cursor = self._read_conn.execute(
+                "INSERT INTO summaries (session_id, chat_name, title, summary, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (session_id, chat_name, title, summary, timestamp))
+            self._read_conn.execute("INSERT INTO summaries_fts (rowid, text) VALUES (?, ?)",
+                                    (cursor.lastrowid, tokenize_for_index(f"{title} {summary}")))
+
+    def _search(self, table, columns, query, chat_name, start, end, limit):
+        match = build_match_query(query)
+        if match is None:
+            return []
+
+        conditions = [f"{table}_fts MATCH ?"]
+        params = [match]
+        for column, operator, value in (("chat_name", "=", chat_name), ("timestamp", ">=", start),
+                                        ("timestamp", "<", end)):
+            if value is not None:
+                conditions.append(f"t.{column} {operator} ?")
+                params.append(value)
+
+        # 按rowid倒序即按写入时间倒序，FTS5可以直接倒序扫描，不需要先取出全部匹配结果再排序；
+        # CROSS JOIN固定以全文索引作为外层循环，避免按群聊索引逐行执行MATCH
+        sql = (f"SELECT {', '.join('t.' + column for column in columns)} FROM {table}_fts f "
+               f"CROSS JOIN {table} t ON t.id = f.rowid WHERE {' AND '.join(conditions)} "
+               f"ORDER BY f.rowid DESC LIMIT ?")
+
+        with self._read_lock:
+            if start is not None or end is not None:
+                # 先用时间索引算出ID范围，FTS5只需要扫描这个范围内的匹配结果
+                id_range = self._read_conn.execute(
+                    f"SELECT MIN(id), MAX(id) FROM {table} WHERE timestamp >= ? AND timestamp < ?",
+                    (start if start is not None else float("-inf"),
+                     end if end is not None else float("inf"))).fetchone()
+                if id_range[0] is None:
+                    return []
+                sql = sql.replace(" ORDER BY", " AND f.rowid BETWEEN ? AND ? ORDER BY")
+                params.extend(id_range)
+            rows = self._read_conn.execute(sql, params + [limit]).fetchall()
+        return [dict(row) for row in rows]
+
+    def search_messages(self, query, chat_name=None, start=None, end=None, limit=100):
+        """全文搜索消息（包括发送者），最新的消息在前
+
+        Args:
+            query: 查询文本，用空格分隔的关键词都必须出现
+            chat_name: 只搜索指定的群聊，为None时搜索全部
+            start: 起始时间戳（包含），为None时不限制
+            end: 结束时间戳（不包含），为None时不限制
+            limit: 最多返回的结果数
+
+        Returns:
+            list: 消息列表，每条为 {"chat_name", "sender", "content", "timestamp"}
+        """
+        return self._search("messages", ("chat_name", "sender", "content", "timestamp"),
+                            query, chat_name, start, end, limit)
+
+    def search_summaries(self, query, chat_name=None, start=None, end=None, limit=100):
+        """全文搜索总结，参数与search_messages相同
+
+        Returns:
+            list: 总结列表，每条为 {"chat_name", "title", "summary", "timestamp"}
+        """
+        return self._search("summaries", ("chat_name", "title", "summary", "timestamp"),
+                            query, chat_name, start, end, limit)
+
+    def close(self):
+        """写入剩余的消息并关闭数据库"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        with self._read_lock:
+            self._read_conn.close()
@@ -0,0 +1,551 @@
+"""监控循环和总结流程
+
+不依赖Qt，图形界面（wx_monitor.py）和无界面模式（wx_headless.py）共用。
+进度和结果通过回调函数通知调用方。
+"""
+import json
+import time
+import asyncio
+import datetime
+
+import http_client
+from chat_summarizer import is_failed_summary
+from message_journal import MessageJournal
+from poll_scheduler import PollScheduler
+
+
+def send_feishu_webhook(webhook_url, chat_name, summary, timestamp):
+    """以消息卡片的形式把总结发送到飞书Webhook"""
+    # 飞书消息卡片格式
+    post_data = {
+        "msg_type": "interactive",
+        "card": {
+            "config": {
+                "wide_screen_mode": True
+            },
+            "header": {
+                "title": {
+                    "tag": "plain_text",
+                    "content": f"微信群聊总结 - {chat_name}"
+                },
+                "template": "blue"
+            },
+            "elements": [
+                {
+                    "tag": "div",
+                    "text": {
+                        "tag": "lark_md",
+                        "content": f"**时间**: {timestamp}"
+                    }
+                },
+                {
+                    "tag": "div",
+                    "text": {
+                        "tag": "lark_md",
+                        "content": summary  # 飞书支持markdown，星号会自动转为加粗
+                    }
+                }
+            ]
+        }
+    }
+
+    # 发送请求
+    response = http_client.post(
+        webhook_url,
+        headers={"Content-Type": "application/json"},
+        data=json.dumps(post_data)
+    )
+
+    if response.status_code != 200:
+        raise Exception(f"Webhook请求失败: {response.status_code}, {response.text}")
+
+
+def chat_records_from_journal(records):
+    """从消息日志记录中重建最后一次会话的聊天记录"""
+    chat_records = {}
+    for record in records:
+        if "chats" in record:
+            # 会话开始记录，之前的会话不再需要
+            chat_records = {chat: [] for chat in record["chats"]}
+        elif "chat" in record:
+            chat_records.setdefault(record["chat"], []).append({
+                "sender": record["sender"],
+                "content": record["content"],
+                "timestamp": record["timestamp"]
+            })
+    return chat_records
+
+
+def replay_journal_into_store(records, store, journal_path):
+    """把消息日志中的消息写入数据库，然后清空日志
+
+    数据库按 (会话, 序号) 去重，已经写入的消息不会重复保存。
+
+    Returns:
+        int: 重放的消息数
+    """
+    recovered = 0
+    for record in records:
+        if "chat" in record and record.get("session") is not None:
+            store.add_message(record["session"], record["chat"], record["sender"],
+                              record["content"], record["timestamp"], record["seq"])
+            recovered += 1
+    if records:
+        store.flush()
+        MessageJournal.clear(journal_path)
+    return recovered
+
+
+class MonitorLoop:
+    """轮询监控群聊的新消息
+
+    由PollScheduler决定下一个检查的群聊：活跃的群聊检查得更频繁，安静的群聊逐渐放慢，
+    检查总次数受预算限制。每个检测间隔读取一次会话列表的未读数和最后一条消息预览，
+    只切换到有变化的群聊，没有变化的群聊跳过检查。listen_chats中的群聊打开为独立聊天窗口，
+    每隔listen_interval秒并行读取一次，不参与主窗口的调度。直到达到监控时长或调用stop时结束。
+    """
+
+    def __init__(self, monitor, chats, duration, check_interval=10, journal=None, session_id=None,
+                 on_message=None, on_status=None, schedule=None, precheck=True,
+                 listen_chats=None, listen_interval=1.0):
+        """初始化监控循环
+
+        Args:
+            monitor: 微信监控器（WeChatMonitor）
+            chats: 监控的群聊名称列表
+            duration: 监控时长（秒）
+            check_interval: 检测间隔（秒）
+            journal: 消息日志（MessageJournal），捕获的消息先写入日志，为None时不记录
+            session_id: 当前监控会话的ID，写入消息日志
+            on_message: 新消息回调，参数为 (群聊名称, 发送者, 内容, 时间戳, 序号)
+            on_status: 状态信息回调，参数为状态文本
+            schedule: 传给PollScheduler的调度选项，如min_interval、max_interval、target_messages、budget_per_minute
+            precheck: 是否先读取会话列表，只检查有变化的群聊
+            listen_chats: 打开为独立聊天窗口的群聊，只有同时在chats中的群聊有效，后端不支持时仍在主窗口中检查
+            listen_interval: 读取独立聊天窗口的间隔（秒）
+        """
+        self.monitor = monitor
+        self.chats = chats
+        self.duration = duration
+        self.running = True
+        # 使用传入的检测间隔
+        self.check_interval = check_interval  # 检测间隔，单位秒
+        # 调试模式
+        self.debug_mode = True
+        # 捕获的消息先写入消息日志，崩溃后可以恢复
+        self.journal = journal
+        self.session_id = session_id
+        self.seq = 0  # 本次会话中已捕获的消息数，作为消息序号
+        self.on_message = on_message or (lambda *args: None)
+        self.on_status = on_status or print
+        self.schedule = schedule or {}
+        self.scheduler = None
+        self.precheck = precheck
+        self.snapshots = 0  # 读取会话列表的次数
+        self.listen_chats = [chat for chat in (listen_chats or []) if chat in chats]
+        self.listen_interval = listen_interval
+        self.listen_reads = 0  # 读取独立聊天窗口的次数
+
+    def log(self, message):
+        """输出调试日志"""
+        if self.debug_mode:
+            print(f"[监控线程] {message}")
+            self.on_status(f"调试: {message}")
+
+    def _emit_messages(self, chat_name, messages):
+        """为新消息分配序号，写入消息日志并通知调用方"""
+        for msg in messages:
+            self.seq += 1
+            if self.journal is not None:
+                self.journal.append({
+                    "session": self.session_id,
+                    "seq": self.seq,
+                    "chat": chat_name,
+                    "sender": msg["sender"],
+                    "content": msg["content"],
+                    "timestamp": msg["timestamp"]
+                })
+            self.on_message(chat_name, msg["sender"], msg["content"], msg["timestamp"], self.seq)
+
+    def _open_listen_windows(self):
+        """把listen_chats打开为独立聊天窗口，返回成功打开的群聊"""
+        listened = []
+        for chat_name in self.listen_chats:
+            if self.monitor.open_listen_window(chat_name):
+                listened.append(chat_name)
+                self.log(f"已为群聊 {chat_name} 打开独立聊天窗口")
+            else:
+                self.on_status(f"无法为群聊 {chat_name} 打开独立聊天窗口，改为在主窗口中检查")
+        return listened
+
+    def _read_listen_windows(self, listened, listen_errors, scheduler):
+        """并行读取所有独立聊天窗口，多次读取失败的窗口关闭后改为在主窗口中检查"""
+        self.listen_reads += 1
+        for chat_name, result in self.monitor.read_listen_windows().items():
+            if result["error"] is not None:
+                listen_errors[chat_name] += 1
+                self.log(f"读取 {chat_name} 的独立聊天窗口出错: {result['error']}")
+                if listen_errors[chat_name] >= 3:
+                    self.on_status(f"群聊 {chat_name} 的独立聊天窗口多次读取失败，改为在主窗口中检查")
+                    self.monitor.close_listen_window(chat_name)
+                    listened.remove(chat_name)
+                    scheduler.add(chat_name)
+                continue
+            listen_errors[chat_name] = 0
+            if result["overflowed"]:
+                self.on_status(f"警告: 群聊 {chat_name} 两次读取之间的新消息过多，可能有消息遗漏，请缩短独立窗口的读取间隔")
+            if result["messages"]:
+                self._emit_messages(chat_name, result["messages"])
+                self.on_status(f"已读取 {chat_name} 的 {len(result['messages'])} 条新消息")
+
+    def run(self):
+        """运行监控循环，监控结束或出错时返回
+
+        Returns:
+            bool: 是否正常结束（监控时间已到或被停止）
+        """
+        start_time = time.time()
+        end_time = start_time + self.duration
+
+        self.on_status(f"开始监控 {len(self.chats)} 个群聊，预计结束时间: {datetime.datetime.fromtimestamp(end_time).strftime('%H:%M:%S')}")
+        self.log(f"监控线程启动，检测间隔: {self.check_interval}秒")
+
+        # 监控的群聊名称不会被当作其他群聊切换后显示的标题
+        self.monitor.known_chats.update(self.chats)
+
+        # 打开为独立聊天窗口的群聊不需要在主窗口中切换
+        listened = self._open_listen_windows()
+        listen_errors = {chat: 0 for chat in listened}
+        next_listen = time.monotonic()
+
+        self.scheduler = PollScheduler([chat for chat in self.chats if chat not in listened],
+                                       self.check_interval, **self.schedule)
+        scheduler = self.scheduler
+        chat_error_count = {chat: 0 for chat in self.chats}  # 记录每个群聊的错误次数
+        max_error_count = 3  # 最大错误次数
+        last_minutes = None
+
+        # 会话列表预检
+        precheck = self.precheck
+        snapshot = None
+        snapshot_time = None
+        snapshot_cycle = max(self.check_interval, 1.0)  # 读取会话列表的最短间隔（秒）
+        seen = {}  # 每个群聊上次检查时会话列表中的 (最后一条消息预览, 时间)
+        polled_at = {}  # 每个群聊上次检查的时间
+
+        def changed(chat_name):
+            """会话列表显示群聊在上次检查之后有新消息"""
+            new_count, content, time_text = snapshot[chat_name]
+            return new_count > 0 or (content, time_text) != seen[chat_name]
+
+        try:
+            while self.running and time.time() < end_time:
+                # 计算剩余时间，每分钟更新一次状态
+                remaining = int(end_time - time.time())
+                minutes = remaining // 60
+                if minutes != last_minutes and minutes > 0:
+                    last_minutes = minutes
+                    self.on_status(f"监控中，剩余时间: {minutes} 分钟")
+
+                # 到时间时并行读取所有独立聊天窗口
+                if listened and time.monotonic() >= next_listen:
+                    self._read_listen_windows(listened, listen_errors, scheduler)
+                    next_listen = time.monotonic() + self.listen_interval
+
+                # 每个周期读取一次会话列表，有变化的群聊立即安排检查
+                if precheck and (snapshot_time is None or time.monotonic() - snapshot_time >= snapshot_cycle):
+                    snapshot = self.monitor.get_session_snapshot()
+                    snapshot_time = time.monotonic()
+                    if snapshot is None:
+                        precheck = False
+                        self.log("无法读取会话列表的未读数，每次都切换到群聊检查")
+                    else:
+                        self.snapshots += 1
+                        for chat in self.chats:
+                            if chat in snapshot and chat in seen and changed(chat):
+                                scheduler.wake(chat)
+
+                # 等待下一个到期的群聊
+                chat_name, ready_at = scheduler.peek()
+                wait = ready_at - scheduler.clock() if chat_name is not None else end_time - time.time()
+                if listened:
+                    wait = min(wait, next_listen - time.monotonic())
+                if wait > 0:
+                    # 休眠前把已捕获的消息刷新到磁盘
+                    if self.journal is not None:
+                        self.journal.sync()
+                    # 分段休眠，及时响应停止请求
+                    time.sleep(min(wait, 1.0, max(0.0, end_time - time.time())))
+                    continue
+                if chat_name is None:
+                    continue
+
+                scheduler.pop()
+
+                # 会话列表显示没有变化的群聊跳过本次检查，但最长间隔内至少检查一次，
+                # 避免预览相同的重复消息被漏掉；上次检查之后还没有读取过会话列表时等待下一次读取
+                if precheck and chat_name in snapshot and chat_name in seen \
+                        and time.monotonic() - polled_at[chat_name] < scheduler.max_interval \
+                        and (snapshot_time < polled_at[chat_name] or not changed(chat_name)):
+                    interval = scheduler.skip(chat_name)
+                    self.log(f"群聊 {chat_name} 没有变化，跳过检查，下次检查间隔 {interval:.1f} 秒")
+                    continue
+
+                try:
+                    # 切换到当前群聊
+                    self.on_status(f"正在检查群聊: {chat_name}...")
+                    # 监控器与界面共用，切换和读取期间持有锁，避免其他操作在两者之间切换群聊
+                    with self.monitor.lock:
+                        self.monitor.switch_to_chat(chat_name)
+
+                        # 读取新消息
+                        self.log(f"开始获取 {chat_name} 的新消息...")
+                        messages = self.monitor.get_new_messages(chat_name=chat_name)  # 依赖读取游标，只获取上次读取之后的消息
+                        overflowed = self.monitor.last_poll_overflowed
+
+                    if overflowed:
+                        self.on_status(f"警告: 群聊 {chat_name} 两次检测之间的新消息过多，可能有消息遗漏，已缩短该群聊的检测间隔")
+
+                    if messages:
+                        self.log(f"获取到 {len(messages)} 条新消息")
+                        self._emit_messages(chat_name, messages)
+                        self.on_status(f"已读取 {chat_name} 的 {len(messages)} 条新消息")
+                    else:
+                        self.log(f"群聊 {chat_name} 没有新消息")
+                        self.on_status(f"群聊 {chat_name} 没有新消息")
+
+                    # 记录检查时会话列表中的状态，之后的会话列表与其比较
+                    if precheck and chat_name in snapshot:
+                        seen[chat_name] = snapshot[chat_name][1:]
+                        polled_at[chat_name] = time.monotonic()
+
+                    # 成功读取后重置错误计数，并根据新消息数安排下一次检查
+                    chat_error_count[chat_name] = 0
+                    interval = scheduler.record(chat_name, len(messages), overflowed)
+                    self.log(f"{chat_name} 下次检查间隔 {interval:.1f} 秒")
+                except Exception as e:
+                    error_msg = str(e)
+                    self.log(f"监控 {chat_name} 出错: {error_msg}")
+                    # 增加错误计数
+                    chat_error_count[chat_name] += 1
+
+                    # 根据错误次数显示不同级别的警告
+                    if chat_error_count[chat_name] == 1:
+                        self.on_status(f"监控群聊 {chat_name} 时出错: {error_msg}")
+                    elif chat_error_count[chat_name] == 2:
+                        self.on_status(f"再次尝试监控群聊 {chat_name} 失败: {error_msg}")
+
+                    if chat_error_count[chat_name] >= max_error_count:
+                        # 不再安排该群聊的检查
+                        self.on_status(f"群聊 {chat_name} 多次访问失败，可能是名称不匹配或其他问题，将暂时跳过该群聊")
+                    else:
+                        scheduler.record(chat_name, error=True)
+
+            if self.journal is not None:
+                self.journal.sync()
+
+            # 输出调度统计信息
+            for chat_name, stats in scheduler.stats().items():
+                self.log(f"{chat_name} 检查 {stats['polls']} 次，跳过 {stats['skips']} 次，消息 {stats['messages']} 条，"
+                         f"估计速率 {stats['rate'] * 60:.1f} 条/分钟，最终间隔 {stats['interval']:.1f} 秒")
+
+            if listened:
+                self.log(f"独立聊天窗口 {len(listened)} 个，读取 {self.listen_reads} 次")
+
+            for method_name, stats in self.monitor.get_switch_stats().items():
+                if stats["attempts"]:
+                    self.log(f"切换方法 {method_name}: 尝试 {stats['attempts']} 次，成功 {stats['successes']} 次，"
+                             f"平均耗时 {stats['avg_time']:.2f} 秒")
+
+            if self.monitor.reconnect_count:
+                self.log(f"累计重新连接微信 {self.monitor.reconnect_count} 次")
+
+            # 输出去重缓存的统计信息
+            for chat_name, stats in self.monitor.get_cache_stats().items():
+                self.log(f"{chat_name} 指纹缓存: {stats['size']}/{stats['maxsize']}，命中 {stats['hits']}，淘汰 {stats['evictions']}")
+
+            # 监控完成
+            if time.time() >= end_time:
+                self.on_status("监控时间已到，正在停止监控...")
+            else:
+                self.on_status("监控已手动停止")
+            return True
+
+        except Exception as e:
+            error_msg = str(e)
+            self.log(f"监控线程发生错误: {error_msg}")
+            self.on_status(f"监控线程发生错误: {error_msg}")
+            self.running = False
+            if self.journal is not None:
+                self.journal.sync()
+            return False
+        finally:
+            # 关闭独立聊天窗口，读取游标保留到下一次监控
+            for chat_name in listened:
+                self.monitor.close_listen_window(chat_name)
+
+    def stop(self):
+        """停止监控循环，可以在其他线程中调用"""
+        self.running = False
+        self.log("正在停止监控线程...")
+
+
+class SummaryPipeline:
+    """在一个事件循环中并发总结多个群聊，并按需发送Webhook"""
+
+    def __init__(self, summarizer, chat_records, ai_prompt, webhook_url=None, send_webhook=None, max_workers=4,
+                 rolling=False, streaming=False, load_messages=None,
+                 on_summary=None, on_progress=None, on_stream=None):
+        """初始化总结流程
+
+        Args:
+            summarizer: DeepSeek总结器
+            chat_records: 需要总结的聊天记录，{群聊名称: 消息列表}，消息列表为None时通过load_messages读取
+            ai_prompt: AI提示模板
+            webhook_url: 飞书Webhook URL，为None时不发送
+            send_webhook: 发送Webhook的函数
+            max_workers: 同时进行总结的群聊数量，所有总结共享一个事件循环
+            rolling: 是否使用滚动总结，只把上次总结之后的新消息合并进已有总结
+            streaming: 是否使用流式输出，逐步发送已生成的总结内容
+            load_messages: 读取群聊消息列表的函数，参数为群聊名称
+            on_summary: 单个群聊总结完成的回调，参数为总结对象
+            on_progress: 进度回调，参数为 (群聊名称, 进度信息)
+            on_stream: 流式输出回调，参数为 (群聊名称, 已生成的总结内容)
+        """
+        self.summarizer = summarizer
+        self.chat_records = chat_records
+        self.ai_prompt = ai_prompt
+        self.webhook_url = webhook_url
+        self.send_webhook = send_webhook
+        self.max_workers = max(1, max_workers)
+        self.rolling = rolling
+        self.streaming = streaming
+        self.load_messages = load_messages
+        self.stream_interval = 0.1  # 流式内容的最小发送间隔（秒），避免界面刷新过于频繁
+        self.on_summary = on_summary or (lambda summary_obj: None)
+        self.on_progress = on_progress or (lambda chat_name, message: print(f"[{chat_name}] {message}"))
+        self.on_stream = on_stream
+
+        self.loop = None  # 运行中的事件循环，用于从其他线程取消总结
+        self.tasks = []
+        self.cancelled = False
+
+    def run(self):
+        """总结全部群聊，全部完成或取消后返回"""
+        asyncio.run(self._run())
+
+    def stop(self):
+        """取消尚未完成的总结，可以在其他线程中调用"""
+        self.cancelled = True
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._cancel_tasks)
+            except RuntimeError:
+                # 事件循环已经结束
+                pass
+
+    def _cancel_tasks(self):
+        for task in self.tasks:
+            task.cancel()
+
+    async def _run(self):
+        total = len(self.chat_records)
+        finished = 0
+        cancelled = 0
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def summarize_limited(chat_name, messages):
+            async with semaphore:
+                try:
+                    return chat_name, await self.summarize_chat(chat_name, messages), None
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    return chat_name, None, e
+
+        self.loop = asyncio.get_running_loop()
+        self.tasks = [
+            asyncio.ensure_future(summarize_limited(chat_name, messages))
+            for chat_name, messages in self.chat_records.items()
+        ]
+        # 在事件循环启动前就已经请求取消
+        if self.cancelled:
+            self._cancel_tasks()
+
+        # 按完成顺序处理结果
+        for future in asyncio.as_completed(self.tasks):
+            try:
+                chat_name, summary_obj, error = await future
+            except asyncio.CancelledError:
+                cancelled += 1
+                continue
+
+            finished += 1
+            if error is None:
+                self.on_summary(summary_obj)
+                if summary_obj["success"]:
+                    self.on_progress(chat_name, f"完成群聊总结 ({finished}/{total})")
+                else:
+                    self.on_progress(chat_name, f"总结失败 ({finished}/{total}): {summary_obj['summary']}")
+            else:
+                self.on_progress(chat_name, f"总结失败 ({finished}/{total}): {str(error)}")
+
+        if cancelled:
+            self.on_progress("总结", f"已取消 {cancelled} 个群聊的总结")
+        self.loop = None
+
+    async def summarize_chat(self, chat_name, messages):
+        """总结单个群聊记录，在事件循环中运行"""
+        if messages is None:
+            messages = await asyncio.get_running_loop().run_in_executor(None, self.load_messages, chat_name)
+        self.on_progress(chat_name, f"正在总结 {len(messages)} 条消息...")
+
+        # 转换消息格式
+        messages_text = []
+        for msg in messages:
+            time_str = datetime.datetime.fromtimestamp(msg["timestamp"]).strftime("%H:%M:%S")
+            messages_text.append(f"{time_str} {msg['sender']}: {msg['content']}")
+
+        # 流式输出时按间隔把已生成的内容发送出去，完整的总结生成后再发送Webhook
+        on_stream = None
+        if self.streaming and self.on_stream is not None:
+            last_emit = [0.0]
+
+            def on_stream(partial_text):
+                now = time.time()
+                if now - last_emit[0] >= self.stream_interval:
+                    last_emit[0] = now
+                    self.on_stream(chat_name, partial_text)
+
+        # 生成总结，传递AI提示模板
+        if self.rolling:
+            summary = await self.summarizer.asummarize_rolling(chat_name, messages_text, self.ai_prompt, on_stream)
+        else:
+            summary = await self.summarizer.asummarize("\n".join(messages_text), self.ai_prompt, on_stream)
+
+        # 生成时间戳和标题
+        now = datetime.datetime.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        title = f"{chat_name} - {timestamp}"
+
+        # 保存总结
+        summary_obj = {
+            "title": title,
+            "chat_name": chat_name,
+            "timestamp": timestamp,
+            "summary": summary,
+            "messages": messages,
+            "success": not is_failed_summary(summary)  # 总结失败时summary为错误信息
+        }
+
+        # 发送webhook（如果启用），阻塞的HTTP请求放到线程池中执行
+        if self.webhook_url and self.send_webhook:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.send_webhook, self.webhook_url, chat_name, summary, timestamp)
+                self.on_progress(chat_name, "已发送总结到Webhook")
+            except Exception as e:
+                self.on_progress(chat_name, f"发送Webhook失败: {str(e)}")
+
+        return summary_obj
@@ -0,0 +1,183 @@
+import time
+import heapq
+
+
+class PollScheduler:
+    """按群聊自适应调整检查间隔的轮询调度器
+
+    每个群聊有自己的下次检查时间，保存在按时间排序的堆中，每次取出最早到期的群聊。
+    检查间隔根据估计的消息速率调整：有新消息的群聊间隔缩短，使每次检查读到的消息数
+    接近target_messages，不会超出消息窗口；没有新消息的群聊间隔逐渐加长。
+    会话列表显示某个群聊有变化时可以通过wake立即安排检查，确认没有变化的群聊通过skip
+    跳过本次检查，不占用预算。
+    所有群聊共享一个检查次数预算，每次检查结束后至少间隔 60 / budget_per_minute 秒
+    才开始下一次检查，与原来每次检查后休眠一个检测间隔相同；活跃群聊多检查的次数
+    由安静群聊让出，UI操作总量不会增加。
+    """
+
+    def __init__(self, chats, check_interval=10, min_interval=2, max_interval=120, target_messages=10,
+                 budget_per_minute=0, backoff=1.5, clock=time.monotonic):
+        """初始化调度器
+
+        Args:
+            chats: 群聊名称列表
+            check_interval: 原来的检测间隔（秒），每个群聊的初始间隔为 check_interval * 群聊数量
+            min_interval: 单个群聊的最短检查间隔（秒）
+            max_interval: 单个群聊的最长检查间隔（秒）
+            target_messages: 每次检查希望读到的消息数，应远小于消息窗口能容纳的消息数
+            budget_per_minute: 所有群聊每分钟最多检查的次数（不计检查本身的耗时），为0时按检测间隔计算，
+                与原来轮流检查的UI操作量相同；检测间隔也为0时不限制
+            backoff: 没有新消息时检查间隔的增长倍数
+            clock: 时钟函数，返回单调递增的秒数
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.target_messages = target_messages
+        self.backoff = backoff
+        self.clock = clock
+
+        if not budget_per_minute and check_interval > 0:
+            budget_per_minute = 60.0 / check_interval
+        self.budget_per_minute = budget_per_minute
+        self.min_gap = 60.0 / budget_per_minute if budget_per_minute > 0 else 0.0  # 检查结束后到下一次检查的最短间隔
+        self.next_slot = 0.0
+
+        self.initial_interval = self._clamp(check_interval * len(chats))
+        self.state = {}
+        self.heap = []
+        self._order = 0
+        # 开始时按原来的顺序依次检查一遍
+        for chat_name in chats:
+            self.add(chat_name)
+
+    def add(self, chat_name):
+        """加入一个群聊并立即安排检查，已在调度中的群聊不受影响"""
+        if chat_name in self.state:
+            return
+        self.state[chat_name] = {
+            "interval": self.initial_interval,
+            "rate": None,  # 估计的消息速率（条/秒）
+            "last_poll": None,
+            "polls": 0,
+            "skips": 0,
+            "messages": 0,
+            "entry": None,  # 堆中有效条目的序号，已取出时为None
+            "deadline": None
+        }
+        self._push(chat_name, self.clock())
+
+    def _clamp(self, interval):
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _push(self, chat_name, deadline):
+        """安排群聊在指定时间检查，之前的条目留在堆中，取出时丢弃"""
+        self.state[chat_name]["entry"] = self._order
+        self.state[chat_name]["deadline"] = deadline
+        heapq.heappush(self.heap, (deadline, self._order, chat_name))
+        self._order += 1
+
+    def _discard_stale(self):
+        while self.heap and self.heap[0][1] != self.state[self.heap[0][2]]["entry"]:
+            heapq.heappop(self.heap)
+
+    def peek(self):
+        """返回下一个需要检查的群聊及其可以开始检查的时间，没有群聊时返回 (None, None)"""
+        self._discard_stale()
+        if not self.heap:
+            return None, None
+        deadline, _, chat_name = self.heap[0]
+        return chat_name, max(deadline, self.next_slot)
+
+    def pop(self):
+        """取出下一个需要检查的群聊，检查结束后应调用record
+
+        Returns:
+            str: 群聊名称，没有群聊时返回None
+        """
+        self._discard_stale()
+        if not self.heap:
+            return None
+        _, _, chat_name = heapq.heappop(self.heap)
+        self.state[chat_name]["entry"] = None
+        return chat_name
+
+    def wake(self, chat_name):
+        """群聊有新消息时提前安排检查，正在检查的群聊不受影响"""
+        state = self.state.get(chat_name)
+        if state is None or state["entry"] is None:
+            return
+        now = self.clock()
+        if state["deadline"] > now:
+            self._push(chat_name, now)
+
+    def skip(self, chat_name):
+        """跳过已取出但确认没有变化的群聊，按没有新消息放慢检查，不占用检查预算
+
+        Returns:
+            float: 下一次检查的间隔（秒）
+        """
+        state = self.state[chat_name]
+        state["skips"] += 1
+        state["interval"] = self._clamp(state["interval"] * self.backoff)
+        self._push(chat_name, self.clock() + state["interval"])
+        return state["interval"]
+
+    def record(self, chat_name, new_messages=0, overflowed=False, error=False):
+        """记录一次检查的结果，并安排该群聊的下一次检查
+
+        Args:
+            chat_name: 群聊名称
+            new_messages: 读到的新消息数
+            overflowed: 两次检查之间的新消息是否超出了消息窗口
+            error: 检查是否出错
+
+        Returns:
+            float: 下一次检查的间隔（秒）
+        """
+        state = self.state[chat_name]
+        now = self.clock()
+        self.next_slot = now + self.min_gap
+        state["polls"] += 1
+        state["messages"] += new_messages
+
+        if error:
+            # 出错时放慢检查，避免反复失败占用预算
+            interval = state["interval"] * 2
+        elif state["last_poll"] is None:
+            # 第一次检查读到的是历史消息，不能用来估计速率
+            state["last_poll"] = now
+            interval = state["interval"]
+        else:
+            elapsed = now - state["last_poll"]
+            state["last_poll"] = now
+            sample = new_messages / max(elapsed, 1e-3)
+            # 指数加权平均，最近的检查权重更大
+            state["rate"] = sample if state["rate"] is None else 0.5 * sample + 0.5 * state["rate"]
+
+            if overflowed:
+                interval = self.min_interval
+            elif new_messages and state["rate"] > 0:
+                interval = self.target_messages / state["rate"]
+            else:
+                interval = state["interval"] * self.backoff
+
+        state["interval"] = self._clamp(interval)
+        self._push(chat_name, now + state["interval"])
+        return state["interval"]
+
+    def stats(self):
+        """返回每个群聊的调度统计信息
+
+        Returns:
+            dict: {群聊名称: {interval, rate, polls, skips, messages}}
+        """
+        return {
+            chat_name: {
+                "interval": state["interval"],
+                "rate": state["rate"] or 0.0,
+                "polls": state["polls"],
+                "skips": state["skips"],
+                "messages": state["messages"]
+            }
+            for chat_name, state in self.state.items()
+        }
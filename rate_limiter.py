@@ -0,0 +1,148 @@
+import time
+import asyncio
+import threading
+
+
+class TokenBucket:
+    """令牌桶，容量为每分钟的配额，按配额匀速补充
+
+    预约时直接扣除令牌，余额可以为负数，之后的预约需要等待更久，
+    因此等待的请求按预约顺序依次放行。
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0  # 每秒补充的令牌数
+        self.level = self.capacity
+        self.updated = None
+
+    def reserve(self, amount, now):
+        """预约指定数量的令牌，返回需要等待的时间（秒）"""
+        if self.updated is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+        # 单次请求超过整个桶的容量时按容量计算，否则永远等不到
+        amount = min(amount, self.capacity)
+        self.level -= amount
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.rate
+
+    def refund(self, amount):
+        """归还预约后没有使用的令牌"""
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+
+class RateLimiter:
+    """共享的API速率限制器
+
+    同时限制每分钟请求数（RPM）和每分钟token数（TPM）。超出配额的请求排队等待，
+    而不是直接发送后收到429错误。可以在多个线程和事件循环之间共享。
+    """
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=0, clock=time.monotonic):
+        """初始化速率限制器
+
+        Args:
+            requests_per_minute: 每分钟最多发送的请求数，为0时不限制
+            tokens_per_minute: 每分钟最多消耗的token数（输入加输出），为0时不限制
+            clock: 时钟函数，返回单调递增的秒数
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._paused_until = 0.0
+
+        # 统计信息
+        self.queue_depth = 0  # 正在等待的请求数
+        self.max_queue_depth = 0
+        self.requests = 0
+        self.waited = 0  # 需要等待的请求数
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _reserve(self, tokens):
+        """预约一次请求的配额，返回需要等待的时间（秒）"""
+        with self._lock:
+            now = self.clock()
+            wait = max(0.0, self._paused_until - now)
+            if self._request_bucket is not None:
+                wait = max(wait, self._request_bucket.reserve(1, now))
+            if self._token_bucket is not None:
+                wait = max(wait, self._token_bucket.reserve(tokens, now))
+
+            self.requests += 1
+            if wait > 0:
+                self.waited += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.queue_depth += 1
+                self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            return wait
+
+    def _release(self, wait):
+        if wait > 0:
+            with self._lock:
+                self.queue_depth -= 1
+
+    def _cancel(self, tokens):
+        """取消已预约的请求，归还配额"""
+        with self._lock:
+            self.requests -= 1
+            if self._request_bucket is not None:
+                self._request_bucket.refund(1)
+            if self._token_bucket is not None:
+                self._token_bucket.refund(tokens)
+
+    async def acquire(self, tokens=0):
+        """等待直到可以发送一次请求
+
+        Args:
+            tokens: 本次请求预计消耗的token数
+
+        Returns:
+            float: 实际需要等待的时间（秒）
+        """
+        wait = self._reserve(tokens)
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            self._cancel(tokens)
+            raise
+        finally:
+            self._release(wait)
+        return wait
+
+    def acquire_blocking(self, tokens=0):
+        """acquire的同步版本，在当前线程中等待"""
+        wait = self._reserve(tokens)
+        try:
+            if wait > 0:
+                time.sleep(wait)
+        finally:
+            self._release(wait)
+        return wait
+
+    def pause(self, seconds):
+        """暂停放行请求，用于服务器返回429并指定了Retry-After时让所有调用方一起等待"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+    def stats(self):
+        """返回速率限制的统计信息"""
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "waited": self.waited,
+                "total_wait": self.total_wait,
+                "max_wait": self.max_wait,
+                "avg_wait": self.total_wait / self.waited if self.waited else 0.0
+            }
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+class SummaryCache:
+    """按内容寻址的磁盘总结缓存
+
+    以 (模型, 提示文本, 温度, 最大token数) 的哈希作为键保存API返回的总结，
+    相同的请求直接从缓存返回，不再调用API。提示文本包含了提示模板和聊天记录。
+    缓存按条目数量、总大小和保存时间进行淘汰。
+    """
+
+    def __init__(self, cache_dir="summary_cache", max_entries=500, max_bytes=50 * 1024 * 1024,
+                 max_age=7 * 24 * 3600):
+        """初始化总结缓存
+
+        Args:
+            cache_dir: 缓存目录
+            max_entries: 最多保存的条目数量
+            max_bytes: 缓存文件的最大总大小（字节）
+            max_age: 条目的最长保存时间（秒）
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._index = {}  # 键 -> [创建时间, 最近使用时间, 文件大小]
+        self._total_bytes = 0
+        self._load_index()
+
+    @staticmethod
+    def make_key(model, prompt, temperature, max_tokens):
+        """根据请求内容生成缓存键"""
+        material = json.dumps([model, prompt, temperature, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        """扫描缓存目录，重建内存中的索引"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+                # 文件的修改时间记录最近使用时间，每次命中都会更新，创建时间只能从文件内容中读取
+                with open(path, "r", encoding="utf-8") as f:
+                    created = json.load(f).get("created", 0)
+            except (OSError, ValueError):
+                # 损坏的缓存文件直接删除，与读取时的处理相同
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            self._index[name[:-5]] = [created, stat.st_mtime, stat.st_size]
+            self._total_bytes += stat.st_size
+
+    def get(self, key):
+        """读取缓存的总结
+
+        Returns:
+            str: 缓存的总结，不存在或已过期时返回None
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            now = time.time()
+            if self.max_age and now - data.get("created", 0) > self.max_age:
+                self._remove(key)
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            # 更新最近使用时间，淘汰时优先保留常用的条目
+            entry[0] = data.get("created", entry[0])
+            entry[1] = now
+            try:
+                os.utime(self._path(key), (now, now))
+            except OSError:
+                pass
+
+            self.hits += 1
+            return data.get("summary")
+
+    def put(self, key, summary):
+        """保存总结到缓存，并按需淘汰旧条目"""
+        now = time.time()
+        content = json.dumps({"created": now, "summary": summary}, ensure_ascii=False)
+
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            # 先写临时文件再替换，避免进程中断时留下不完整的缓存文件
+            os.replace(temp_path, path)
+
+            if key in self._index:
+                self._total_bytes -= self._index[key][2]
+            size = os.path.getsize(path)
+            self._index[key] = [now, now, size]
+            self._total_bytes += size
+
+            self._evict(now)
+
+    def _remove(self, key):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[2]
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self, now):
+        """淘汰过期条目，以及超出数量或大小限制时最久未使用的条目"""
+        if self.max_age:
+            for key in [k for k, entry in self._index.items() if now - entry[0] > self.max_age]:
+                self._remove(key)
+                self.evictions += 1
+
+        if len(self._index) <= self.max_entries and self._total_bytes <= self.max_bytes:
+            return
+
+        for key in sorted(self._index, key=lambda k: self._index[k][1]):
+            if len(self._index) <= self.max_entries and self._total_bytes <= self.max_bytes:
+                break
+            self._remove(key)
+            self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+
+    def stats(self):
+        """返回缓存的统计信息"""
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,69 @@
+"""读取游标的回归测试
+
+使用固定内容的聊天窗口模拟微信界面，检查每次轮询读到的新消息。
+
+运行：
+    python -m unittest test_chat_monitor
+"""
+import io
+import unittest
+import contextlib
+
+from chat_backend import ReplayMessage
+from chat_monitor import WeChatMonitor
+
+
+class WindowBackend:
+    """只显示固定消息窗口的后端，测试中直接修改window模拟新消息到达和窗口滚动"""
+
+    CurrentChat = "测试群"
+    ChatBox = None
+
+    def __init__(self):
+        self.window = []
+
+    def GetSessionList(self):
+        return [self.CurrentChat]
+
+    def GetAllMessage(self):
+        return list(self.window)
+
+
+def messages(*items):
+    return [ReplayMessage(sender, content) for sender, content in items]
+
+
+class CursorTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = WindowBackend()
+        self.monitor = WeChatMonitor(backend=self.backend)
+
+    def poll(self, window):
+        self.backend.window = window
+        with contextlib.redirect_stdout(io.StringIO()):
+            new_messages = self.monitor.get_new_messages(max_messages=len(window), chat_name="测试群")
+        return [msg["content"] for msg in new_messages]
+
+    def test_tail_partly_scrolled_out(self):
+        history = messages(*[("u", f"msg{i}") for i in range(20)])
+        self.assertEqual(self.poll(history[0:10]), [f"msg{i}" for i in range(10)])
+        # 9条新消息把游标记录的3条消息中的前2条挤出窗口，只剩msg9在窗口顶部
+        self.assertEqual(self.poll(history[9:19]), [f"msg{i}" for i in range(10, 19)])
+        self.assertFalse(self.monitor.last_poll_overflowed)
+
+    def test_repeated_tail_in_full_window(self):
+        history = messages(*[("u", f"msg{i}") for i in range(7)], *[("a", "+1")] * 5)
+        self.assertEqual(len(self.poll(history[0:10])), 10)
+        # 窗口已满，又有两条"+1"，末尾的3条"+1"仍然出现在上次记录的位置
+        self.assertEqual(self.poll(history[2:12]), ["+1", "+1"])
+        self.assertFalse(self.monitor.last_poll_overflowed)
+        self.assertEqual(self.poll(history[2:12]), [])
+
+    def test_repeated_tail_in_growing_window(self):
+        history = messages(("u", "开始"), *[("a", "+1")] * 3, ("n", "重要"), *[("a", "+1")] * 3)
+        self.assertEqual(len(self.poll(history[0:4])), 4)
+        self.assertEqual(self.poll(history), ["重要", "+1", "+1", "+1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
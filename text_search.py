@@ -0,0 +1,69 @@
+import re
+
+# 中日韩文字，按二元组切分
+_CJK_RUN_PATTERN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+# 查询中的非中文词，与SQLite unicode61分词器的切分方式一致
+_WORD_PATTERN = re.compile(r'\w+')
+
+
+def _cjk_terms(run):
+    """把一段连续的中文切分为二元组，末尾的单字也作为一个词，用于单字查询"""
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+
+
+def tokenize_for_index(text):
+    """把文本转换为适合写入FTS5索引的形式
+
+    SQLite自带的分词器不能切分中文，这里把每段连续的中文切分为重叠的二元组，
+    "空投地址" 写入索引时为 "空投 投地 地址 址"；其他文字保持原样，由unicode61分词器处理。
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        str: 用空格分隔词语的文本
+    """
+    parts = []
+    last = 0
+    for match in _CJK_RUN_PATTERN.finditer(text):
+        parts.append(text[last:match.start()])
+        parts.append(" ".join(_cjk_terms(match.group())))
+        last = match.end()
+    parts.append(text[last:])
+    return " ".join(part for part in parts if part)
+
+
+def build_match_query(query):
+    """把用户输入的查询转换为FTS5的MATCH表达式
+
+    用空格分隔的每个关键词都必须出现。中文关键词转换为相邻二元组组成的短语，
+    只会匹配连续出现的原文；单个汉字和最后一个非中文词按前缀匹配。
+
+    Args:
+        query: 用户输入的查询
+
+    Returns:
+        str: MATCH表达式，查询中没有可搜索的内容时返回None
+    """
+    terms = []
+    for keyword in query.split():
+        position = 0
+        for match in _CJK_RUN_PATTERN.finditer(keyword):
+            terms.extend(f'"{word}"' for word in _WORD_PATTERN.findall(keyword[position:match.start()]))
+            run = match.group()
+            if len(run) == 1:
+                # 单字可能是二元组的第一个字，也可能是一段中文的最后一个字
+                terms.append(f'"{run}"*')
+            else:
+                terms.append('"' + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+            position = match.end()
+        terms.extend(f'"{word}"' for word in _WORD_PATTERN.findall(keyword[position:]))
+
+    if not terms:
+        return None
+    # 输入过程中最后一个词可能还不完整，按前缀匹配
+    if not terms[-1].endswith("*"):
+        terms[-1] += "*"
+    return " AND ".join(terms)
@@ -0,0 +1,296 @@
+"""无界面模式：不加载PyQt5，读取monitor_config.json监控群聊并生成总结，日志输出到标准输出
+
+示例：
+    python wx_headless.py
+    python wx_headless.py --chats "群聊A" "群聊B" --duration 1800 --forever
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import datetime
+
+import http_client
+from chat_monitor import WeChatMonitor
+from chat_summarizer import DeepSeekSummarizer
+from summary_cache import SummaryCache
+from rate_limiter import RateLimiter
+from message_store import MessageStore
+from message_journal import MessageJournal
+from monitor_service import (MonitorLoop, SummaryPipeline, send_feishu_webhook,
+                             chat_records_from_journal, replay_journal_into_store)
+
+
+def log(message):
+    """输出带时间的日志，立即刷新，便于在服务日志中查看"""
+    print(f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {message}", flush=True)
+
+
+class HeadlessMonitor:
+    """按照配置文件运行监控和总结，与图形界面使用相同的配置项"""
+
+    def __init__(self, config, backend=None):
+        """初始化无界面监控
+
+        Args:
+            config: 配置字典，格式与monitor_config.json相同
+            backend: 微信后端，为None时使用wxauto
+        """
+        self.config = config
+        self.backend = backend
+        self.ai_prompt = config.get("ai_prompt", "")
+        self.webhook_url = config.get("webhook_url") if config.get("webhook_enabled", False) else None
+        self.message_journal = config.get("message_journal", "messages.journal")
+        self.journal_flush_interval = config.get("journal_flush_interval", 1.0)
+        self.summary_cache = None
+        self.rate_limiter = None
+        self.summarizer = None  # 多轮监控共用同一个总结器，保留滚动总结的状态
+        self.message_store = None
+        self.monitor = None  # 多轮监控共用同一个微信监控器
+        self.monitor_loop = None
+        self.pipeline = None
+        self.stopping = False
+
+        http_client.configure(pool_maxsize=config.get("http_pool_size", 16),
+                              timeout=config.get("http_timeout", 30))
+
+    def open_message_store(self):
+        """打开消息数据库，并重放上次运行崩溃时留在消息日志中的消息"""
+        records = []
+        if self.message_journal:
+            try:
+                records = MessageJournal.replay(self.message_journal)
+            except Exception as e:
+                log(f"读取消息日志失败: {str(e)}")
+
+        message_db = self.config.get("message_db", "messages.db")
+        if message_db:
+            try:
+                self.message_store = MessageStore(message_db)
+            except Exception as e:
+                log(f"打开消息数据库失败: {str(e)}")
+
+        if self.message_store is None:
+            if records:
+                # 没有数据库时无法保存恢复的消息，先总结上一次会话
+                chat_records = chat_records_from_journal(records)
+                total = sum(len(messages) for messages in chat_records.values())
+                log(f"已从消息日志恢复上一次监控会话，共 {total} 条消息，开始总结")
+                self.summarize(chat_records)
+                MessageJournal.clear(self.message_journal)
+            return
+
+        if records:
+            recovered = replay_journal_into_store(records, self.message_store, self.message_journal)
+            log(f"已重放消息日志中的 {recovered} 条消息")
+
+    def create_summarizer(self):
+        """按照配置创建总结器，总结器在多轮监控之间共享，已经创建时直接返回"""
+        if self.summarizer is not None:
+            return self.summarizer
+        config = self.config
+        if self.summary_cache is None and config.get("summary_cache_dir", "summary_cache"):
+            self.summary_cache = SummaryCache(config.get("summary_cache_dir", "summary_cache"),
+                                              max_entries=config.get("summary_cache_max_entries", 500),
+                                              max_age=config.get("summary_cache_max_age_days", 7) * 24 * 3600)
+
+        rpm = config.get("rate_limit_rpm", 60)
+        tpm = config.get("rate_limit_tpm", 0)
+        if self.rate_limiter is None and (rpm or tpm):
+            self.rate_limiter = RateLimiter(rpm, tpm)
+
+        compaction = None
+        if config.get("transcript_compaction", True):
+            compaction = {
+                "media": config.get("compact_media", "collapse"),
+                "merge_runs": config.get("compact_merge_runs", True),
+                "alias_senders": config.get("compact_alias_senders", True)
+            }
+
+        self.summarizer = DeepSeekSummarizer(config.get("api_key", ""),
+                                             chunk_tokens=config.get("chunk_tokens", 6000),
+                                             chunk_overlap=config.get("chunk_overlap", 200),
+                                             chunk_parallelism=config.get("chunk_parallelism", 4),
+                                             cache=self.summary_cache,
+                                             rate_limiter=self.rate_limiter,
+                                             compaction=compaction)
+        return self.summarizer
+
+    def run_once(self, chats, duration, check_interval):
+        """监控一轮，结束后总结本轮收到的消息"""
+        chat_records = {chat: [] for chat in chats}
+        session_id = None
+        if self.summarizer is not None:
+            # 新一轮的消息合并进上一轮的滚动总结
+            self.summarizer.start_new_transcript()
+        if self.message_store is not None:
+            session_id = self.message_store.start_session(chats)
+
+        journal = None
+        if self.message_journal:
+            try:
+                journal = MessageJournal(self.message_journal, self.journal_flush_interval, truncate=True)
+                journal.append({"session": session_id, "chats": chats, "started": time.time()})
+                journal.sync()
+            except Exception as e:
+                log(f"创建消息日志失败: {str(e)}")
+
+        def on_message(chat_name, sender, content, timestamp, seq):
+            if self.message_store is not None:
+                self.message_store.add_message(session_id, chat_name, sender, content, timestamp, seq)
+            else:
+                chat_records[chat_name].append({"sender": sender, "content": content, "timestamp": timestamp})
+            log(f"[{chat_name}] {sender}: {content}")
+
+        if self.monitor is None:
+            self.monitor = WeChatMonitor(backend=self.backend, cache_size=self.config.get("dedup_cache_size", 200))
+        schedule = {
+            "min_interval": self.config.get("poll_min_interval", 2),
+            "max_interval": self.config.get("poll_max_interval", 120),
+            "target_messages": self.config.get("poll_target_messages", 10),
+            "budget_per_minute": self.config.get("poll_budget_per_minute", 0)
+        }
+        self.monitor_loop = MonitorLoop(self.monitor, chats, duration, check_interval, journal, session_id,
+                                        on_message=on_message, on_status=log, schedule=schedule,
+                                        precheck=self.config.get("session_precheck", True),
+                                        listen_chats=self.config.get("listen_chats", []),
+                                        listen_interval=self.config.get("listen_interval", 1.0))
+        self.monitor_loop.debug_mode = self.config.get("debug_mode", False)
+        try:
+            self.monitor_loop.run()
+        finally:
+            self.monitor_loop = None
+            if self.message_store is not None and session_id is not None:
+                self.message_store.end_session(session_id)
+                self.message_store.flush()
+            if journal is not None:
+                journal.close()
+                if self.message_store is not None:
+                    MessageJournal.clear(self.message_journal)
+
+        load_messages = None
+        if self.message_store is not None:
+            chat_records = {chat: None for chat in chats}
+            load_messages = lambda chat_name: self.message_store.get_messages(session_id, chat_name)
+        self.summarize(chat_records, load_messages, session_id)
+
+    def summarize(self, chat_records, load_messages=None, session_id=None):
+        """总结所有有消息的群聊
+
+        Args:
+            chat_records: {群聊名称: 消息列表}，消息列表为None时通过load_messages读取
+            load_messages: 读取群聊消息列表的函数，参数为群聊名称
+            session_id: 消息所属的会话ID，总结保存到数据库时使用
+        """
+        if self.stopping:
+            return
+        if load_messages is not None:
+            session_counts = self.message_store.count_messages(session_id)
+            counts = {chat: session_counts.get(chat, 0) for chat in chat_records}
+        else:
+            counts = {chat: len(messages) for chat, messages in chat_records.items()}
+        empty_chats = [chat for chat, count in counts.items() if not count]
+        if empty_chats:
+            log(f"以下群聊没有消息，跳过总结: {', '.join(empty_chats)}")
+        chat_records = {chat: messages for chat, messages in chat_records.items() if chat not in empty_chats}
+        if not chat_records:
+            return
+
+        def on_summary(summary_obj):
+            # 失败的总结只显示错误信息，不保存到数据库
+            if self.message_store is not None and summary_obj["success"]:
+                self.message_store.add_summary(session_id, summary_obj["chat_name"], summary_obj["title"],
+                                               summary_obj["summary"], time.time())
+            log(f"===== {summary_obj['title']} =====\n{summary_obj['summary']}")
+
+        summarizer = self.create_summarizer()
+        self.pipeline = SummaryPipeline(summarizer, chat_records, self.ai_prompt,
+                                        self.webhook_url, send_feishu_webhook,
+                                        self.config.get("summary_concurrency", 4),
+                                        rolling=self.config.get("summary_mode", "full") == "rolling",
+                                        load_messages=load_messages,
+                                        on_summary=on_summary,
+                                        on_progress=lambda chat_name, message: log(f"[{chat_name}] {message}"))
+        try:
+            self.pipeline.run()
+        finally:
+            self.pipeline = None
+
+        if self.summary_cache is not None:
+            stats = self.summary_cache.stats()
+            log(f"总结缓存: 命中 {stats['hits']} 次，未命中 {stats['misses']} 次，共 {stats['entries']} 条")
+        compaction_report = summarizer.compaction_report()
+        if compaction_report:
+            log(f"聊天记录压缩节省: {compaction_report}")
+        if self.rate_limiter is not None:
+            stats = self.rate_limiter.stats()
+            log(f"速率限制: 共 {stats['requests']} 次请求，排队 {stats['waited']} 次，"
+                f"平均等待 {stats['avg_wait']:.1f} 秒，最长等待 {stats['max_wait']:.1f} 秒")
+
+    def stop(self):
+        """停止监控并取消正在进行的总结，可以在信号处理函数中调用"""
+        self.stopping = True
+        if self.monitor_loop is not None:
+            self.monitor_loop.stop()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+
+    def close(self):
+        if self.message_store is not None:
+            self.message_store.close()
+            self.message_store = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面运行微信群聊监控和总结")
+    parser.add_argument("--config", default="monitor_config.json", help="配置文件")
+    parser.add_argument("--chats", nargs="+", help="监控的群聊，默认使用配置文件中的selected_chats")
+    parser.add_argument("--duration", type=int, help="每轮监控时长（秒），默认使用配置文件中的monitor_time（分钟）")
+    parser.add_argument("--interval", type=float, help="检测间隔（秒），默认使用配置文件中的interval_time")
+    parser.add_argument("--forever", action="store_true", help="每轮监控和总结结束后立即开始下一轮，直到收到停止信号")
+    parser.add_argument("--replay", help="使用录制文件代替微信客户端（JSON Lines），用于测试")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.config):
+        log(f"配置文件不存在: {args.config}")
+        sys.exit(1)
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    chats = [chat for chat in (args.chats or config.get("selected_chats", [])) if chat]
+    if not chats:
+        log("没有需要监控的群聊，请在配置文件的selected_chats中设置或使用--chats参数")
+        sys.exit(1)
+    duration = args.duration if args.duration is not None else config.get("monitor_time", 60) * 60
+    check_interval = args.interval if args.interval is not None else config.get("interval_time", 10)
+
+    backend = None
+    if args.replay:
+        from chat_backend import ReplayBackend
+        backend = ReplayBackend.from_file(args.replay)
+
+    service = HeadlessMonitor(config, backend)
+
+    def handle_signal(signum, frame):
+        log("收到停止信号，正在停止...")
+        service.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    try:
+        service.open_message_store()
+        while not service.stopping:
+            log(f"开始监控群聊: {', '.join(chats)}，持续时间: {duration // 60} 分钟，检测间隔: {check_interval} 秒")
+            service.run_once(chats, duration, check_interval)
+            if not args.forever:
+                break
+    finally:
+        service.close()
+        log("已退出")
+
+
+if __name__ == "__main__":
+    main()
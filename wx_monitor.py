@@ -4,7 +4,6 @@ import time
 import json
 import threading
 import datetime
-import requests
 import re  # 在文件顶部添加re模块引入
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QPushButton, QTextEdit, QLineEdit, QListWidget, 
@@ -12,26 +11,81 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QH
                              QFileDialog, QMessageBox, QSplitter, QInputDialog)
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QThread
 
+# 总结相关的模块（asyncio、requests等）导入较慢，在第一次使用时才导入，加快窗口显示
 from chat_monitor import WeChatMonitor
-from chat_summarizer import DeepSeekSummarizer
+from message_store import MessageStore
+from message_journal import MessageJournal
+import http_client
 
 class WeChatMonitorApp(QMainWindow):
-    def __init__(self):
+    ready_signal = pyqtSignal()  # 启动完成信号，群聊列表和消息数据库都已加载
+    
+    def __init__(self, backend=None):
+        """初始化主窗口
+        
+        Args:
+            backend: 微信后端，为None时使用wxauto
+        """
         super().__init__()
         self.setWindowTitle("微信监控工具 by晚风(推特x.com/pl_wanfeng)")
         self.setGeometry(100, 100, 1000, 700)
         
-        self.monitor = None
+        self.monitor = None  # 共享的微信监控器，第一次使用时连接微信
+        self.monitor_lock = threading.Lock()
         self.monitor_thread = None
         self.is_monitoring = False
-        self.chat_records = {}
+        self.chat_records = {}  # 没有消息数据库时保存在内存中的聊天记录
+        self.message_counts = {}  # 当前监控会话中每个群聊的消息数
         self.config_file = "monitor_config.json"
+        self.dedup_cache_size = 200  # 每个群聊的消息指纹缓存大小
+        self.summary_concurrency = 4  # 同时进行总结的群聊数量
+        self.summarize_thread = None
+        self.http_pool_size = 16  # 共享HTTP连接池中每个主机保持的连接数
+        self.http_timeout = 30  # HTTP请求默认超时时间（秒）
+        self.chunk_tokens = 6000  # 分块总结时每个分块的token预算
+        self.chunk_overlap = 200  # 相邻分块重叠部分的token预算
+        self.chunk_parallelism = 4  # 同时总结的分块数量
+        self.summary_cache_dir = "summary_cache"  # 总结缓存目录，为空时不使用缓存
+        self.summary_cache_max_entries = 500  # 总结缓存最多保存的条目数量
+        self.summary_cache_max_age_days = 7  # 总结缓存的最长保存天数
+        self.summary_cache = None
+        self.summary_mode = "full"  # 总结模式: full 每次完整总结, rolling 只把新消息合并进已有总结
+        self.summary_streaming = True  # 是否使用流式输出，在总结页面逐步显示生成的内容
+        self.streaming_chat = None  # 正在总结页面流式显示的群聊
+        self.rate_limit_rpm = 60  # DeepSeek API每分钟最多请求数，为0时不限制
+        self.rate_limit_tpm = 0  # DeepSeek API每分钟最多token数，为0时不限制
+        self.rate_limiter = None
+        self.transcript_compaction = True  # 总结前是否压缩聊天记录
+        self.compact_media = "collapse"  # 媒体占位符: collapse 合并连续的相同占位符, drop 删除, keep 保留
+        self.compact_merge_runs = True  # 是否合并同一发送者的连续消息
+        self.compact_alias_senders = True  # 是否把发送者昵称替换为短代号
+        self.message_db = "messages.db"  # 消息数据库文件，为空时不保存消息
+        self.message_store = None
+        self.session_id = None  # 当前监控会话在消息数据库中的ID
+        self.message_journal = "messages.journal"  # 消息日志文件，崩溃后用于恢复消息，为空时不记录
+        self.journal_flush_interval = 1.0  # 消息日志刷新到磁盘的最长间隔（秒）
+        self.journal = None
+        self.search_limit = 200  # 搜索最多显示的结果数
+        self.poll_min_interval = 2  # 单个群聊的最短检测间隔（秒）
+        self.poll_max_interval = 120  # 单个群聊的最长检测间隔（秒）
+        self.poll_target_messages = 10  # 每次检测希望读到的消息数，活跃群聊据此缩短检测间隔
+        self.poll_budget_per_minute = 0  # 所有群聊每分钟最多检测的次数，为0时按检测间隔计算
+        self.session_precheck = True  # 是否先读取会话列表，只切换到有新消息的群聊
+        self.listen_chats = []  # 打开为独立聊天窗口并行读取的群聊，不需要在主窗口中切换
+        self.listen_interval = 1.0  # 读取独立聊天窗口的间隔（秒）
+        self.backend = backend
+        self.chat_list_thread = None
+        self.message_store_thread = None
+        self.startup_pending = {"message_store"}  # 尚未完成的启动步骤
+        self.is_ready = False
         
         # 初始化AI提示模板
         self.ai_prompt = "你是一个Web3撸毛的人，你非常擅长撸毛，你加入了一个群聊，你看过了所有人的聊天后，对他们聊的内容进行了重点分析，分析了哪些是项目相关的，哪些是要空投相关的，哪些是做任务的，并把看到的项目地址，需要做什么任务都分析出来，根据聊天内容的前后顺序，进行关联分析，要进行聊天的上下文关联，确保上下文关联的准确性，然后进行总结"
         
         self.init_ui()
         self.load_config()
+        # 在后台线程中打开消息数据库，重放日志和读取会话不阻塞首次显示
+        self.open_message_store()
 
     def init_ui(self):
         central_widget = QWidget()
@@ -62,9 +116,9 @@ class WeChatMonitorApp(QMainWindow):
         chat_buttons = QVBoxLayout()
         
         # 刷新群聊列表按钮
-        refresh_btn = QPushButton("刷新群聊列表")
-        refresh_btn.clicked.connect(self.refresh_chat_list)
-        chat_buttons.addWidget(refresh_btn)
+        self.refresh_btn = QPushButton("刷新群聊列表")
+        self.refresh_btn.clicked.connect(lambda: self.refresh_chat_list())
+        chat_buttons.addWidget(self.refresh_btn)
         
         # 添加手动输入群聊按钮
         manual_add_btn = QPushButton("手动添加群聊")
@@ -193,61 +247,103 @@ class WeChatMonitorApp(QMainWindow):
         
         summary_layout.addLayout(summary_btn_layout)
         
+        # 搜索选项卡
+        search_tab = QWidget()
+        search_layout = QVBoxLayout(search_tab)
+        
+        search_input_layout = QHBoxLayout()
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("输入关键词搜索历史消息，多个关键词用空格分隔")
+        self.search_input.returnPressed.connect(self.search_history)
+        search_input_layout.addWidget(self.search_input)
+        
+        self.search_summaries_check = QCheckBox("同时搜索总结")
+        search_input_layout.addWidget(self.search_summaries_check)
+        
+        search_btn = QPushButton("搜索")
+        search_btn.clicked.connect(self.search_history)
+        search_input_layout.addWidget(search_btn)
+        
+        search_layout.addLayout(search_input_layout)
+        
+        self.search_results = QTextEdit()
+        self.search_results.setReadOnly(True)
+        search_layout.addWidget(self.search_results)
+        
         # 添加选项卡
         tab_widget.addTab(monitor_tab, "监控")
         tab_widget.addTab(summary_tab, "总结")
+        tab_widget.addTab(search_tab, "搜索")
         
         # 初始状态更新
         self.update_status("应用已启动，请配置监控参数")
 
-    def refresh_chat_list(self):
-        """刷新微信群聊列表"""
+    def refresh_chat_list(self, selected_chats=None, interactive=True):
+        """在后台线程中刷新微信群聊列表
+        
+        连接微信和读取会话列表可能需要几秒，放到后台线程中执行，不阻塞界面。
+        
+        Args:
+            selected_chats: 列表加载后需要选中的群聊
+            interactive: 是否为用户手动刷新，手动刷新失败时弹出提示框
+        """
+        if self.chat_list_thread and self.chat_list_thread.isRunning():
+            return
+        
         self.update_status("正在获取微信群聊列表...")
         self.chat_list.clear()  # 先清空列表
         
         # 禁用按钮，防止重复点击
-        refresh_btn = self.sender()
-        if refresh_btn:
-            old_text = refresh_btn.text()
-            refresh_btn.setText("正在刷新...")
-            refresh_btn.setEnabled(False)
-            QApplication.processEvents()  # 强制更新UI
-        
-        try:
-            # 显示加载状态
-            QApplication.setOverrideCursor(Qt.WaitCursor)
-            
-            temp_monitor = WeChatMonitor()
-            chats = temp_monitor.get_chat_list()
-            
-            if not chats:
-                self.update_status("未找到任何群聊，请确保微信已登录且有可用的聊天会话")
+        self.refresh_btn.setText("正在刷新...")
+        self.refresh_btn.setEnabled(False)
+        if not interactive:
+            self.startup_pending.add("chat_list")
+        
+        self.chat_list_thread = ChatListThread(self.get_monitor)
+        self.chat_list_thread.result_signal.connect(
+            lambda chats, error: self.handle_chat_list(chats, error, selected_chats or [], interactive))
+        self.chat_list_thread.start()
+    
+    def handle_chat_list(self, chats, error, selected_chats, interactive):
+        """群聊列表加载完成后的处理"""
+        # 恢复按钮状态
+        self.refresh_btn.setText("刷新群聊列表")
+        self.refresh_btn.setEnabled(True)
+        
+        if error is not None:
+            self.update_status(f"获取群聊失败: {error}")
+            if interactive:
+                QMessageBox.critical(self, "错误", f"获取群聊列表失败：\n{error}\n\n请确保：\n1. 微信已正常登录\n2. 微信窗口未被最小化\n3. 微信版本与wxauto兼容")
+        elif not chats:
+            self.update_status("未找到任何群聊，请确保微信已登录且有可用的聊天会话")
+            if interactive:
                 QMessageBox.warning(self, "警告", "未找到任何群聊，请检查微信是否正常登录")
-                return
-            
+        else:
             for chat in chats:
                 item = QListWidgetItem(chat)
                 item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
                 item.setCheckState(Qt.Unchecked)
                 self.chat_list.addItem(item)
-            
+            self.apply_chat_selection(selected_chats)
             self.update_status(f"成功获取到 {len(chats)} 个群聊")
-        except Exception as e:
-            error_msg = str(e)
-            self.update_status(f"获取群聊失败: {error_msg}")
-            QMessageBox.critical(self, "错误", f"获取群聊列表失败：\n{error_msg}\n\n请确保：\n1. 微信已正常登录\n2. 微信窗口未被最小化\n3. 微信版本与wxauto兼容")
-        finally:
-            # 恢复按钮状态
-            if refresh_btn:
-                refresh_btn.setText(old_text)
-                refresh_btn.setEnabled(True)
-            
-            # 恢复鼠标指针
-            QApplication.restoreOverrideCursor()
+        
+        self.finish_startup_step("chat_list")
+    
+    def finish_startup_step(self, step):
+        """标记一个启动步骤已完成，全部完成后发送启动完成信号"""
+        self.startup_pending.discard(step)
+        if not self.startup_pending and not self.is_ready:
+            self.is_ready = True
+            self.ready_signal.emit()
     
     def toggle_monitoring(self):
         """开始或停止监控"""
         if not self.is_monitoring:
+            # 消息日志要先重放到数据库，开始监控时才能清空
+            if "message_store" in self.startup_pending:
+                QMessageBox.warning(self, "警告", "正在打开消息数据库，请稍后再试")
+                return
+            
             # 获取选中的群聊
             selected_chats = []
             for i in range(self.chat_list.count()):
@@ -306,20 +402,34 @@ class WeChatMonitorApp(QMainWindow):
     def start_monitoring(self, chats, duration, api_key, webhook_url=None):
         """启动监控线程"""
         try:
-            self.monitor = WeChatMonitor()
+            monitor = self.get_monitor()
             
-            # 创建总结器
-            self.summarizer = DeepSeekSummarizer(api_key)
+            # 更换了API密钥或尚未创建总结器时创建总结器，否则继续使用原来的总结器，
+            # 新会话的消息合并进上一次的滚动总结
+            if getattr(self, 'summarizer', None) is None or self.summarizer.api_key != api_key:
+                self.summarizer = self.create_summarizer(api_key)
+            else:
+                self.summarizer.start_new_transcript()
             
             # 状态初始化
-            self.chat_records = {chat: [] for chat in chats}
+            # 启用消息数据库时消息只保存在数据库中，内存中只记录消息数
+            self.chat_records = {chat: [] for chat in chats} if self.message_store is None else {}
+            self.message_counts = {chat: 0 for chat in chats}
             self.is_monitoring = True
+            if self.message_store is not None:
+                self.session_id = self.message_store.start_session(chats)
+            self.journal = self.open_journal(chats)
             
             # 获取检测间隔设置
             check_interval = self.interval_spin.value()
             
             # 创建并启动监控线程
-            self.monitor_thread = MonitorThread(self.monitor, chats, duration, check_interval)
+            self.monitor_thread = MonitorThread(monitor, chats, duration, check_interval,
+                                                journal=self.journal, session_id=self.session_id,
+                                                schedule=self.schedule_options(),
+                                                precheck=self.session_precheck,
+                                                listen_chats=self.listen_chats,
+                                                listen_interval=self.listen_interval)
             self.monitor_thread.message_signal.connect(self.handle_new_message)
             self.monitor_thread.complete_signal.connect(lambda: self.handle_monitor_complete(webhook_url))
             self.monitor_thread.status_signal.connect(self.update_status)
@@ -342,8 +452,105 @@ class WeChatMonitorApp(QMainWindow):
             self.is_monitoring = False
             raise Exception(f"启动监控失败: {str(e)}")
     
+    def get_monitor(self):
+        """获取共享的微信监控器
+        
+        刷新群聊列表和监控线程共用同一个监控器，避免每次都重新连接微信，
+        读取游标和去重缓存也在多次监控之间保留。连接失效时监控器会自动重新连接。
+        可以在后台线程中调用。
+        """
+        with self.monitor_lock:
+            if self.monitor is None:
+                self.monitor = WeChatMonitor(backend=self.backend, cache_size=self.dedup_cache_size)
+            else:
+                # 新的缓存大小对之后新建的群聊缓存生效
+                self.monitor.cache_size = self.dedup_cache_size
+            return self.monitor
+    
+    def create_summarizer(self, api_key):
+        """按照当前配置创建总结器"""
+        from chat_summarizer import DeepSeekSummarizer
+        from summary_cache import SummaryCache
+        from rate_limiter import RateLimiter
+        
+        # 总结缓存在多次创建的总结器之间共享，以便累计命中统计
+        if self.summary_cache is None and self.summary_cache_dir:
+            self.summary_cache = SummaryCache(self.summary_cache_dir,
+                                              max_entries=self.summary_cache_max_entries,
+                                              max_age=self.summary_cache_max_age_days * 24 * 3600)
+        
+        # 速率限制器同样在所有总结器之间共享，所有API调用共用同一份配额
+        if self.rate_limiter is None and (self.rate_limit_rpm or self.rate_limit_tpm):
+            self.rate_limiter = RateLimiter(self.rate_limit_rpm, self.rate_limit_tpm)
+        
+        return DeepSeekSummarizer(api_key, chunk_tokens=self.chunk_tokens,
+                                  chunk_overlap=self.chunk_overlap,
+                                  chunk_parallelism=self.chunk_parallelism,
+                                  cache=self.summary_cache,
+                                  rate_limiter=self.rate_limiter,
+                                  compaction=self.compaction_options())
+    
+    def schedule_options(self):
+        """按照当前配置生成群聊检测的调度选项"""
+        return {
+            "min_interval": self.poll_min_interval,
+            "max_interval": self.poll_max_interval,
+            "target_messages": self.poll_target_messages,
+            "budget_per_minute": self.poll_budget_per_minute
+        }
+    
+    def compaction_options(self):
+        """按照当前配置生成聊天记录压缩选项，不压缩时返回None"""
+        if not self.transcript_compaction:
+            return None
+        return {
+            "media": self.compact_media,
+            "merge_runs": self.compact_merge_runs,
+            "alias_senders": self.compact_alias_senders
+        }
+    
+    def open_message_store(self):
+        """在后台线程中打开消息数据库，重放消息日志中尚未保存的消息，并恢复上一次监控会话"""
+        self.message_store_thread = MessageStoreThread(self.message_db, self.message_journal)
+        self.message_store_thread.status_signal.connect(self.update_status)
+        self.message_store_thread.result_signal.connect(self.handle_message_store)
+        self.message_store_thread.start()
+    
+    def handle_message_store(self, message_store, session_id, chat_records, message_counts):
+        """消息数据库打开后的处理"""
+        self.message_store = message_store
+        self.session_id = session_id
+        self.chat_records = chat_records
+        self.message_counts = message_counts
+        self.finish_startup_step("message_store")
+    
+    def open_journal(self, chats):
+        """为新的监控会话创建消息日志"""
+        if not self.message_journal:
+            return None
+        try:
+            journal = MessageJournal(self.message_journal, self.journal_flush_interval, truncate=True)
+            journal.append({"session": self.session_id, "chats": chats, "started": time.time()})
+            journal.sync()
+            return journal
+        except Exception as e:
+            self.update_status(f"创建消息日志失败: {str(e)}")
+            return None
+    
+    def close_journal(self):
+        """关闭消息日志，消息已经全部保存到数据库时清空日志"""
+        if self.journal is None:
+            return
+        self.journal.close()
+        self.journal = None
+        if self.message_store is not None:
+            self.message_store.flush()
+            MessageJournal.clear(self.message_journal)
+    
     def stop_monitoring(self):
-        """停止监控线程"""
+        """停止监控线程，并取消正在进行的总结"""
+        self.cancel_summaries()
+        
         if self.monitor_thread and self.monitor_thread.isRunning():
             self.monitor_thread.stop()
             self.monitor_thread.wait()
@@ -351,16 +558,53 @@ class WeChatMonitorApp(QMainWindow):
         self.is_monitoring = False
         self.update_status("监控已停止")
     
-    def handle_new_message(self, chat_name, sender, content, timestamp):
-        """处理新消息"""
+    def cancel_summaries(self):
+        """取消正在进行的总结，正在等待重试或接收流式输出的请求会立即中止"""
+        if self.summarize_thread and self.summarize_thread.isRunning():
+            self.summarize_thread.stop()
+            self.update_status("正在取消总结...")
+
+    def closeEvent(self, event):
+        """关闭窗口时停止监控和总结"""
+        self.cancel_summaries()
+        if self.monitor_thread and self.monitor_thread.isRunning():
+            self.monitor_thread.stop()
+            self.monitor_thread.wait()
+        if self.summarize_thread and self.summarize_thread.isRunning():
+            self.summarize_thread.wait()
+        if self.chat_list_thread and self.chat_list_thread.isRunning():
+            self.chat_list_thread.wait()
+        if self.message_store_thread is not None:
+            self.message_store_thread.wait()
+            # 数据库打开后窗口就关闭时，结果信号还没有处理
+            if self.message_store is None:
+                self.message_store = self.message_store_thread.message_store
+        self.close_journal()
+        if self.message_store is not None:
+            self.message_store.close()
+        event.accept()
+    
+    def load_chat_messages(self, chat_name):
+        """读取当前监控会话中群聊的消息，启用消息数据库时从数据库读取"""
+        if self.message_store is not None and self.session_id is not None:
+            self.message_store.flush()
+            return self.message_store.get_messages(self.session_id, chat_name)
+        return self.chat_records.get(chat_name, [])
+    
+    def handle_new_message(self, chat_name, sender, content, timestamp, seq=0):
+        """处理新消息，seq为消息在本次监控会话中的序号"""
         try:
             # 添加到记录
-            if chat_name in self.chat_records:
-                self.chat_records[chat_name].append({
-                    "sender": sender,
-                    "content": content,
-                    "timestamp": timestamp
-                })
+            if chat_name in self.message_counts:
+                self.message_counts[chat_name] += 1
+                if self.message_store is not None and self.session_id is not None:
+                    self.message_store.add_message(self.session_id, chat_name, sender, content, timestamp, seq)
+                else:
+                    self.chat_records.setdefault(chat_name, []).append({
+                        "sender": sender,
+                        "content": content,
+                        "timestamp": timestamp
+                    })
             
             # 更新实时消息显示
             time_str = datetime.datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
@@ -395,81 +639,164 @@ class WeChatMonitorApp(QMainWindow):
         """监控完成后的处理"""
         self.is_monitoring = False
         self.start_btn.setText("开始监控")
+        if self.message_store is not None and self.session_id is not None:
+            self.message_store.end_session(self.session_id)
+        self.close_journal()
         
         # 自动生成总结
         self.update_status("监控完成，正在生成总结...")
         
-        empty_chats = []
-        for chat_name, messages in self.chat_records.items():
-            if not messages:
-                empty_chats.append(chat_name)
-                continue
-                
-            try:
-                self.summarize_chat(chat_name, messages, webhook_url)
-            except Exception as e:
-                self.update_status(f"总结群聊 {chat_name} 失败: {str(e)}")
-        
+        empty_chats = [chat_name for chat_name, count in self.message_counts.items() if not count]
         if empty_chats:
             empty_str = ", ".join(empty_chats)
             self.update_status(f"以下群聊没有消息，跳过总结: {empty_str}")
         
-        self.update_status("所有总结完成")
+        self.summarize_all(webhook_url, "所有总结完成")
     
-    def summarize_chat(self, chat_name, messages, webhook_url=None):
-        """总结群聊记录"""
-        # 转换消息格式
-        messages_text = []
-        for msg in messages:
-            time_str = datetime.datetime.fromtimestamp(msg["timestamp"]).strftime("%H:%M:%S")
-            messages_text.append(f"{time_str} {msg['sender']}: {msg['content']}")
-        
-        messages_str = "\n".join(messages_text)
-        
-        # 生成总结，传递AI提示模板
-        summary = self.summarizer.summarize(messages_str, self.ai_prompt)
-        
-        # 生成时间戳和标题
-        now = datetime.datetime.now()
-        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
-        title = f"{chat_name} - {timestamp}"
-        
-        # 保存总结
-        summary_obj = {
-            "title": title,
-            "chat_name": chat_name,
-            "timestamp": timestamp,
-            "summary": summary,
-            "messages": messages
-        }
+    def summarize_all(self, webhook_url=None, complete_message="所有总结完成"):
+        """在后台线程中并发总结所有有消息的群聊，每完成一个群聊就添加到总结列表
         
-        # 添加到总结列表
-        self.add_summary_to_list(summary_obj)
+        Args:
+            webhook_url: 飞书Webhook URL，为None时不发送
+            complete_message: 全部总结完成后显示的状态信息
+        """
+        if self.summarize_thread and self.summarize_thread.isRunning():
+            self.update_status("上一次总结仍在进行中，请稍后再试")
+            return
         
-        # 发送webhook（如果启用）
-        if webhook_url:
-            try:
-                self.send_webhook(webhook_url, chat_name, summary, timestamp)
-                self.update_status(f"已发送总结到Webhook: {chat_name}")
-            except Exception as e:
-                self.update_status(f"发送Webhook失败: {str(e)}")
+        load_messages = None
+        if self.message_store is not None and self.session_id is not None:
+            # 从数据库按群聊读取消息，总结时不需要复制全部记录
+            self.message_store.flush()
+            session_id = self.session_id
+            chat_records = {chat_name: None for chat_name, count in self.message_counts.items() if count}
+            load_messages = lambda chat_name: self.message_store.get_messages(session_id, chat_name)
+        else:
+            # 复制消息列表，避免总结过程中新的监控修改记录
+            chat_records = {chat_name: list(messages) for chat_name, messages in self.chat_records.items() if messages}
+        if not chat_records:
+            self.update_status(complete_message)
+            return
+        
+        self.manual_summary_btn.setText("停止总结")
+        
+        self.summarize_thread = SummarizeThread(self.summarizer, chat_records, self.ai_prompt,
+                                                webhook_url, self.send_webhook, self.summary_concurrency,
+                                                rolling=self.summary_mode == "rolling",
+                                                streaming=self.summary_streaming,
+                                                load_messages=load_messages)
+        self.summarize_thread.summary_signal.connect(self.add_summary_to_list)
+        self.summarize_thread.stream_signal.connect(self.show_streaming_summary)
+        self.summarize_thread.progress_signal.connect(lambda chat_name, message: self.update_status(f"[{chat_name}] {message}"))
+        self.summarize_thread.complete_signal.connect(lambda: self.handle_summarize_complete(complete_message))
+        self.summarize_thread.start()
         
-        self.update_status(f"完成群聊总结: {chat_name}")
+        self.update_status(f"开始总结 {len(chat_records)} 个群聊，并发数: {self.summary_concurrency}")
+    
+    def handle_summarize_complete(self, complete_message):
+        """全部群聊总结完成后的处理"""
+        self.manual_summary_btn.setText("手动总结当前记录")
+        self.streaming_chat = None
+        if self.summarize_thread and self.summarize_thread.cancelled:
+            self.update_status("总结已取消")
+        else:
+            self.update_status(complete_message)
+        
+        if self.summary_cache is not None:
+            stats = self.summary_cache.stats()
+            self.update_status(f"总结缓存: 命中 {stats['hits']} 次，未命中 {stats['misses']} 次，共 {stats['entries']} 条")
+        
+        compaction_report = self.summarizer.compaction_report() if hasattr(self, 'summarizer') else ""
+        if compaction_report:
+            self.update_status(f"聊天记录压缩节省: {compaction_report}")
+        
+        if self.rate_limiter is not None:
+            stats = self.rate_limiter.stats()
+            self.update_status(f"速率限制: 共 {stats['requests']} 次请求，排队 {stats['waited']} 次，"
+                               f"平均等待 {stats['avg_wait']:.1f} 秒，最长等待 {stats['max_wait']:.1f} 秒，"
+                               f"最大队列长度 {stats['max_queue_depth']}")
     
     def add_summary_to_list(self, summary_obj):
         """添加总结到列表"""
+        # 流式显示的群聊已完成，下一个正在生成的群聊可以接着显示
+        if summary_obj["chat_name"] == self.streaming_chat:
+            self.streaming_chat = None
+        
         # 存储总结对象
         if not hasattr(self, 'summaries'):
             self.summaries = []
         
         self.summaries.append(summary_obj)
         
+        # 保存到数据库，以便之后全文搜索，失败的总结只显示错误信息，不保存
+        if self.message_store is not None and summary_obj["success"]:
+            try:
+                self.message_store.add_summary(self.session_id, summary_obj["chat_name"], summary_obj["title"],
+                                               summary_obj["summary"], time.time())
+            except Exception as e:
+                self.update_status(f"保存总结到数据库失败: {str(e)}")
+        
         # 添加到UI列表
         self.summary_list.addItem(summary_obj["title"])
         
         # 选中新添加的项
         self.summary_list.setCurrentRow(self.summary_list.count() - 1)
     
+    def search_history(self):
+        """在消息数据库中全文搜索历史消息和总结"""
+        query = self.search_input.text().strip()
+        if not query:
+            return
+        
+        if self.message_store is None:
+            QMessageBox.warning(self, "警告", "没有启用消息数据库，无法搜索历史消息")
+            return
+        
+        import html
+        
+        start_time = time.perf_counter()
+        # 先写入尚在队列中的消息，保证刚收到的消息也能搜到
+        self.message_store.flush()
+        messages = self.message_store.search_messages(query, limit=self.search_limit)
+        summaries = []
+        if self.search_summaries_check.isChecked():
+            summaries = self.message_store.search_summaries(query, limit=self.search_limit)
+        elapsed = (time.perf_counter() - start_time) * 1000
+        
+        # 高亮关键词
+        keywords = [html.escape(keyword) for keyword in query.split()]
+        highlight_pattern = re.compile("|".join(re.escape(keyword) for keyword in keywords), re.IGNORECASE)
+        
+        def highlight(text):
+            return highlight_pattern.sub(lambda m: f'<span style="background-color: #fff3a0;">{m.group(0)}</span>',
+                                         html.escape(text))
+        
+        found = f"找到 {len(messages)} 条消息"
+        if self.search_summaries_check.isChecked():
+            found += f"、{len(summaries)} 条总结"
+        parts = [f"<p style='color: #7f8c8d;'>{found}，用时 {elapsed:.1f} 毫秒（每类最多显示 {self.search_limit} 条）</p>"]
+        for summary in summaries:
+            time_str = datetime.datetime.fromtimestamp(summary["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+            parts.append(f"""
+            <div style="margin: 5px 0; padding: 5px; border-left: 3px solid #27ae60;">
+                <b style="color: #27ae60;">[总结] {html.escape(summary['chat_name'])}</b>
+                <span style="color: #7f8c8d; font-size: 0.9em;">({time_str})</span><br/>
+                <span style="margin-left: 10px;">{highlight(summary['summary'])}</span>
+            </div>
+            """)
+        for msg in messages:
+            time_str = datetime.datetime.fromtimestamp(msg["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+            parts.append(f"""
+            <div style="margin: 5px 0; padding: 5px; border-left: 3px solid #4a7ebb;">
+                <b style="color: #2c3e50;">[{html.escape(msg['chat_name'])}]</b>
+                <span style="color: #3498db; font-weight: bold;">{highlight(msg['sender'])}</span>
+                <span style="color: #7f8c8d; font-size: 0.9em;">({time_str})</span><br/>
+                <span style="margin-left: 10px;">{highlight(msg['content'])}</span>
+            </div>
+            """)
+        
+        self.search_results.setHtml("".join(parts))
+    
     def _format_summary_content(self, content):
         """格式化总结内容，增强可读性"""
         if not content:
@@ -532,82 +859,104 @@ class WeChatMonitorApp(QMainWindow):
         """显示选中的总结内容"""
         if row >= 0 and hasattr(self, 'summaries') and row < len(self.summaries):
             summary = self.summaries[row]
-            
-            # 修改HTML内容格式，使用更现代美观的样式
-            html_content = f"""
-            <html>
-            <head>
-            <style>
-                body {{
-                    font-family: 'Microsoft YaHei', Arial, sans-serif;
-                    line-height: 1.6;
-                    margin: 0;
-                    padding: 15px;
-                    background-color: #f9f9f9;
-                    color: #333;
-                }}
-                .summary-container {{
-                    background-color: white;
-                    border-radius: 8px;
-                    box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                    padding: 20px;
-                }}
-                .chat-title {{
-                    color: #2c3e50;
-                    border-bottom: 2px solid #3498db;
-                    padding-bottom: 10px;
-                    margin-bottom: 15px;
-                    font-size: 18px;
-                }}
-                .timestamp {{
-                    color: #7f8c8d;
-                    font-size: 14px;
-                    margin-bottom: 15px;
-                }}
-                .summary-title {{
-                    background-color: #f0f7ff;
-                    padding: 8px 15px;
-                    border-left: 4px solid #3498db;
-                    margin: 15px 0;
-                    font-weight: bold;
-                    font-size: 16px;
-                }}
-                .summary-content {{
-                    padding: 10px;
-                    line-height: 1.8;
-                    white-space: pre-line;
-                    text-align: justify;
-                }}
-                .summary-point {{
-                    margin: 10px 0;
-                    padding-left: 20px;
-                    position: relative;
-                }}
-                .summary-point:before {{
-                    content: "•";
-                    position: absolute;
-                    left: 0;
-                    color: #3498db;
-                    font-weight: bold;
-                }}
-            </style>
-            </head>
-            <body>
-            <div class="summary-container">
-                <div class="chat-title">{summary['chat_name']}</div>
-                <div class="timestamp">时间: {summary['timestamp']}</div>
-                <div class="summary-title">会话总结</div>
-                <div class="summary-content">{self._format_summary_content(summary['summary'])}</div>
-            </div>
-            </body>
-            </html>
-            """
-            
-            self.summary_content.setHtml(html_content)
+            self.summary_content.setHtml(self._render_summary_html(summary['chat_name'], summary['timestamp'], summary['summary']))
+    
+    def show_streaming_summary(self, chat_name, partial_text):
+        """在总结内容中逐步显示正在生成的总结
+        
+        多个群聊同时生成时，只跟随最先开始输出的群聊，直到该群聊的总结完成。
+        """
+        if self.streaming_chat is None:
+            self.streaming_chat = chat_name
+        if chat_name != self.streaming_chat:
+            return
+        
+        self.summary_content.setHtml(self._render_summary_html(chat_name, "正在生成...", partial_text))
+        # 保持显示最新生成的内容
+        scroll_bar = self.summary_content.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
+    
+    def _render_summary_html(self, chat_name, timestamp, summary_text):
+        """生成总结内容的HTML"""
+        # 修改HTML内容格式，使用更现代美观的样式
+        html_content = f"""
+        <html>
+        <head>
+        <style>
+            body {{
+                font-family: 'Microsoft YaHei', Arial, sans-serif;
+                line-height: 1.6;
+                margin: 0;
+                padding: 15px;
+                background-color: #f9f9f9;
+                color: #333;
+            }}
+            .summary-container {{
+                background-color: white;
+                border-radius: 8px;
+                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+                padding: 20px;
+            }}
+            .chat-title {{
+                color: #2c3e50;
+                border-bottom: 2px solid #3498db;
+                padding-bottom: 10px;
+                margin-bottom: 15px;
+                font-size: 18px;
+            }}
+            .timestamp {{
+                color: #7f8c8d;
+                font-size: 14px;
+                margin-bottom: 15px;
+            }}
+            .summary-title {{
+                background-color: #f0f7ff;
+                padding: 8px 15px;
+                border-left: 4px solid #3498db;
+                margin: 15px 0;
+                font-weight: bold;
+                font-size: 16px;
+            }}
+            .summary-content {{
+                padding: 10px;
+                line-height: 1.8;
+                white-space: pre-line;
+                text-align: justify;
+            }}
+            .summary-point {{
+                margin: 10px 0;
+                padding-left: 20px;
+                position: relative;
+            }}
+            .summary-point:before {{
+                content: "•";
+                position: absolute;
+                left: 0;
+                color: #3498db;
+                font-weight: bold;
+            }}
+        </style>
+        </head>
+        <body>
+        <div class="summary-container">
+            <div class="chat-title">{chat_name}</div>
+            <div class="timestamp">时间: {timestamp}</div>
+            <div class="summary-title">会话总结</div>
+            <div class="summary-content">{self._format_summary_content(summary_text)}</div>
+        </div>
+        </body>
+        </html>
+        """
+        
+        return html_content
     
     def manual_summarize(self):
-        """手动总结当前记录"""
-        if not self.chat_records:
+        """手动总结当前记录，总结进行中时取消总结"""
+        if self.summarize_thread and self.summarize_thread.isRunning():
+            self.cancel_summaries()
+            return
+        
+        if not self.message_counts:
             QMessageBox.warning(self, "警告", "没有可用的聊天记录进行总结")
             return
         
@@ -618,19 +967,14 @@ class WeChatMonitorApp(QMainWindow):
         
         webhook_url = self.webhook_input.text() if self.webhook_enabled.isChecked() else None
         
+        # 更换了API密钥或尚未创建总结器时，重新创建
+        if not hasattr(self, 'summarizer') or self.summarizer.api_key != api_key:
+            self.summarizer = self.create_summarizer(api_key)
+        
         self.update_status("正在生成手动总结...")
         
         # 为每个有消息的群聊生成总结
-        for chat_name, messages in self.chat_records.items():
-            if not messages:
-                continue
-                
-            try:
-                self.summarize_chat(chat_name, messages, webhook_url)
-            except Exception as e:
-                self.update_status(f"总结群聊 {chat_name} 失败: {str(e)}")
-        
-        self.update_status("手动总结完成")
+        self.summarize_all(webhook_url, "手动总结完成")
     
     def export_summary(self):
         """导出总结"""
@@ -1106,7 +1450,7 @@ class WeChatMonitorApp(QMainWindow):
             formatted_summary = self._format_summary_content(summary['summary'])
             
             # 查找对应的聊天记录，生成图表和词云
-            messages = self.chat_records.get(summary['chat_name'], [])
+            messages = self.load_chat_messages(summary['chat_name'])
             chart_html = self._generate_message_chart(messages)
             cloud_html = self._generate_word_cloud(messages)
             
@@ -1166,48 +1510,8 @@ class WeChatMonitorApp(QMainWindow):
     
     def send_webhook(self, webhook_url, chat_name, summary, timestamp):
         """发送飞书Webhook"""
-        # 飞书消息卡片格式
-        post_data = {
-            "msg_type": "interactive",
-            "card": {
-                "config": {
-                    "wide_screen_mode": True
-                },
-                "header": {
-                    "title": {
-                        "tag": "plain_text",
-                        "content": f"微信群聊总结 - {chat_name}"
-                    },
-                    "template": "blue"
-                },
-                "elements": [
-                    {
-                        "tag": "div",
-                        "text": {
-                            "tag": "lark_md",
-                            "content": f"**时间**: {timestamp}"
-                        }
-                    },
-                    {
-                        "tag": "div",
-                        "text": {
-                            "tag": "lark_md",
-                            "content": summary  # 飞书支持markdown，星号会自动转为加粗
-                        }
-                    }
-                ]
-            }
-        }
-        
-        # 发送请求
-        response = requests.post(
-            webhook_url,
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(post_data)
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"Webhook请求失败: {response.status_code}, {response.text}")
+        from monitor_service import send_feishu_webhook
+        send_feishu_webhook(webhook_url, chat_name, summary, timestamp)
     
     def update_status(self, message):
         """更新状态栏信息"""
@@ -1237,7 +1541,35 @@ class WeChatMonitorApp(QMainWindow):
             "webhook_url": self.webhook_input.text(),
             "webhook_enabled": self.webhook_enabled.isChecked(),
             "selected_chats": selected_chats,
-            "ai_prompt": self.ai_prompt  # 保存AI提示模板
+            "ai_prompt": self.ai_prompt,  # 保存AI提示模板
+            "dedup_cache_size": self.dedup_cache_size,
+            "summary_concurrency": self.summary_concurrency,
+            "http_pool_size": self.http_pool_size,
+            "http_timeout": self.http_timeout,
+            "chunk_tokens": self.chunk_tokens,
+            "chunk_overlap": self.chunk_overlap,
+            "chunk_parallelism": self.chunk_parallelism,
+            "summary_cache_dir": self.summary_cache_dir,
+            "summary_cache_max_entries": self.summary_cache_max_entries,
+            "summary_cache_max_age_days": self.summary_cache_max_age_days,
+            "summary_mode": self.summary_mode,
+            "summary_streaming": self.summary_streaming,
+            "rate_limit_rpm": self.rate_limit_rpm,
+            "rate_limit_tpm": self.rate_limit_tpm,
+            "transcript_compaction": self.transcript_compaction,
+            "compact_media": self.compact_media,
+            "compact_merge_runs": self.compact_merge_runs,
+            "compact_alias_senders": self.compact_alias_senders,
+            "message_db": self.message_db,
+            "message_journal": self.message_journal,
+            "journal_flush_interval": self.journal_flush_interval,
+            "poll_min_interval": self.poll_min_interval,
+            "poll_max_interval": self.poll_max_interval,
+            "poll_target_messages": self.poll_target_messages,
+            "poll_budget_per_minute": self.poll_budget_per_minute,
+            "session_precheck": self.session_precheck,
+            "listen_chats": self.listen_chats,
+            "listen_interval": self.listen_interval
         }
         
         # 保存到文件
@@ -1269,11 +1601,38 @@ class WeChatMonitorApp(QMainWindow):
             if "ai_prompt" in config:
                 self.ai_prompt = config["ai_prompt"]
             
-            # 重新加载群聊列表，然后应用选中状态
-            self.refresh_chat_list()
+            self.dedup_cache_size = config.get("dedup_cache_size", 200)
+            self.summary_concurrency = config.get("summary_concurrency", 4)
+            self.http_pool_size = config.get("http_pool_size", 16)
+            self.http_timeout = config.get("http_timeout", 30)
+            http_client.configure(pool_maxsize=self.http_pool_size, timeout=self.http_timeout)
+            self.chunk_tokens = config.get("chunk_tokens", 6000)
+            self.chunk_overlap = config.get("chunk_overlap", 200)
+            self.chunk_parallelism = config.get("chunk_parallelism", 4)
+            self.summary_cache_dir = config.get("summary_cache_dir", "summary_cache")
+            self.summary_cache_max_entries = config.get("summary_cache_max_entries", 500)
+            self.summary_cache_max_age_days = config.get("summary_cache_max_age_days", 7)
+            self.summary_mode = config.get("summary_mode", "full")
+            self.summary_streaming = config.get("summary_streaming", True)
+            self.rate_limit_rpm = config.get("rate_limit_rpm", 60)
+            self.rate_limit_tpm = config.get("rate_limit_tpm", 0)
+            self.transcript_compaction = config.get("transcript_compaction", True)
+            self.compact_media = config.get("compact_media", "collapse")
+            self.compact_merge_runs = config.get("compact_merge_runs", True)
+            self.compact_alias_senders = config.get("compact_alias_senders", True)
+            self.message_db = config.get("message_db", "messages.db")
+            self.message_journal = config.get("message_journal", "messages.journal")
+            self.journal_flush_interval = config.get("journal_flush_interval", 1.0)
+            self.poll_min_interval = config.get("poll_min_interval", 2)
+            self.poll_max_interval = config.get("poll_max_interval", 120)
+            self.poll_target_messages = config.get("poll_target_messages", 10)
+            self.poll_budget_per_minute = config.get("poll_budget_per_minute", 0)
+            self.session_precheck = config.get("session_precheck", True)
+            self.listen_chats = config.get("listen_chats", [])
+            self.listen_interval = config.get("listen_interval", 1.0)
             
-            # 延迟应用选中状态，确保群聊列表已加载
-            QTimer.singleShot(1000, lambda: self.apply_chat_selection(config.get("selected_chats", [])))
+            # 在后台重新加载群聊列表，加载完成后应用选中状态
+            self.refresh_chat_list(config.get("selected_chats", []), interactive=False)
             
             self.update_status("配置已加载")
         except Exception as e:
@@ -1336,130 +1695,161 @@ class WeChatMonitorApp(QMainWindow):
         self.update_status("已重置为默认AI提示模板")
 
 
-class MonitorThread(QThread):
-    message_signal = pyqtSignal(str, str, str, float)  # 群聊名称, 发送者, 内容, 时间戳
-    status_signal = pyqtSignal(str)  # 状态信息
-    complete_signal = pyqtSignal()  # 监控完成信号
+class ChatListThread(QThread):
+    result_signal = pyqtSignal(object, object)  # 群聊列表, 错误信息
     
-    def __init__(self, monitor, chats, duration, check_interval=10):
+    def __init__(self, get_monitor):
+        """初始化群聊列表线程
+        
+        Args:
+            get_monitor: 获取微信监控器的函数，在后台线程中调用
+        """
         super().__init__()
-        self.monitor = monitor
-        self.chats = chats
-        self.duration = duration
-        self.running = True
-        # 使用传入的检测间隔
-        self.check_interval = check_interval  # 检测间隔，单位秒
-        # 调试模式
-        self.debug_mode = True
-    
-    def log(self, message):
-        """输出调试日志"""
-        if self.debug_mode:
-            print(f"[监控线程] {message}")
-            self.status_signal.emit(f"调试: {message}")
+        self.get_monitor = get_monitor
     
     def run(self):
         """线程主函数"""
-        start_time = time.time()
-        end_time = start_time + self.duration
+        from chat_monitor import ui_thread_scope
+        # 在后台线程中使用wxauto需要先初始化COM
+        with ui_thread_scope():
+            try:
+                chats = self.get_monitor().get_chat_list()
+                self.result_signal.emit(chats, None)
+            except Exception as e:
+                self.result_signal.emit(None, str(e))
+
+
+class MessageStoreThread(QThread):
+    status_signal = pyqtSignal(str)  # 状态信息
+    result_signal = pyqtSignal(object, object, object, object)  # 消息数据库, 会话ID, 聊天记录, 消息数
+    
+    def __init__(self, message_db, message_journal):
+        """初始化消息数据库线程
         
-        self.status_signal.emit(f"开始监控 {len(self.chats)} 个群聊，预计结束时间: {datetime.datetime.fromtimestamp(end_time).strftime('%H:%M:%S')}")
-        self.log(f"监控线程启动，检测间隔: {self.check_interval}秒")
+        Args:
+            message_db: 消息数据库文件，为空时不保存消息
+            message_journal: 消息日志文件，为空时不记录
+        """
+        super().__init__()
+        self.message_db = message_db
+        self.message_journal = message_journal
+        self.message_store = None
+    
+    def run(self):
+        """线程主函数"""
+        from monitor_service import chat_records_from_journal, replay_journal_into_store
         
-        last_check_time = {chat: 0 for chat in self.chats}
-        chat_error_count = {chat: 0 for chat in self.chats}  # 记录每个群聊的错误次数
-        max_error_count = 3  # 最大错误次数
+        session_id = None
+        chat_records = {}
+        message_counts = {}
         
-        # 当前轮询的聊天索引
-        current_chat_index = 0
+        records = []
+        if self.message_journal:
+            try:
+                records = MessageJournal.replay(self.message_journal)
+            except Exception as e:
+                self.status_signal.emit(f"读取消息日志失败: {str(e)}")
         
-        try:
-            while self.running and time.time() < end_time:
-                # 计算剩余时间
-                remaining = int(end_time - time.time())
-                if remaining % 60 == 0 and remaining > 0:  # 每分钟更新一次状态
-                    minutes = remaining // 60
-                    self.status_signal.emit(f"监控中，剩余时间: {minutes} 分钟")
-                
-                # 检查当前群聊索引
-                if current_chat_index >= len(self.chats):
-                    current_chat_index = 0  # 重置索引，开始新一轮检查
-                    self.log("完成一轮群聊检查，开始新一轮")
-                
-                # 获取当前要检查的群聊
-                if current_chat_index < len(self.chats):
-                    chat_name = self.chats[current_chat_index]
-                    
-                    # 检查是否需要跳过此群聊
-                    if chat_error_count[chat_name] >= max_error_count:
-                        if chat_error_count[chat_name] == max_error_count:  # 只在第一次超过时通知
-                            self.status_signal.emit(f"暂时跳过群聊 {chat_name}，连续错误次数过多")
-                            chat_error_count[chat_name] += 1  # 增加计数但不再发送通知
-                        current_chat_index += 1  # 移到下一个群聊
-                        continue
-                        
-                    try:
-                        # 切换到当前群聊
-                        self.status_signal.emit(f"正在检查群聊: {chat_name}...")
-                        self.monitor.switch_to_chat(chat_name)
-                        
-                        # 读取新消息
-                        self.log(f"开始获取 {chat_name} 的新消息...")
-                        messages = self.monitor.get_new_messages()  # 不再使用last_check过滤，依赖缓存机制
-                        
-                        if messages:
-                            self.log(f"获取到 {len(messages)} 条新消息")
-                            for msg in messages:
-                                self.message_signal.emit(chat_name, msg["sender"], msg["content"], msg["timestamp"])
-                            self.status_signal.emit(f"已读取 {chat_name} 的 {len(messages)} 条新消息")
-                        else:
-                            self.log(f"群聊 {chat_name} 没有新消息")
-                            self.status_signal.emit(f"群聊 {chat_name} 没有新消息")
-                        
-                        # 更新最后检查时间
-                        last_check_time[chat_name] = time.time()
-                        
-                        # 成功读取后重置错误计数
-                        chat_error_count[chat_name] = 0
-                    except Exception as e:
-                        error_msg = str(e)
-                        self.log(f"监控 {chat_name} 出错: {error_msg}")
-                        # 增加错误计数
-                        chat_error_count[chat_name] += 1
-                        
-                        # 根据错误次数显示不同级别的警告
-                        if chat_error_count[chat_name] == 1:
-                            self.status_signal.emit(f"监控群聊 {chat_name} 时出错: {error_msg}")
-                        elif chat_error_count[chat_name] == 2:
-                            self.status_signal.emit(f"再次尝试监控群聊 {chat_name} 失败: {error_msg}")
-                        elif chat_error_count[chat_name] == max_error_count:
-                            self.status_signal.emit(f"群聊 {chat_name} 多次访问失败，可能是名称不匹配或其他问题，将暂时跳过该群聊")
-                    
-                    # 移动到下一个群聊
-                    current_chat_index += 1
-                
-                # 休眠指定的检测间隔时间
-                self.log(f"休眠 {self.check_interval} 秒...")
-                time.sleep(self.check_interval)
-            
-            # 监控完成
-            if time.time() >= end_time:
-                self.status_signal.emit("监控时间已到，正在停止监控...")
-            else:
-                self.status_signal.emit("监控已手动停止")
-                
-            self.complete_signal.emit()
+        if self.message_db:
+            try:
+                self.message_store = MessageStore(self.message_db)
+            except Exception as e:
+                self.message_store = None
+                self.status_signal.emit(f"打开消息数据库失败: {str(e)}")
+        
+        if self.message_store is None:
+            # 没有数据库时直接从消息日志恢复最后一次会话
+            if records:
+                chat_records = chat_records_from_journal(records)
+                message_counts = {chat: len(messages) for chat, messages in chat_records.items()}
+                self.status_signal.emit(f"已从消息日志恢复上一次监控会话，共 {sum(message_counts.values())} 条消息")
+        else:
+            try:
+                if records:
+                    recovered = replay_journal_into_store(records, self.message_store, self.message_journal)
+                    self.status_signal.emit(f"已重放消息日志中的 {recovered} 条消息")
                 
-        except Exception as e:
-            error_msg = str(e)
-            self.log(f"监控线程发生错误: {error_msg}")
-            self.status_signal.emit(f"监控线程发生错误: {error_msg}")
-            self.running = False
+                # 只读取每个群聊的消息数，消息在总结和导出时再从数据库读取
+                session = self.message_store.latest_session()
+                if session is not None:
+                    session_id = session["id"]
+                    message_counts = self.message_store.load_chat_counts(session_id)
+                    started = datetime.datetime.fromtimestamp(session["started"]).strftime("%Y-%m-%d %H:%M:%S")
+                    self.status_signal.emit(f"已恢复 {started} 开始的监控会话，共 {sum(message_counts.values())} 条消息")
+            except Exception as e:
+                self.status_signal.emit(f"恢复监控会话失败: {str(e)}")
+        
+        self.result_signal.emit(self.message_store, session_id, chat_records, message_counts)
+
+
+class MonitorThread(QThread):
+    message_signal = pyqtSignal(str, str, str, float, int)  # 群聊名称, 发送者, 内容, 时间戳, 序号
+    status_signal = pyqtSignal(str)  # 状态信息
+    complete_signal = pyqtSignal()  # 监控完成信号
+    
+    def __init__(self, monitor, chats, duration, check_interval=10, journal=None, session_id=None, schedule=None,
+                 precheck=True, listen_chats=None, listen_interval=1.0):
+        super().__init__()
+        from monitor_service import MonitorLoop
+        # 监控循环在monitor_service中实现，这里只把回调转换为Qt信号
+        self.worker = MonitorLoop(monitor, chats, duration, check_interval, journal, session_id,
+                                  on_message=self.message_signal.emit,
+                                  on_status=self.status_signal.emit,
+                                  schedule=schedule,
+                                  precheck=precheck,
+                                  listen_chats=listen_chats,
+                                  listen_interval=listen_interval)
+    
+    @property
+    def debug_mode(self):
+        return self.worker.debug_mode
+    
+    @debug_mode.setter
+    def debug_mode(self, value):
+        self.worker.debug_mode = value
+    
+    def run(self):
+        """线程主函数"""
+        from chat_monitor import ui_thread_scope
+        # 在后台线程中使用wxauto需要先初始化COM
+        with ui_thread_scope():
+            if self.worker.run():
+                self.complete_signal.emit()
     
     def stop(self):
         """停止监控线程"""
-        self.running = False
-        self.log("正在停止监控线程...")
+        self.worker.stop()
+
+
+class SummarizeThread(QThread):
+    summary_signal = pyqtSignal(object)  # 总结对象
+    progress_signal = pyqtSignal(str, str)  # 群聊名称, 进度信息
+    stream_signal = pyqtSignal(str, str)  # 群聊名称, 已生成的总结内容
+    complete_signal = pyqtSignal()  # 全部总结完成信号
+    
+    def __init__(self, summarizer, chat_records, ai_prompt, webhook_url=None, send_webhook=None, max_workers=4,
+                 rolling=False, streaming=False, load_messages=None):
+        """初始化总结线程，参数与SummaryPipeline相同"""
+        super().__init__()
+        from monitor_service import SummaryPipeline
+        self.worker = SummaryPipeline(summarizer, chat_records, ai_prompt, webhook_url, send_webhook, max_workers,
+                                      rolling, streaming, load_messages,
+                                      on_summary=self.summary_signal.emit,
+                                      on_progress=self.progress_signal.emit,
+                                      on_stream=self.stream_signal.emit)
+    
+    @property
+    def cancelled(self):
+        return self.worker.cancelled
+    
+    def run(self):
+        """线程主函数，在一个事件循环中并发总结各个群聊"""
+        self.worker.run()
+        self.complete_signal.emit()
+    
+    def stop(self):
+        """取消尚未完成的总结，可以在其他线程中调用"""
+        self.worker.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,48 @@
+"""命令行全文搜索历史消息和总结
+
+示例：
+    python wx_search.py 空投 合约
+    python wx_search.py 0xdead --chat "某某群" --days 7 --summaries
+"""
+import time
+import argparse
+import datetime
+
+from message_store import MessageStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在消息数据库中全文搜索历史消息和总结")
+    parser.add_argument("query", nargs="+", help="关键词，多个关键词都必须出现")
+    parser.add_argument("--db", default="messages.db", help="消息数据库文件")
+    parser.add_argument("--chat", help="只搜索指定的群聊")
+    parser.add_argument("--days", type=float, help="只搜索最近若干天的内容")
+    parser.add_argument("--limit", type=int, default=50, help="最多显示的结果数")
+    parser.add_argument("--summaries", action="store_true", help="搜索总结而不是消息")
+    args = parser.parse_args()
+
+    query = " ".join(args.query)
+    start = time.time() - args.days * 86400 if args.days else None
+
+    store = MessageStore(args.db)
+    try:
+        start_time = time.perf_counter()
+        if args.summaries:
+            results = store.search_summaries(query, args.chat, start, limit=args.limit)
+        else:
+            results = store.search_messages(query, args.chat, start, limit=args.limit)
+        elapsed = (time.perf_counter() - start_time) * 1000
+
+        for item in results:
+            time_str = datetime.datetime.fromtimestamp(item["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+            if args.summaries:
+                print(f"{time_str} [{item['chat_name']}] {item['title']}\n{item['summary']}\n")
+            else:
+                print(f"{time_str} [{item['chat_name']}] {item['sender']}: {item['content']}")
+        print(f"共 {len(results)} 条结果，用时 {elapsed:.1f} 毫秒")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()